@@ -0,0 +1,245 @@
+"""End-to-end benchmark: synthetic WhatsApp webhooks through whatsapp_handler.handle, offline.
+
+Bedrock (chat, embeddings, transcription), Translate, Elasticsearch and the
+Graph API are replaced by local fakes with injected latency (benchmarks/fakes.py
+and tests/mock_graph_api.py), so only this repository's code runs for real.
+
+    python benchmarks/bench_e2e.py --messages 200 --concurrency 8
+    python benchmarks/bench_e2e.py --latency chat=0.8,translate=0.1 --out results/baseline.json
+    python benchmarks/bench_e2e.py --voice-share 0.5 --no-response-cache
+    python benchmarks/bench_e2e.py --understanding single
+
+Payloads are text and voice messages in English, Chinese, Malay and Tamil from
+`--senders` users. Each graph node, each fake service and the whole webhook are
+timed; the report has throughput and p50/p95/p99 per stage, and --out saves
+it as JSON for comparing runs.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_module'))
+sys.path.insert(0, ROOT)
+
+#Questions per language, sent as text messages or as the transcript of a voice note
+MESSAGES = {
+    "en": ["How do I apply for ComCare?", "Where is the nearest food bank?",
+           "Where can I find a doctor for dementia care?", "Can I get CDC vouchers this year?"],
+    "zh": ["如何申请社区关怀计划？", "最近的食品银行在哪里？", "哪里可以找到治疗痴呆症的医生？", "我可以申请医疗费用的经济援助吗？"],
+    "ms": ["Bagaimana cara memohon ComCare?", "Di manakah bank makanan yang terdekat?",
+           "Di mana saya boleh mencari doktor untuk penjagaan demensia?", "Adakah saya layak untuk baucar CDC?"],
+    "ta": ["கோம்கேர் விண்ணப்பிக்க எப்படி?", "அருகிலுள்ள உணவு வங்கி எங்கே?",
+           "மனதளவு பராமரிப்புக்கான மருத்துவரை எங்கே கண்டுபிடிப்பது?", "சிடிசி பற்றுச்சீட்டுகளை எப்படி பெறுவது?"],
+}
+
+CORPUS = [
+    "ComCare Short-to-Medium-Term Assistance provides monthly cash and help with household bills.",
+    "CDC Vouchers can be used at participating heartland merchants and supermarkets.",
+    "Food banks in Singapore distribute groceries and cooked meals to low-income families.",
+    "The Silver Support Scheme gives quarterly payouts to seniors with low lifetime wages.",
+    "CHAS clinics offer subsidised medical and dental care to eligible Singaporeans.",
+    "Dementia-friendly communities help seniors with dementia get care close to home.",
+]
+
+DEFAULT_LATENCY = {"chat": 0.6, "embed": 0.05, "translate": 0.08, "es": 0.03, "graph": 0.08, "transcribe": 0.9}
+
+
+class Recorder:
+    """Thread-safe millisecond samples per stage"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, ms):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(ms)
+
+    def summary(self):
+        stages = {}
+        for stage, samples in sorted(self.samples.items()):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            stages[stage] = {"count": len(samples), "mean_ms": float(np.mean(samples)),
+                             "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+        return stages
+
+
+def parse_latency(spec):
+    latency = dict(DEFAULT_LATENCY)
+    for item in filter(None, (spec or "").split(",")):
+        name, value = item.split("=")
+        if name not in latency:
+            raise SystemExit(f"Unknown latency {name}, expected one of {', '.join(latency)}")
+        latency[name] = float(value)
+    return latency
+
+
+def configure_environment(es_url, response_cache):
+    os.environ.update({
+        "ASYNC_PROCESSING": "false",
+        "HISTORY_BACKEND": "memory",
+        "DEDUP_BACKEND": "memory",
+        "RESPONSE_CACHE_BACKEND": "memory" if response_cache else "none",
+        "RETRIEVAL_BACKEND": "elasticsearch",
+        "ELASTIC_URL": es_url,
+        "ELASTIC_API_KEY": "bench",
+        "FINANCE_KB_INDEX": "finance",
+        "FOOD_KB_INDEX": "food",
+        "HEALTHCARE_KB_INDEX": "healthcare",
+        "WHATSAPP_TOKEN": "bench",
+        "PHONE_NUMBER_ID": "100000000000000",
+    })
+
+
+def timed(stage, function, recorder):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            recorder(stage, (time.perf_counter() - start) * 1000)
+    wrapper.__name__ = function.__name__
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def instrument_graph(recorder, understanding="pipeline"):
+    """Time every graph node and pick the understanding mode; must run before the graph is compiled"""
+    import multiagent_handler
+    multiagent_handler.understanding_mode = understanding
+    for name in dir(multiagent_handler):
+        if name.endswith("_node"):
+            #Unwrap nodes timed by an earlier run in the same process
+            node = getattr(multiagent_handler, name)
+            setattr(multiagent_handler, name, timed(f"node.{name[:-len('_node')]}", getattr(node, "__wrapped__", node), recorder))
+
+
+def make_payloads(count, senders, voice_share, seed=0, prefix="bench"):
+    """Return (webhook events, Graph API media by id, transcript by audio bytes)"""
+    rng = random.Random(seed)
+    phones = [f"659{index:07d}" for index in range(senders)]
+    payloads, media, transcripts = [], {}, {}
+    for index in range(count):
+        language = rng.choice(list(MESSAGES))
+        text = rng.choice(MESSAGES[language])
+        message = {"from": rng.choice(phones), "id": f"wamid.{prefix}{index}", "timestamp": str(int(time.time()))}
+        if rng.random() < voice_share:
+            media_id = f"{prefix}-media{index}"
+            audio = b"OggS" + index.to_bytes(4, "little") + bytes(rng.randrange(256) for _ in range(2048))
+            media[media_id] = {"data": audio, "mime_type": "audio/ogg; codecs=opus"}
+            transcripts[audio] = text
+            message.update({"type": "audio", "audio": {"id": media_id, "mime_type": "audio/ogg; codecs=opus"}})
+        else:
+            message.update({"type": "text", "text": {"body": text}})
+        body = {"object": "whatsapp_business_account",
+                "entry": [{"id": "1", "changes": [{"field": "messages", "value": {"messaging_product": "whatsapp", "messages": [message]}}]}]}
+        payloads.append({"httpMethod": "POST", "body": json.dumps(body, ensure_ascii=False)})
+    return payloads, media, transcripts
+
+
+def run(args):
+    from benchmarks.fakes import FakeBedrockRuntime, FakeChat, FakeElasticsearch, FakeEmbeddings, FakeTranslate
+    from tests.mock_graph_api import MockGraphAPI
+
+    latency = parse_latency(args.latency)
+    jitter = args.jitter
+    recorder = Recorder()
+    payloads, media, transcripts = make_payloads(args.messages, args.senders, args.voice_share, seed=args.seed)
+    corpus = {index: CORPUS for index in ("finance", "food", "healthcare")}
+
+    with FakeElasticsearch(corpus, latency["es"], jitter * latency["es"], recorder) as es, \
+            MockGraphAPI(media=media, latency=latency["graph"]) as graph_api:
+        configure_environment(es.url, not args.no_response_cache)
+        from components import components
+        from whatsapp_client import WhatsAppClient
+        import tracing
+        import whatsapp_handler
+        #Traces are still recorded, so their cost is measured, but not printed
+        tracing.tracer.sink = lambda line: None
+        #The handler sets the root logger to INFO, which would dominate the timings
+        logging.getLogger().setLevel(args.log_level)
+
+        components.set("bedrock_chat", FakeChat(latency["chat"], jitter * latency["chat"], recorder))
+        components.set("bedrock_embeddings", FakeEmbeddings(latency=latency["embed"], jitter=jitter * latency["embed"], recorder=recorder))
+        components.set("bedrock_runtime", FakeBedrockRuntime(transcripts, latency["transcribe"], jitter * latency["transcribe"], recorder))
+        components.set("translate_runtime", FakeTranslate(latency["translate"], jitter * latency["translate"], recorder))
+        whatsapp_client = WhatsAppClient(base_url=graph_api.url, token="bench", backoff=0.01)
+        for method in ("send_text", "get_media", "download"):
+            setattr(whatsapp_client, method, timed(f"graph_api.{method}", getattr(whatsapp_client, method), recorder))
+        components.set("whatsapp_client", whatsapp_client)
+        instrument_graph(recorder, args.understanding)
+
+        def handle(event):
+            start = time.perf_counter()
+            response = whatsapp_handler.handle(event, None)
+            recorder("end_to_end", (time.perf_counter() - start) * 1000)
+            return response["statusCode"]
+
+        for event in make_payloads(args.warmup, 1, 0, seed=args.seed + 1, prefix="warmup")[0]:
+            handle(event)
+        recorder.samples.clear()
+        graph_api.sent_messages.clear()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            statuses = list(executor.map(handle, payloads))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "config": {"messages": args.messages, "concurrency": args.concurrency, "senders": args.senders,
+                   "voice_share": args.voice_share, "latency_s": latency, "jitter": jitter,
+                   "response_cache": not args.no_response_cache, "understanding": args.understanding, "seed": args.seed,
+                   "python": platform.python_version(), "platform": platform.platform()},
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(payloads) / elapsed,
+        "errors": sum(status != 200 for status in statuses),
+        "replies_sent": len(graph_api.sent_messages),
+        "stages": recorder.summary(),
+    }
+
+
+def print_report(result):
+    print(f"{result['config']['messages']} webhooks, concurrency {result['config']['concurrency']}: "
+          f"{result['throughput_per_s']:.1f}/s, {result['errors']} errors, {result['replies_sent']} replies sent")
+    print(f"{'stage':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<28}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4, help="webhooks handled at the same time")
+    parser.add_argument("--senders", type=int, default=20)
+    parser.add_argument("--voice-share", type=float, default=0.2)
+    parser.add_argument("--latency", help="seconds per call, e.g. chat=0.6,embed=0.05,translate=0.08,es=0.03,graph=0.08,transcribe=0.9")
+    parser.add_argument("--jitter", type=float, default=0.2, help="extra random latency, as a fraction of each latency")
+    parser.add_argument("--warmup", type=int, default=2, help="webhooks handled before measuring")
+    parser.add_argument("--no-response-cache", action="store_true")
+    parser.add_argument("--understanding", choices=["pipeline", "single"], default="pipeline",
+                        help="three-call intent/language/translate chain, or one structured Bedrock call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
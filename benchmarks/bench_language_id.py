@@ -0,0 +1,65 @@
+"""Micro-benchmark: LanguageIdentifier vs the old per-call langdetect.detect.
+
+Usage: python benchmarks/bench_language_id.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_module'))
+
+from language_id import LanguageIdentifier, to_translate_code
+
+#(message, expected Translate language code)
+SAMPLE = [
+    ("How do I apply for ComCare?", "en"),
+    ("Where is the nearest food bank?", "en"),
+    ("Can I get financial assistance for my mother's medical bills?", "en"),
+    ("hi", "en"),
+    ("ok", "en"),
+    ("thank you", "en"),
+    ("如何申请社区关怀计划？", "zh"),
+    ("最近的食品银行在哪里？", "zh"),
+    ("你好", "zh"),
+    ("Bagaimana cara memohon ComCare?", "ms"),
+    ("Di manakah bank makanan yang terdekat?", "ms"),
+    ("Apakah program bantuan makanan yang tersedia?", "ms"),
+    ("கோம்கேர் விண்ணப்பிக்க எப்படி?", "ta"),
+    ("அருகிலுள்ள உணவு வங்கி எங்கே?", "ta"),
+    ("வணக்கம்", "ta"),
+]
+
+
+def old_identify(text):
+    from langdetect import detect
+    return to_translate_code(detect(text))
+
+
+def run(name, identify, repeat):
+    start = time.perf_counter()
+    identify(SAMPLE[0][0])
+    first_call_ms = (time.perf_counter() - start) * 1000
+
+    correct = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text, expected in SAMPLE:
+            correct += identify(text) == expected
+    per_call_us = (time.perf_counter() - start) / (repeat * len(SAMPLE)) * 1e6
+
+    print(f"{name:<20} first call {first_call_ms:8.1f} ms   per call {per_call_us:8.1f} us   accuracy {correct / (repeat * len(SAMPLE)):.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    identifier = LanguageIdentifier()
+    run("LanguageIdentifier", identifier.identify, args.repeat)
+    run("langdetect.detect", old_identify, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
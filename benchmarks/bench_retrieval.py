@@ -0,0 +1,131 @@
+"""Recall vs latency: exact script scoring against HNSW kNN (and hybrid).
+
+Runs against any Elasticsearch, e.g. a local container:
+
+    docker run -p 9200:9200 -e discovery.type=single-node \
+        -e xpack.security.enabled=false docker.elastic.co/elasticsearch/elasticsearch:8.15.0
+
+    # synthetic corpus, creates bench_exact and bench_knn
+    python benchmarks/bench_retrieval.py --synthetic 20000 --dims 1024
+
+    # real knowledge base, after scripts/reindex_knn.py
+    python benchmarks/bench_retrieval.py --exact-index finance --knn-index finance_knn
+
+Queries are vectors of documents sampled from the exact index, with a little
+noise added, so no embedding model is needed. Recall@k is measured against the
+exact script_score results.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from reindex_knn import es_client
+
+WORDS = ["comcare", "voucher", "food", "bank", "doctor", "clinic", "dementia", "meals", "payout", "grocery",
+         "elderly", "support", "scheme", "apply", "eligibility", "medifund", "chas", "silver", "hospital", "rice"]
+
+
+def create_synthetic(es: Elasticsearch, count, dims, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(count // 200, 8), dims)).astype(np.float32)
+
+    for index, indexed in (("bench_exact", False), ("bench_knn", True)):
+        if es.indices.exists(index=index):
+            es.indices.delete(index=index)
+        vector_mapping = {"type": "dense_vector", "dims": dims, "index": indexed}
+        if indexed:
+            vector_mapping["similarity"] = "cosine"
+        es.indices.create(index=index, mappings={"properties": {"text": {"type": "text"}, "vector": vector_mapping}})
+
+    def actions():
+        for i in range(count):
+            vector = centers[rng.integers(len(centers))] + rng.normal(scale=0.5, size=dims)
+            vector = (vector / np.linalg.norm(vector)).tolist()
+            text = " ".join(rng.choice(WORDS, size=12))
+            for index in ("bench_exact", "bench_knn"):
+                yield {"_index": index, "_id": str(i), "text": text, "vector": vector}
+
+    helpers.bulk(es, actions(), chunk_size=500, request_timeout=120)
+    es.indices.refresh(index="bench_exact,bench_knn")
+    return "bench_exact", "bench_knn"
+
+
+def sample_queries(es, index, count, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    hits = es.search(index=index, size=count, query={"function_score": {"random_score": {"seed": seed, "field": "_seq_no"}}},
+                     source=["text", "vector"])["hits"]["hits"]
+    queries = []
+    for hit in hits:
+        vector = np.asarray(hit["_source"]["vector"], dtype=np.float32)
+        vector = vector + rng.normal(scale=noise, size=vector.shape)
+        queries.append((hit["_source"].get("text", ""), (vector / np.linalg.norm(vector)).tolist()))
+    return queries
+
+
+def exact_search(es, index, vector, k):
+    script = {"source": "cosineSimilarity(params.query_vector, 'vector') + 1.0", "params": {"query_vector": vector}}
+    return es.search(index=index, size=k, query={"script_score": {"query": {"match_all": {}}, "script": script}}, source=False)
+
+
+def knn_search(es, index, vector, k, num_candidates):
+    return es.search(index=index, size=k, source=False,
+                     knn={"field": "vector", "query_vector": vector, "k": k, "num_candidates": num_candidates})
+
+
+def hybrid_search(es, index, text, vector, k, num_candidates):
+    return es.search(index=index, size=k, source=False, query={"match": {"text": text}},
+                     knn={"field": "vector", "query_vector": vector, "k": k, "num_candidates": num_candidates})
+
+
+def measure(name, search, queries, truth, k):
+    latencies, recalls = [], []
+    for (text, vector), expected in zip(queries, truth):
+        start = time.perf_counter()
+        response = search(text, vector)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids = {hit["_id"] for hit in response["hits"]["hits"]}
+        recalls.append(len(ids & expected) / max(len(expected), 1))
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{name:<28} recall@{k} {np.mean(recalls):6.3f}   p50 {p50:7.1f} ms   p95 {p95:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exact-index", default="bench_exact")
+    parser.add_argument("--knn-index", default="bench_knn")
+    parser.add_argument("--synthetic", type=int, help="create a synthetic corpus of this many documents first")
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--num-candidates", default="10,50,100,200")
+    parser.add_argument("--hybrid", action="store_true", help="also measure BM25 + kNN")
+    args = parser.parse_args()
+
+    es = es_client()
+    if args.synthetic:
+        args.exact_index, args.knn_index = create_synthetic(es, args.synthetic, args.dims)
+    print(f"{es.count(index=args.exact_index)['count']} documents, {args.queries} queries")
+
+    queries = sample_queries(es, args.exact_index, args.queries, args.noise)
+    truth = []
+    for _, vector in queries:
+        truth.append({hit["_id"] for hit in exact_search(es, args.exact_index, vector, args.k)["hits"]["hits"]})
+
+    measure("script_score (exact)", lambda text, vector: exact_search(es, args.exact_index, vector, args.k), queries, truth, args.k)
+    for num_candidates in [int(n) for n in args.num_candidates.split(",")]:
+        measure(f"knn num_candidates={num_candidates}",
+                lambda text, vector: knn_search(es, args.knn_index, vector, args.k, num_candidates), queries, truth, args.k)
+        if args.hybrid:
+            measure(f"hybrid num_candidates={num_candidates}",
+                    lambda text, vector: hybrid_search(es, args.knn_index, text, vector, args.k, num_candidates), queries, truth, args.k)
+
+
+if __name__ == "__main__":
+    main()
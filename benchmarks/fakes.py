@@ -0,0 +1,189 @@
+"""Local stand-ins for Bedrock, Translate and Elasticsearch, with injected latency.
+
+Every fake sleeps `latency` seconds per call (plus up to `jitter` more) and
+reports the call to `recorder(stage, milliseconds)` when one is given, so the
+benchmark can break a turn down by external service.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+from language_id import dominant_script
+
+#Scripts of the benchmark languages; Malay is Latin and passes for English here
+LANGUAGE_SCRIPTS = {"CJK": "zh", "TAMIL": "ta"}
+
+
+class _Latency:
+    def __init__(self, stage, latency=0.0, jitter=0.0, recorder=None):
+        self.stage = stage
+        self.latency = latency
+        self.jitter = jitter
+        self.recorder = recorder
+
+    def wait(self, start):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.recorder is not None:
+            self.recorder(self.stage, (time.perf_counter() - start) * 1000)
+
+
+class FakeChat(_Latency):
+    """ChatBedrock stand-in: answers intent prompts with a label, understanding prompts with JSON
+    and response prompts with a tagged reply"""
+
+    INTENT_WORDS = {"financial_aid": ["comcare", "voucher", "financial", "payout"], "healthcare": ["doctor", "clinic", "dementia"],
+                    "food_security": ["food", "meal", "grocer"]}
+
+    def __init__(self, latency=0.0, jitter=0.0, recorder=None):
+        super().__init__("bedrock_chat", latency, jitter, recorder)
+
+    def invoke(self, messages):
+        start = time.perf_counter()
+        text = str(messages[-1].content)
+        if text.rstrip().endswith("Intent:"):
+            reply = AIMessage(content=self.intent(text), usage_metadata={"input_tokens": len(text) // 4, "output_tokens": 2, "total_tokens": len(text) // 4 + 2})
+        elif text.rstrip().endswith("JSON:"):
+            query = text.rsplit("Message:", 1)[-1].rsplit("JSON:", 1)[0].strip()
+            language = LANGUAGE_SCRIPTS.get(dominant_script(query), "en")
+            english = query if language == "en" else f"[{language}->en] {query}"
+            answer = json.dumps({"intent": self.intent(query), "language": language, "english_query": english}, ensure_ascii=False)
+            reply = AIMessage(content=answer, usage_metadata={"input_tokens": 350 + len(text) // 4, "output_tokens": 30,
+                                                              "total_tokens": 380 + len(text) // 4})
+        else:
+            answer = "You can apply at your nearest Social Service Office or on the SupportGoWhere website."
+            reply = AIMessage(content=f"<response>{answer}</response>",
+                              usage_metadata={"input_tokens": len(text) // 4, "output_tokens": 40, "total_tokens": len(text) // 4 + 40})
+        self.wait(start)
+        return reply
+
+    def intent(self, query):
+        query = query.lower()
+        return next((intent for intent, words in self.INTENT_WORDS.items() if any(word in query for word in words)), "other")
+
+
+class FakeEmbeddings(_Latency, Embeddings):
+    """Deterministic bag-of-words embeddings: texts sharing words get similar vectors"""
+
+    def __init__(self, dims=256, latency=0.0, jitter=0.0, recorder=None):
+        super().__init__("bedrock_embeddings", latency, jitter, recorder)
+        self.dims = dims
+
+    def _vector(self, text):
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dims] += 1.0
+        vector[0] += 0.01
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        vector = self._vector(text)
+        self.wait(start)
+        return vector
+
+    def embed_documents(self, texts):
+        start = time.perf_counter()
+        vectors = [self._vector(text) for text in texts]
+        self.wait(start)
+        return vectors
+
+
+class FakeTranslate(_Latency):
+    """boto3 translate client stand-in; marks text as translated instead of translating it"""
+
+    def __init__(self, latency=0.0, jitter=0.0, recorder=None):
+        super().__init__("translate", latency, jitter, recorder)
+
+    def translate_text(self, Text, SourceLanguageCode, TargetLanguageCode):
+        start = time.perf_counter()
+        self.wait(start)
+        return {"TranslatedText": f"[{SourceLanguageCode}->{TargetLanguageCode}] {Text}"}
+
+
+class FakeBedrockRuntime(_Latency):
+    """bedrock-runtime stand-in for voice transcription; `transcripts` maps audio bytes to text"""
+
+    def __init__(self, transcripts, latency=0.0, jitter=0.0, recorder=None):
+        super().__init__("transcribe", latency, jitter, recorder)
+        self.transcripts = transcripts
+
+    def invoke_model(self, modelId, body, contentType):
+        import base64
+        import io
+        start = time.perf_counter()
+        audio = base64.b64decode(json.loads(body)["messages"][0]["content"][0]["source"]["data"])
+        text = self.transcripts.get(audio, "hello")
+        self.wait(start)
+        return {"body": io.BytesIO(json.dumps({"content": [{"text": text}]}).encode("utf-8"))}
+
+
+class FakeElasticsearch(_Latency):
+    """Minimal Elasticsearch HTTP server answering searches with the first `size` documents of an index"""
+
+    def __init__(self, corpus, latency=0.0, jitter=0.0, recorder=None):
+        super().__init__("elasticsearch", latency, jitter, recorder)
+        self.corpus = corpus
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler_class(self):
+        es = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, body):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                self._reply({"name": "fake", "cluster_name": "fake", "cluster_uuid": "fake", "tagline": "You Know, for Search",
+                             "version": {"number": "8.15.0", "build_flavor": "default", "lucene_version": "9.11.1",
+                                         "minimum_wire_compatibility_version": "7.17.0",
+                                         "minimum_index_compatibility_version": "7.0.0"}})
+
+            def do_POST(self):
+                start = time.perf_counter()
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                index = self.path.strip("/").split("/")[0]
+                size = request.get("size") or (request.get("knn") or {}).get("k") or 4
+                documents = es.corpus.get(index, [])[:size]
+                hits = [{"_index": index, "_id": str(i), "_score": 2.0 - i * 0.1, "_source": {"text": text, "metadata": {}}}
+                        for i, text in enumerate(documents)]
+                es.wait(start)
+                self._reply({"took": 1, "timed_out": False, "hits": {"total": {"value": len(hits), "relation": "eq"},
+                                                                      "max_score": 2.0, "hits": hits}})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
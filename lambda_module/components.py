@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+import threading
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class ComponentRegistry:
+    """Process-wide clients and stores, each created on first use.
+
+    Factories are registered by name and run at most once per container, so
+    a request only pays for the libraries and connections it touches (the
+    webhook verification GET touches none). Components are reached as
+    `components.get(name)` or `components.<name>`.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory=None):
+        """Register `factory` under `name`; usable as a decorator"""
+        def decorator(factory):
+            self._factories[name] = factory
+            return factory
+        return decorator(factory) if factory is not None else decorator
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._factories:
+            raise KeyError(f"Unknown component {name}")
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                #Cold-start cost shows up in the trace of the request that paid it
+                with tracing.span(f"init.{name}"):
+                    self._instances[name] = self._factories[name]()
+                logger.info(f"Created {name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+            return self._instances[name]
+
+    def set(self, name, instance):
+        """Use `instance` instead of the registered factory, e.g. a fake in tests"""
+        self._instances[name] = instance
+
+    def reset(self, name=None):
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def loaded(self):
+        return list(self._instances)
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name not in self._factories:
+            raise AttributeError(name)
+        return self.get(name)
+
+
+components = ComponentRegistry()
+
+
+#One Bedrock runtime client, shared by chat, embeddings and transcription. botocore
+#does not retry: the model invoker does, within the time the request has left
+@components.register("bedrock_runtime")
+def _bedrock_runtime():
+    import boto3
+    from botocore.config import Config
+    return boto3.client('bedrock-runtime',
+                        region_name=os.environ.get("AWS_DEFAULT_REGION"),
+                        aws_access_key_id=os.environ.get("BEDROCK_AWS_ACCESS_KEY_ID"),
+                        aws_secret_access_key=os.environ.get("BEDROCK_AWS_SECRET_ACCESS_KEY"),
+                        config=Config(retries={"total_max_attempts": 1, "mode": "standard"},
+                                      connect_timeout=float(os.environ.get("BEDROCK_CONNECT_TIMEOUT", "3")),
+                                      read_timeout=float(os.environ.get("BEDROCK_READ_TIMEOUT", "30"))))
+
+
+@components.register("model_invoker")
+def _model_invoker():
+    from model_invoker import ModelInvoker
+    return ModelInvoker.from_env()
+
+
+@components.register("bedrock_chat")
+def _bedrock_chat():
+    from langchain_aws import ChatBedrock
+    return ChatBedrock(client=components.bedrock_runtime, model_id=os.environ.get("BEDROCK_CHAT_MODEL_ID"))
+
+
+@components.register("bedrock_embeddings")
+def _bedrock_embeddings():
+    from langchain_aws import BedrockEmbeddings
+    from model_invoker import InvokedEmbeddings
+    from embedding_cache import embedding_cache_from_env
+    model_id = os.environ.get("BEDROCK_EMBEDDING_MODEL_ID")
+    embeddings = BedrockEmbeddings(client=components.bedrock_runtime, model_id=model_id)
+    #Cache hits never reach the invoker, so they cost no Bedrock capacity
+    return embedding_cache_from_env(InvokedEmbeddings(embeddings, components.model_invoker), model_id)
+
+
+@components.register("translate_runtime")
+def _translate_runtime():
+    import boto3
+    return boto3.client(service_name="translate",
+                        region_name=os.environ.get("AWS_DEFAULT_REGION"),
+                        aws_access_key_id=os.environ.get("TRANSLATE_AWS_ACCESS_KEY_ID"),
+                        aws_secret_access_key=os.environ.get("TRANSLATE_AWS_SECRET_ACCESS_KEY"))
+
+
+@components.register("whatsapp_client")
+def _whatsapp_client():
+    #One keep-alive connection pool to graph.facebook.com per container
+    from whatsapp_client import WhatsAppClient
+    return WhatsAppClient()
@@ -0,0 +1,115 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteDedupBackend:
+    """Local stand-in for the shared DynamoDB table, with the same conditional-put semantics"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS processed_messages (message_id TEXT PRIMARY KEY, expires_at REAL)")
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=5, isolation_level="IMMEDIATE")
+        return self._local.connection
+
+    def claim(self, message_id, expires_at) -> bool:
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "INSERT INTO processed_messages VALUES (?, ?) "
+                "ON CONFLICT (message_id) DO UPDATE SET expires_at = excluded.expires_at WHERE processed_messages.expires_at < ?",
+                (message_id, expires_at, time.time())
+            )
+            return cursor.rowcount == 1
+
+    def release(self, message_id):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM processed_messages WHERE message_id = ?", (message_id,))
+
+
+class DynamoDBDedupBackend:
+    """DynamoDB table keyed on message_id, with `expires_at` as the table's TTL attribute"""
+
+    def __init__(self, table_name, client=None):
+        import boto3
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb", region_name=os.environ.get("AWS_DEFAULT_REGION"))
+
+    def claim(self, message_id, expires_at) -> bool:
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={"message_id": {"S": message_id}, "expires_at": {"N": str(int(expires_at))}},
+                ConditionExpression="attribute_not_exists(message_id) OR expires_at < :now",
+                ExpressionAttributeValues={":now": {"N": str(int(time.time()))}},
+            )
+            return True
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def release(self, message_id):
+        self.client.delete_item(TableName=self.table_name, Key={"message_id": {"S": message_id}})
+
+
+class MessageDeduplicator:
+    """Claims WhatsApp message ids so redelivered webhooks are processed only once.
+
+    Ids seen by this container are answered from a bounded in-process set;
+    otherwise the shared backend's conditional put decides which delivery
+    wins. `release` gives up a claim when processing fails, so the next
+    redelivery is processed.
+    """
+
+    def __init__(self, backend=None, ttl=86400, cache_size=10000):
+        self.backend = backend
+        self.ttl = ttl
+        self.seen = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.suppressed = 0
+
+    def claim(self, message_id) -> bool:
+        """True for the first delivery of `message_id`, False for duplicates"""
+        if not message_id:
+            return True
+        if message_id in self.seen:
+            self.suppressed += 1
+            return False
+        if self.backend is not None and not self.backend.claim(message_id, time.time() + self.ttl):
+            self.suppressed += 1
+            return False
+        #Only once the claim is ours: after a backend error the redelivery must get through
+        self.seen.set(message_id, True)
+        return True
+
+    def release(self, message_id):
+        if not message_id:
+            return
+        self.seen.pop(message_id)
+        if self.backend is not None:
+            try:
+                self.backend.release(message_id)
+            except Exception as e:
+                logger.warning(f"Could not release message {message_id}: {str(e)}")
+
+
+def deduplicator_from_env():
+    backend_name = os.environ.get("DEDUP_BACKEND", "memory")
+    backend = None
+    if backend_name == "dynamodb":
+        backend = DynamoDBDedupBackend(os.environ["DEDUP_TABLE"])
+    elif backend_name == "sqlite":
+        backend = SQLiteDedupBackend(os.environ.get("DEDUP_DB_PATH", "/tmp/processed_messages.db"))
+    return MessageDeduplicator(
+        backend=backend,
+        ttl=float(os.environ.get("DEDUP_TTL", "86400")),
+        cache_size=int(os.environ.get("DEDUP_CACHE_SIZE", "10000"))
+    )
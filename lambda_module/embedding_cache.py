@@ -0,0 +1,181 @@
+import os
+import hashlib
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    #Whitespace and Unicode composition do not change what a text means
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model_id: str, text: str) -> str:
+    """Content address of the embedding of `text` by `model_id`"""
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class SQLiteVectorStore:
+    """File-backed float32 vectors keyed by content address"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, vector BLOB)")
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=5)
+        return self._local.connection
+
+    def get_many(self, keys):
+        found = {}
+        #Stay well under SQLite's bound parameter limit
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = self._connection().execute(
+                f"SELECT key, vector FROM embedding_cache WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def put_many(self, items):
+        with self._connection() as connection:
+            connection.executemany("INSERT OR REPLACE INTO embedding_cache VALUES (?, ?)",
+                                   [(key, vector.tobytes()) for key, vector in items])
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+
+class CachedEmbeddings:
+    """Embeddings behind a content-addressed cache: an in-memory LRU in front of
+    an optional SQLiteVectorStore.
+
+    Texts are keyed on the model ID and their normalized content, so the same
+    text is embedded by Bedrock once whichever query, store or ingestion run
+    asks for it. Only misses reach `embeddings`, in one embed_documents call
+    per batch. Bedrock embeds one text per request, so every hit is a saved call.
+    """
+
+    def __init__(self, embeddings, model_id, store=None, maxsize=4096):
+        self.embeddings = embeddings
+        self.model_id = model_id or ""
+        #Cohere embeds queries and documents differently, Titan does not
+        self.by_input_type = "cohere" in self.model_id
+        self.store = store
+        self.maxsize = maxsize
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, text, input_type):
+        return cache_key(f"{self.model_id}/{input_type}" if self.by_input_type else self.model_id, text)
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _save(self, items):
+        for key, vector in items:
+            self._remember(key, vector)
+        if self.store is not None:
+            try:
+                self.store.put_many(items)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache write failed: {str(e)}")
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+        memory_hits = len(found)
+        missing = [key for key in keys if key not in found]
+        if missing and self.store is not None:
+            try:
+                stored = self.store.get_many(missing)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache read failed: {str(e)}")
+                stored = {}
+            for key, vector in stored.items():
+                self._remember(key, vector)
+            found.update(stored)
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.store_hits += len(found) - memory_hits
+        return found
+
+    def embed_documents(self, texts):
+        keys = [self._key(text, "document") for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found = self._lookup(unique_keys)
+        #Each distinct missing text is embedded once, even if a batch repeats it
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        tracing.metric("embedding_cache_hits", len(unique_keys) - len(missing))
+        tracing.metric("embedding_cache_misses", len(missing))
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = [(key, np.asarray(vector, dtype=np.float32)) for key, vector in zip(missing, vectors)]
+            with self._lock:
+                self.misses += len(computed)
+            self._save(computed)
+            found.update(computed)
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        key = self._key(text, "query")
+        found = self._lookup([key])
+        tracing.metric("embedding_cache_hit", int(key in found))
+        if key in found:
+            return found[key].tolist()
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        with self._lock:
+            self.misses += 1
+        self._save([(key, vector)])
+        return vector.tolist()
+
+    def stats(self):
+        hits = self.memory_hits + self.store_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_calls": hits
+        }
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
+
+
+def embedding_cache_from_env(embeddings, model_id):
+    """Wrap `embeddings` per EMBEDDING_CACHE_* settings; unwrapped when disabled"""
+    backend_name = os.environ.get("EMBEDDING_CACHE_BACKEND", "sqlite")
+    if backend_name == "none":
+        return embeddings
+    store = None
+    if backend_name == "sqlite":
+        store = SQLiteVectorStore(os.environ.get("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache.db"))
+    return CachedEmbeddings(embeddings, model_id, store=store, maxsize=int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096")))
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteHistoryBackend:
+    """Local key-value stand-in for the DynamoDB table, used for tests and local runs"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS conversation_history (
+                phone_number TEXT PRIMARY KEY,
+                messages TEXT,
+                version INTEGER,
+                expires_at REAL
+            )""")
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=5)
+        return self._local.connection
+
+    def get(self, user_id):
+        row = self._connection().execute(
+            "SELECT messages, version FROM conversation_history WHERE phone_number = ? AND expires_at > ?", (user_id, time.time())
+        ).fetchone()
+        if row is None:
+            return [], 0
+        return json.loads(row[0]), row[1]
+
+    def put(self, user_id, messages, expected_version, expires_at) -> bool:
+        """Write version expected_version + 1, only if the stored version is still expected_version"""
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT version, expires_at FROM conversation_history WHERE phone_number = ?", (user_id,)
+            ).fetchone()
+            stored_version = row[0] if row and row[1] > time.time() else 0
+            if stored_version != expected_version:
+                return False
+            connection.execute(
+                "INSERT OR REPLACE INTO conversation_history VALUES (?, ?, ?, ?)",
+                (user_id, json.dumps(messages, ensure_ascii=False), expected_version + 1, expires_at)
+            )
+            return True
+
+
+class DynamoDBHistoryBackend:
+    """DynamoDB table keyed on phone_number, with `expires_at` as the table's TTL attribute"""
+
+    def __init__(self, table_name, client=None):
+        import boto3
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb", region_name=os.environ.get("AWS_DEFAULT_REGION"))
+
+    def get(self, user_id):
+        item = self.client.get_item(
+            TableName=self.table_name, Key={"phone_number": {"S": user_id}}, ConsistentRead=True
+        ).get("Item")
+        if item is None or float(item["expires_at"]["N"]) < time.time():
+            return [], 0
+        return json.loads(item["messages"]["S"]), int(item["version"]["N"])
+
+    def put(self, user_id, messages, expected_version, expires_at) -> bool:
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "phone_number": {"S": user_id},
+                    "messages": {"S": json.dumps(messages, ensure_ascii=False)},
+                    "version": {"N": str(expected_version + 1)},
+                    "expires_at": {"N": str(int(expires_at))},
+                },
+                #Expired items may linger until DynamoDB deletes them, so they count as version 0
+                ConditionExpression="attribute_not_exists(phone_number) OR version = :expected OR expires_at < :now",
+                ExpressionAttributeValues={
+                    ":expected": {"N": str(expected_version)},
+                    ":now": {"N": str(int(time.time()))},
+                },
+            )
+            return True
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+
+class HistoryStore:
+    """Per-user conversation history behind an in-process LRU/TTL hot tier.
+
+    A turn is one `load` (served from the hot tier when possible) and one
+    conditional `save`. If another container wrote the same conversation in
+    between, the save re-reads the stored history, appends this turn's new
+    messages and retries once. Histories are trimmed to the last
+    `max_messages` messages on save.
+    """
+
+    def __init__(self, backend=None, max_messages=10, ttl=86400, cache_size=1000, cache_ttl=900):
+        self.backend = backend
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def load(self, user_id):
+        """Return (messages, version); `messages` is a copy the caller may append to"""
+        cached = self.cache.get(user_id)
+        if cached is None:
+            cached = self.backend.get(user_id) if self.backend is not None else ([], 0)
+            self.cache.set(user_id, cached)
+        messages, version = cached
+        return list(messages), version
+
+    def _trim(self, messages):
+        return messages[-self.max_messages:] if self.max_messages else messages
+
+    def save(self, user_id, messages, version, new_from=None):
+        """Store `messages` loaded at `version`; messages[new_from:] are the ones added this turn"""
+        #Taken before trimming, which would shift or drop them
+        new_messages = messages[new_from:] if new_from is not None else []
+        messages = self._trim(messages)
+        if self.backend is None:
+            self.cache.set(user_id, (messages, version + 1))
+            return
+
+        expires_at = time.time() + self.ttl
+        if not self.backend.put(user_id, messages, version, expires_at):
+            logger.info(f"Concurrent update of history for {user_id}, merging")
+            stored_messages, version = self.backend.get(user_id)
+            messages = self._trim(stored_messages + new_messages)
+            if not self.backend.put(user_id, messages, version, expires_at):
+                self.cache.pop(user_id)
+                raise RuntimeError(f"Could not save history for {user_id}")
+        self.cache.set(user_id, (messages, version + 1))
+
+
+def history_store_from_env():
+    """Build the store from HISTORY_* settings; without a backend only the hot tier is used"""
+    backend_name = os.environ.get("HISTORY_BACKEND", "memory")
+    backend = None
+    if backend_name == "dynamodb":
+        backend = DynamoDBHistoryBackend(os.environ["HISTORY_TABLE"])
+    elif backend_name == "sqlite":
+        backend = SQLiteHistoryBackend(os.environ.get("HISTORY_DB_PATH", "/tmp/conversation_history.db"))
+    return HistoryStore(
+        backend=backend,
+        max_messages=int(os.environ.get("HISTORY_MAX_MESSAGES", "10")),
+        ttl=float(os.environ.get("HISTORY_TTL", "86400")),
+        cache_size=int(os.environ.get("HISTORY_CACHE_SIZE", "1000")),
+        cache_ttl=float(os.environ.get("HISTORY_CACHE_TTL", "900"))
+    )
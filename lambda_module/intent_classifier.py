@@ -0,0 +1,95 @@
+import os
+import threading
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#Labeled exemplars, seeded from the examples in the intent detection prompt
+INTENT_EXEMPLARS = {
+    "financial_aid": [
+        "How do I apply for ComCare?",
+        "如何申请社区关怀计划？",
+        "Bagaimana cara memohon ComCare?",
+        "கோம்கேர் விண்ணப்பிக்க எப்படி?",
+    ],
+    "healthcare": [
+        "Where can I find a doctor for dementia care?",
+        "哪里可以找到治疗痴呆症的医生？",
+        "Di mana saya boleh mencari doktor untuk penjagaan demensia?",
+        "மனதளவு பராமரிப்புக்கான மருத்துவரை எங்கே கண்டுபிடிப்பது?",
+    ],
+    "food_security": [
+        "Where is the nearest food bank?",
+        "最近的食品银行在哪里？",
+        "Di manakah bank makanan yang terdekat?",
+        "அருகிலுள்ள உணவு வங்கி எங்கே?",
+    ],
+    "other": [
+        "What is the weather today?",
+        "今天天气怎么样？",
+        "Bagaimana cuaca hari ini?",
+        "இன்றைய வானிலை என்ன?",
+    ],
+}
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class IntentClassifier:
+    """Nearest-exemplar intent classifier over embeddings.
+
+    Each intent is scored by its most similar exemplar. A label is only
+    returned when the best intent beats the runner-up by `margin` and clears
+    `min_similarity`; otherwise the caller should fall back to the LLM.
+    """
+
+    def __init__(self, embeddings, exemplars=INTENT_EXEMPLARS, margin=None, min_similarity=None, vectors_path=None):
+        self.embeddings = embeddings
+        self.labels = list(exemplars)
+        self.texts = [text for label in self.labels for text in exemplars[label]]
+        self.exemplar_labels = np.array([self.labels.index(label) for label in self.labels for _ in exemplars[label]])
+        self.margin = float(margin if margin is not None else os.environ.get("INTENT_CONFIDENCE_MARGIN", "0.05"))
+        self.min_similarity = float(min_similarity if min_similarity is not None else os.environ.get("INTENT_MIN_SIMILARITY", "0.3"))
+        self.vectors_path = vectors_path or os.environ.get("INTENT_EXEMPLAR_VECTORS")
+        self._vectors = None
+        self._lock = threading.Lock()
+
+    def exemplar_vectors(self):
+        #Embedded once per container, or loaded from a precomputed .npy file
+        if self._vectors is None:
+            with self._lock:
+                if self._vectors is None:
+                    vectors = None
+                    if self.vectors_path and os.path.exists(self.vectors_path):
+                        vectors = np.load(self.vectors_path)
+                        if vectors.shape[0] != len(self.texts):
+                            logger.warning(f"Ignoring stale intent exemplar vectors at {self.vectors_path}")
+                            vectors = None
+                    if vectors is None:
+                        vectors = np.asarray(self.embeddings.embed_documents(self.texts), dtype=np.float32)
+                    self._vectors = _normalize(vectors.astype(np.float32))
+        return self._vectors
+
+    def save(self, path):
+        np.save(path, self.exemplar_vectors())
+
+    def scores(self, query_vector):
+        similarities = self.exemplar_vectors() @ _normalize(np.asarray(query_vector, dtype=np.float32))
+        label_scores = np.full(len(self.labels), -1.0, dtype=np.float32)
+        np.maximum.at(label_scores, self.exemplar_labels, similarities)
+        return label_scores
+
+    def classify(self, query: str, query_vector=None):
+        """Return (intent, margin), with intent None when the query is ambiguous"""
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(query)
+        label_scores = self.scores(query_vector)
+        runner_up, best = np.argsort(label_scores)[-2:]
+        margin = float(label_scores[best] - label_scores[runner_up])
+        if margin >= self.margin and label_scores[best] >= self.min_similarity:
+            return self.labels[best], margin
+        return None, margin
@@ -0,0 +1,117 @@
+import os
+import re
+import threading
+import unicodedata
+
+from ttl_cache import TTLCache
+
+#langdetect / script codes -> AWS Translate language codes
+TRANSLATE_LANGUAGE_CODES = {
+    "zh-cn": "zh",
+    "zh-tw": "zh-TW",
+    "id": "ms",
+}
+
+#Unicode script prefixes (from unicodedata names) that identify a language on their own
+SCRIPT_LANGUAGES = {
+    "CJK": "zh",
+    "TAMIL": "ta",
+    "HIRAGANA": "ja",
+    "KATAKANA": "ja",
+    "HANGUL": "ko",
+    "DEVANAGARI": "hi",
+    "THAI": "th",
+    "ARABIC": "ar",
+}
+
+#Latin-script text is only ever English or Malay for this bot; langdetect has no
+#Malay profile, so Indonesian stands in for it
+LATIN_PROFILES = ["en", "id"]
+
+#Messages shorter than this (in letters) are too short to detect reliably
+SHORT_MESSAGE_LETTERS = 12
+
+
+def to_translate_code(language: str) -> str:
+    return TRANSLATE_LANGUAGE_CODES.get(language, language)
+
+
+def dominant_script(text: str):
+    """Return the most common script among the letters of `text`, or None without letters"""
+    counts = {}
+    for ch in text:
+        if not ch.isalpha():
+            continue
+        name = unicodedata.name(ch, "")
+        script = "LATIN" if name.startswith("LATIN") else next((prefix for prefix in SCRIPT_LANGUAGES if name.startswith(prefix)), "OTHER")
+        counts[script] = counts.get(script, 0) + 1
+    if not counts:
+        return None
+    return max(counts, key=counts.get)
+
+
+class LanguageIdentifier:
+    """Deterministic language identification returning AWS Translate codes.
+
+    Non-Latin scripts are decided from Unicode character names alone. Latin
+    text goes through a seeded langdetect detector restricted to English and
+    Malay. Short or letterless messages ("hi", "ok", "3") reuse the last
+    language identified for the same user.
+    """
+
+    def __init__(self, default_language="en", cache_size=10000, ttl=86400):
+        self.default_language = default_language
+        self.user_languages = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._factory = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        #Only the two Latin profiles are loaded, instead of all 55 that langdetect.detect loads
+        if self._factory is None:
+            with self._lock:
+                if self._factory is None:
+                    from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+                    factory = DetectorFactory()
+                    profiles = []
+                    for language in LATIN_PROFILES:
+                        with open(os.path.join(PROFILES_DIRECTORY, language), encoding="utf-8") as f:
+                            profiles.append(f.read())
+                    factory.load_json_profile(profiles)
+                    factory.set_seed(0)
+                    self._factory = factory
+        return self._factory
+
+    def detect_latin(self, text: str):
+        """Return (language, probability) for Latin-script text"""
+        detector = self.load().create()
+        detector.append(text)
+        best = detector.get_probabilities()[0]
+        return to_translate_code(best.lang), best.prob
+
+    def identify(self, text: str, user_id: str = None) -> str:
+        previous = self.user_languages.get(user_id) if user_id else None
+        script = dominant_script(text)
+
+        if script is None:
+            return previous or self.default_language
+
+        if script in SCRIPT_LANGUAGES:
+            language = SCRIPT_LANGUAGES[script]
+        elif script == "LATIN":
+            letters = len(re.findall(r"[^\W\d_]", text))
+            if letters < SHORT_MESSAGE_LETTERS:
+                if previous:
+                    return previous
+                language, probability = self.detect_latin(text)
+                #Without history, only trust a short message when the detector is sure
+                if probability < 0.9:
+                    language = self.default_language
+            else:
+                language, _ = self.detect_latin(text)
+        else:
+            from langdetect import detect
+            language = to_translate_code(detect(text))
+
+        if user_id:
+            self.user_languages.set(user_id, language)
+        return language
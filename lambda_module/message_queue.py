@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import deque
+
+
+class SQSMessageQueue:
+    """SQS queue; on a FIFO queue each sender is a message group, so their messages stay in order"""
+
+    def __init__(self, queue_url, client=None):
+        import boto3
+        self.queue_url = queue_url
+        self.fifo = queue_url.endswith(".fifo")
+        self.client = client or boto3.client("sqs", region_name=os.environ.get("AWS_DEFAULT_REGION"))
+
+    def send(self, body: dict, group_id: str = None, deduplication_id: str = None):
+        params = {"QueueUrl": self.queue_url, "MessageBody": json.dumps(body)}
+        if self.fifo:
+            params["MessageGroupId"] = group_id or "default"
+            params["MessageDeduplicationId"] = deduplication_id or uuid.uuid4().hex
+        self.client.send_message(**params)
+
+    def receive(self, max_messages=10, wait_seconds=1):
+        response = self.client.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=min(max_messages, 10),
+                                               WaitTimeSeconds=wait_seconds)
+        return [(message["ReceiptHandle"], json.loads(message["Body"])) for message in response.get("Messages", [])]
+
+    def delete(self, receipt):
+        self.client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+
+class InMemoryMessageQueue:
+    """Single-process stand-in, for tests and running handler and worker in one process"""
+
+    def __init__(self):
+        self._messages = deque()
+        self._lock = threading.Lock()
+
+    def send(self, body: dict, group_id: str = None, deduplication_id: str = None):
+        with self._lock:
+            self._messages.append(body)
+
+    def receive(self, max_messages=10, wait_seconds=0):
+        with self._lock:
+            batch = []
+            while self._messages and len(batch) < max_messages:
+                batch.append((uuid.uuid4().hex, self._messages.popleft()))
+            return batch
+
+    def delete(self, receipt):
+        pass
+
+    def __len__(self):
+        return len(self._messages)
+
+
+class SQLiteMessageQueue:
+    """File-backed stand-in shared by a local handler process and a local worker process.
+
+    Received messages are hidden for `visibility_timeout` seconds and come
+    back if they are not deleted, like SQS.
+    """
+
+    def __init__(self, path, visibility_timeout=60):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS message_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                body TEXT,
+                visible_at REAL
+            )""")
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=5, isolation_level="IMMEDIATE")
+        return self._local.connection
+
+    def send(self, body: dict, group_id: str = None, deduplication_id: str = None):
+        with self._connection() as connection:
+            connection.execute("INSERT INTO message_queue (body, visible_at) VALUES (?, ?)", (json.dumps(body), 0))
+
+    def receive(self, max_messages=10, wait_seconds=0):
+        now = time.time()
+        with self._connection() as connection:
+            rows = connection.execute(
+                "SELECT id, body FROM message_queue WHERE visible_at <= ? ORDER BY id LIMIT ?", (now, max_messages)
+            ).fetchall()
+            connection.executemany("UPDATE message_queue SET visible_at = ? WHERE id = ?",
+                                   [(now + self.visibility_timeout, row[0]) for row in rows])
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def delete(self, receipt):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM message_queue WHERE id = ?", (receipt,))
+
+
+def message_queue_from_env():
+    backend_name = os.environ.get("MESSAGE_QUEUE_BACKEND", "sqs")
+    if backend_name == "sqlite":
+        return SQLiteMessageQueue(os.environ.get("MESSAGE_QUEUE_PATH", "/tmp/message_queue.db"))
+    if backend_name == "memory":
+        return InMemoryMessageQueue()
+    return SQSMessageQueue(os.environ["MESSAGE_QUEUE_URL"])
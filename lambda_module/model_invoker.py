@@ -0,0 +1,298 @@
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import tracing
+from components import components
+
+logger = logging.getLogger(__name__)
+
+#Error codes Bedrock answers with when it is overloaded or briefly unavailable
+THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+TRANSIENT_CODES = {"ServiceUnavailableException", "InternalServerException", "ModelTimeoutException",
+                   "ModelNotReadyException", "ModelErrorException"}
+#botocore network errors, matched by name so this module does not import botocore
+TRANSIENT_ERRORS = {"ReadTimeoutError", "ConnectTimeoutError", "EndpointConnectionError", "ConnectionClosedError"}
+
+#Stages whose chat model can be tiered with <STAGE>_MODEL_IDS
+STAGES = ("intent", "understanding", "response")
+
+#Monotonic time by which the current request must be done; see use_deadline()
+_deadline = ContextVar("deadline", default=None)
+
+
+class ModelUnavailable(Exception):
+    """No model could answer: circuit open, out of time, or still failing after retries"""
+
+
+def error_kind(error):
+    """"throttle", "transient" or None (an error retrying will not fix), following the exception chain"""
+    while error is not None:
+        code = (getattr(error, "response", None) or {}).get("Error", {}).get("Code")
+        if code in THROTTLE_CODES:
+            return "throttle"
+        if code in TRANSIENT_CODES or type(error).__name__ in TRANSIENT_ERRORS:
+            return "transient"
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def lambda_deadline(context, reserve=None):
+    """Monotonic deadline of a Lambda invocation, `reserve` seconds early for sending the reply; None outside Lambda"""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    reserve = float(reserve if reserve is not None else os.environ.get("DEADLINE_RESERVE_SECONDS", "3"))
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - reserve
+
+
+@contextmanager
+def use_deadline(deadline):
+    """Model calls in the enclosed block (and graph nodes it runs) give up at `deadline`"""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class AdaptiveLimiter:
+    """Client-side concurrency limit that adapts to throttling (AIMD).
+
+    Each success raises the limit by 1/limit, each throttle halves it, so
+    the container backs off quickly and probes its way back up. Only calls
+    from this container are limited; other containers keep their own limit.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout):
+        end = time.monotonic() + timeout
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, throttled=False, called=True):
+        """Give the slot back; `called=False` when the model was not called, so the limit stays"""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif called:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` failures in a row and rejects calls for
+    `reset_timeout` seconds, then lets one trial call through (half-open)"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._trial = False
+                return True
+            return False
+
+
+class ModelInvoker:
+    """Every Bedrock call goes through here: a concurrency limiter and a circuit
+    breaker per model ID, retries with jittered backoff that stop when the
+    request's deadline is near, and per-stage model tiers.
+
+    `invoke_chat(stage, messages)` tries the models of a stage in order
+    (e.g. RESPONSE_MODEL_IDS=large,small) and raises ModelUnavailable when
+    none of them answers; callers degrade from there.
+    """
+
+    def __init__(self, default_model_id=None, tiers=None, max_attempts=3, base_delay=0.25, max_delay=4.0, min_time_left=1.0,
+                 queue_timeout=10.0, initial_concurrency=4, max_concurrency=16, failure_threshold=5, reset_timeout=30.0):
+        self.default_model_id = default_model_id
+        self.tiers = tiers or {}
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_time_left = min_time_left
+        self.queue_timeout = queue_timeout
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.limiters = {}
+        self.breakers = {}
+        self._chats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        tiers = {stage: [model_id.strip() for model_id in os.environ.get(f"{stage.upper()}_MODEL_IDS", "").split(",") if model_id.strip()]
+                 for stage in STAGES}
+        if not tiers["understanding"] and os.environ.get("UNDERSTANDING_MODEL_ID"):
+            tiers["understanding"] = [os.environ["UNDERSTANDING_MODEL_ID"]]
+        return cls(
+            default_model_id=os.environ.get("BEDROCK_CHAT_MODEL_ID"),
+            tiers=tiers,
+            max_attempts=int(os.environ.get("MODEL_MAX_ATTEMPTS", "3")),
+            min_time_left=float(os.environ.get("MODEL_MIN_TIME_LEFT", "1.0")),
+            queue_timeout=float(os.environ.get("MODEL_QUEUE_TIMEOUT", "10")),
+            initial_concurrency=int(os.environ.get("MODEL_INITIAL_CONCURRENCY", "4")),
+            max_concurrency=int(os.environ.get("MODEL_MAX_CONCURRENCY", "16")),
+            failure_threshold=int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30"))
+        )
+
+    def _per_model(self, registry, model_id, factory):
+        with self._lock:
+            if model_id not in registry:
+                registry[model_id] = factory()
+            return registry[model_id]
+
+    def limiter(self, model_id):
+        return self._per_model(self.limiters, model_id, lambda: AdaptiveLimiter(min(self.initial_concurrency, self.max_concurrency),
+                                                                              maximum=self.max_concurrency))
+
+    def breaker(self, model_id):
+        return self._per_model(self.breakers, model_id, lambda: CircuitBreaker(self.failure_threshold, self.reset_timeout))
+
+    def models(self, stage):
+        return self.tiers.get(stage) or [self.default_model_id]
+
+    def chat(self, model_id):
+        """Chat model for `model_id`; the default model is the shared bedrock_chat component"""
+        if model_id == self.default_model_id:
+            return components.bedrock_chat
+
+        def create():
+            from langchain_aws import ChatBedrock
+            return ChatBedrock(client=components.bedrock_runtime, model_id=model_id)
+        return self._per_model(self._chats, model_id, create)
+
+    def call(self, model_id, function):
+        """Run `function()`, a call to `model_id`, with limiting, retries and the circuit breaker"""
+        breaker = self.breaker(model_id)
+        limiter = self.limiter(model_id)
+        for attempt in range(self.max_attempts):
+            remaining = time_left()
+            if remaining is not None and remaining < self.min_time_left:
+                raise ModelUnavailable(f"{remaining:.1f}s left, not calling {model_id}")
+            wait = self.queue_timeout if remaining is None else min(self.queue_timeout, remaining - self.min_time_left)
+            if not limiter.acquire(wait):
+                raise ModelUnavailable(f"No free slot for {model_id} within {wait:.1f}s")
+            #Asked last: a half-open breaker hands out its one trial only to a call that will be made
+            if not breaker.allow():
+                limiter.release(called=False)
+                tracing.metric("circuit_open", 1)
+                raise ModelUnavailable(f"Circuit open for {model_id}")
+
+            throttled = False
+            try:
+                result = function()
+            except Exception as e:
+                kind = error_kind(e)
+                if kind is None:
+                    #The model answered, the request itself was bad: not a health problem
+                    breaker.record_success()
+                    raise
+                throttled = kind == "throttle"
+                tracing.metric("model_throttles" if throttled else "model_errors", 1)
+                if breaker.record_failure():
+                    logger.warning(f"Circuit opened for {model_id} after {breaker.failures} failures")
+                error = e
+            else:
+                breaker.record_success()
+                return result
+            finally:
+                limiter.release(throttled)
+
+            #Full jitter, and no retry that the deadline cannot wait for
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            remaining = time_left()
+            if attempt == self.max_attempts - 1 or (remaining is not None and remaining - delay < self.min_time_left):
+                break
+            logger.info(f"Retrying {model_id} in {delay:.2f}s after {type(error).__name__}: {str(error)}")
+            tracing.metric("model_retries", 1)
+            time.sleep(delay)
+        raise ModelUnavailable(f"{model_id} failed: {type(error).__name__}: {str(error)}") from error
+
+    def invoke_chat(self, stage, messages):
+        """Invoke the models of `stage` in order until one answers"""
+        errors = []
+        models = self.models(stage)
+        for model_id in models:
+            try:
+                response = self.call(model_id, lambda: self.chat(model_id).invoke(messages))
+            except ModelUnavailable as e:
+                logger.warning(f"{stage}: {str(e)}")
+                errors.append(str(e))
+                continue
+            if model_id != models[0]:
+                tracing.metric("model_fallback", 1)
+                tracing.set_property(f"{stage}_model", model_id)
+            return response
+        raise ModelUnavailable(f"No model available for {stage}: {'; '.join(errors)}")
+
+
+class InvokedEmbeddings:
+    """Embeddings whose Bedrock calls go through a ModelInvoker; everything else is delegated"""
+
+    def __init__(self, embeddings, invoker):
+        self.embeddings = embeddings
+        self.invoker = invoker
+
+    def embed_query(self, text):
+        return self.invoker.call(self.embeddings.model_id, lambda: self.embeddings.embed_query(text))
+
+    def embed_documents(self, texts):
+        return self.invoker.call(self.embeddings.model_id, lambda: self.embeddings.embed_documents(texts))
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
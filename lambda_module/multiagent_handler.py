@@ -1,54 +1,142 @@
-from langchain_aws import ChatBedrock, BedrockEmbeddings
-from langchain_elasticsearch import ElasticsearchStore, DenseVectorScriptScoreStrategy
 from langchain_core.prompts import ChatPromptTemplate
-from langgraph.graph import StateGraph, END
-from langdetect import detect
 from typing import List, Dict, Optional, TypedDict
-import boto3
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from dotenv import load_dotenv
 import os
+import time
+import logging
+
+import tracing
+from components import components
+from intent_classifier import IntentClassifier
+from response_cache import response_cache_from_env, depends_on_history
+from translation import TranslationService
+from language_id import LanguageIdentifier
+from vector_snapshot import load_snapshot
+from prompt_builder import PromptBuilder
+from query_understanding import QueryUnderstanding
+from model_invoker import ModelUnavailable
 
 load_dotenv()
 
-bedrock_client = boto3.client('bedrock-runtime', 
-                             region_name=os.environ.get("AWS_DEFAULT_REGION"),
-                            aws_access_key_id=os.environ.get("BEDROCK_AWS_ACCESS_KEY_ID"),
-                            aws_secret_access_key=os.environ.get("BEDROCK_AWS_SECRET_ACCESS_KEY"))
-
-bedrock_chat = ChatBedrock(
-        client=bedrock_client,
-        model_id=os.environ.get("BEDROCK_CHAT_MODEL_ID")
-)
-
-bedrock_embeddings = BedrockEmbeddings(
-    client=bedrock_client,
-    model_id=os.environ.get("BEDROCK_EMBEDDING_MODEL_ID")
-)
+logger = logging.getLogger(__name__)
+
+#Bedrock clients, knowledge base stores, snapshots and the compiled graph live in
+#the component registry and are created on first use (see components.py);
+#module attributes such as multiagent_handler.bedrock_chat still resolve to them
+def __getattr__(name):
+    if name in components:
+        return components.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@lru_cache(maxsize=1024)
+def embed_query_cached(query: str):
+    #Misses here go on to the content-addressed embedding cache, and only its misses to Bedrock
+    with tracing.span("embed_query"):
+        return tuple(components.bedrock_embeddings.embed_query(query))
+
+components.register("intent_classifier", lambda: IntentClassifier(embeddings=components.bedrock_embeddings))
+
+response_cache = response_cache_from_env()
+
+#Retrieval strategy per index:
+#  script - exact brute-force script scoring (works on any dense_vector mapping)
+#  knn    - HNSW approximate kNN, needs an indexed dense_vector (see scripts/reindex_knn.py)
+#  hybrid - BM25 combined with approximate kNN
+def retrieval_strategy(name: str):
+    from langchain_elasticsearch import DenseVectorScriptScoreStrategy, DenseVectorStrategy
+    if name == "knn":
+        return DenseVectorStrategy()
+    if name == "hybrid":
+        return DenseVectorStrategy(hybrid=True, rrf=os.environ.get("ES_HYBRID_RRF", "false").lower() == "true")
+    return DenseVectorScriptScoreStrategy()
+
+#Per-index setting (e.g. FINANCE_KB_STRATEGY) falling back to the global ES_ one
+def kb_setting(kb_prefix: str, name: str, default: str):
+    return os.environ.get(f"{kb_prefix}_{name}", os.environ.get(f"ES_{name}", default))
 
 #Instantiate ElasticsearchStore From Langchain
-def elasticsearch_store(index_name: str, embeddings: BedrockEmbeddings):
+def elasticsearch_store(index_name: str, embeddings, strategy: str = "script"):
+    from langchain_elasticsearch import ElasticsearchStore
     return ElasticsearchStore(
         es_url=os.environ.get("ELASTIC_URL"),
         es_api_key=os.environ.get("ELASTIC_API_KEY"),
         embedding=embeddings,
         index_name=index_name,
-        strategy=DenseVectorScriptScoreStrategy()
+        strategy=retrieval_strategy(strategy)
     )
 
 
-finance_kb = elasticsearch_store(index_name=os.environ.get("FINANCE_KB_INDEX"),
-                                 embeddings=bedrock_embeddings)
-
-food_kb = elasticsearch_store(index_name=os.environ.get("FOOD_KB_INDEX"),
-                                 embeddings=bedrock_embeddings)
-
-healthcare_kb = elasticsearch_store(index_name=os.environ.get("HEALTHCARE_KB_INDEX"),
-                                 embeddings=bedrock_embeddings)
+components.register("finance_kb", lambda: elasticsearch_store(index_name=os.environ.get("FINANCE_KB_INDEX"),
+                                                              embeddings=components.bedrock_embeddings,
+                                                              strategy=kb_setting("FINANCE_KB", "STRATEGY", "script")))
+
+components.register("food_kb", lambda: elasticsearch_store(index_name=os.environ.get("FOOD_KB_INDEX"),
+                                                           embeddings=components.bedrock_embeddings,
+                                                           strategy=kb_setting("FOOD_KB", "STRATEGY", "script")))
+
+components.register("healthcare_kb", lambda: elasticsearch_store(index_name=os.environ.get("HEALTHCARE_KB_INDEX"),
+                                                                 embeddings=components.bedrock_embeddings,
+                                                                 strategy=kb_setting("HEALTHCARE_KB", "STRATEGY", "script")))
+
+#Knowledge base component per intent
+knowledge_bases = {
+    "financial_aid": "finance_kb",
+    "healthcare": "healthcare_kb",
+    "food_security": "food_kb",
+}
+
+def knowledge_base(intent: str):
+    return components.get(knowledge_bases[intent])
+
+kb_index_names = {
+    "financial_aid": os.environ.get("FINANCE_KB_INDEX"),
+    "healthcare": os.environ.get("HEALTHCARE_KB_INDEX"),
+    "food_security": os.environ.get("FOOD_KB_INDEX"),
+}
+
+#HNSW candidates per shard for the knn/hybrid strategies, ignored by script scoring
+kb_num_candidates = {
+    "financial_aid": int(kb_setting("FINANCE_KB", "NUM_CANDIDATES", "50")),
+    "healthcare": int(kb_setting("HEALTHCARE_KB", "NUM_CANDIDATES", "50")),
+    "food_security": int(kb_setting("FOOD_KB", "NUM_CANDIDATES", "50")),
+}
+
+#Local snapshots (scripts/export_snapshot.py) are memory-mapped on first use and
+#searched in-process; Elasticsearch stays the source of truth and the fallback
+@components.register("kb_snapshots")
+def load_kb_snapshots():
+    if os.environ.get("RETRIEVAL_BACKEND", "elasticsearch") != "local":
+        return {}
+    directory = os.environ.get("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+    verify = os.environ.get("SNAPSHOT_VERIFY", "true").lower() == "true"
+    snapshots = {}
+    for intent in knowledge_bases:
+        snapshot = load_snapshot(directory, kb_index_names[intent], es_client=knowledge_base(intent).client if verify else None)
+        if snapshot is not None:
+            snapshots[intent] = snapshot
+    return snapshots
 
 #Multi-Agent RAG Workflow
 
 #Intent Detection
 def detect_question_intent(query: str):
+    with tracing.span("intent"):
+        intent = classify_intent(query)
+    tracing.set_property("intent", intent)
+    return intent
+
+def classify_intent(query: str):
+    #Fast path: embedding classifier, the LLM is only asked about ambiguous queries
+    try:
+        intent, margin = components.intent_classifier.classify(query, query_vector=embed_query_cached(query))
+        if intent is not None:
+            return intent
+        logger.info(f"Ambiguous intent (margin {margin:.3f}), falling back to LLM")
+    except Exception as e:
+        logger.warning(f"Intent classifier failed, falling back to LLM: {str(e)}")
+
     intent_prompt = ChatPromptTemplate.from_messages([
     ("system", """
     You are an intent detection system for a chatbot that helps elderly users access support services. Your task is to classify user queries into one of the following intents:
@@ -82,50 +170,224 @@ def detect_question_intent(query: str):
     ("human", "Query: {query}\nIntent:")
 ])
     intent_messages = intent_prompt.format_messages(query=query)
-    intent_response = bedrock_chat.invoke(intent_messages)
-    intent = intent_response.content.strip()
+    tracing.metric("intent_llm_fallback", 1)
+    try:
+        with tracing.span("intent_llm"):
+            intent_response = components.model_invoker.invoke_chat("intent", intent_messages)
+    except ModelUnavailable as e:
+        #Without the LLM, a keyword match, or "other" to search every knowledge base
+        logger.warning(f"Intent model unavailable, guessing from keywords: {str(e)}")
+        return guess_intent(query) or "other"
+    intent = intent_response.content.strip().strip('"\'.').lower()
     return intent
 
-def identify_language(query: str):
-    return detect(query)
+language_identifier = LanguageIdentifier()
+
+def identify_language(query: str, user_id: Optional[str] = None):
+    with tracing.span("language_id"):
+        language = language_identifier.identify(query, user_id=user_id)
+    tracing.set_property("language", language)
+    return language
 
 #Translation Agent
+translation_service = TranslationService()
+
 def translate_query(query: str, source_language_code: str, target_language_code: str):
-    boto3_translate = boto3.client(service_name="translate",
-                               region_name=os.environ.get("AWS_DEFAULT_REGION"),
-                            aws_access_key_id=os.environ.get("TRANSLATE_AWS_ACCESS_KEY_ID"),
-                            aws_secret_access_key=os.environ.get("TRANSLATE_AWS_SECRET_ACCESS_KEY"))
-    translated_query_response = boto3_translate.translate_text(Text=query, SourceLanguageCode=source_language_code, TargetLanguageCode=target_language_code)
-    return translated_query_response['TranslatedText']
+    with tracing.span("translate"):
+        return translation_service.translate(query, source_language=source_language_code, target_language=target_language_code)
 
 #Document Retrieval Agent
-def document_retrieval(intent: str, query: str):
-    if (intent == "financial_aid"):
-        similar_response = finance_kb.similarity_search(query=query,k=3)
-    elif (intent == "healthcare"):
-        similar_response = healthcare_kb.similarity_search(query=query,k=3)
-    elif (intent == "food_security"):
-        similar_response = food_kb.similarity_search(query=query,k=3)
-    else:
-        documents = []
-        
-    if (intent not in ["financial_aid","healthcare","food_security"]):
-        documents = []
+def with_num_candidates(num_candidates: int):
+    #similarity_search_with_score takes no fetch_k, so set the kNN candidates on the query body
+    def custom_query(query_body, query):
+        if "knn" in query_body:
+            query_body["knn"]["num_candidates"] = max(num_candidates, query_body["knn"].get("k", 0))
+        return query_body
+    return custom_query
+
+def search_knowledge_base(intent: str, query: str, k: int = 3):
+    """Return [(text, score)] from one knowledge base, best first.
+
+    Scores are only comparable within one index: script scoring and snapshots
+    give cosine + 1, kNN (1 + cosine) / 2, and hybrid stores none (None).
+    """
+    with tracing.span(f"retrieval.{intent}"):
+        snapshot = components.kb_snapshots.get(intent)
+        if snapshot is not None:
+            try:
+                return snapshot.search(embed_query_cached(query), k=k)
+            except Exception as e:
+                logger.warning(f"Local snapshot search failed, using Elasticsearch: {str(e)}")
+
+        store = knowledge_base(intent)
+        try:
+            similar_response = store.similarity_search_with_score(query=query, k=k, custom_query=with_num_candidates(kb_num_candidates[intent]))
+        except ValueError:
+            #Hybrid stores do not expose scores, only their order
+            similar_response = [(document, None) for document in store.similarity_search(query=query, k=k, fetch_k=kb_num_candidates[intent])]
+        return [(document.page_content, score) for document, score in similar_response]
+
+#Reciprocal rank fusion constant: ranks from indices with different score scales are merged as 1 / (RRF_K + rank)
+RRF_K = 60
+
+def multi_index_retrieval(query: str, k: int = 3, timeout: Optional[float] = None):
+    """Search every knowledge base concurrently and fuse the top-k by rank.
+
+    Each index gets its own thread, so `timeout` only counts its search; an
+    index that has not answered by then is left out and the slowest index
+    cannot hold up the reply.
+    """
+    timeout = timeout if timeout is not None else float(os.environ.get("RETRIEVAL_INDEX_TIMEOUT", "2.0"))
+    search = tracing.bind(search_knowledge_base)
+    executor = ThreadPoolExecutor(max_workers=len(knowledge_bases))
+    try:
+        futures = {intent: executor.submit(search, intent, query, k) for intent in knowledge_bases}
+        deadline = time.monotonic() + timeout
+
+        fused = {}
+        for intent, future in futures.items():
+            try:
+                results = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except TimeoutError:
+                logger.warning(f"Retrieval from {intent} timed out after {timeout}s")
+                continue
+            except Exception as e:
+                logger.warning(f"Retrieval from {intent} failed: {str(e)}")
+                continue
+            for rank, (text, _) in enumerate(results, start=1):
+                fused[text] = fused.get(text, 0.0) + 1.0 / (RRF_K + rank)
+    finally:
+        #A search still running finishes in the background; it holds none of the shared workers
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [text for text, _ in ranked[:k]]
 
-    documents = [document.page_content for document in similar_response]
-    
-    return documents
+def document_retrieval(intent: str, query: str):
+    #"other" or an unrecognised label: the right knowledge base is unknown, search them all
+    if (intent not in knowledge_bases):
+        return multi_index_retrieval(query=query, k=3)
+    return [text for text, _ in search_knowledge_base(intent, query, k=3)]
+
+#Runs the intent agent alongside translation when query understanding falls back
+retrieval_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("RETRIEVAL_WORKERS", "6")))
+
+#Speculative Retrieval
+INTENT_KEYWORDS = {
+    "financial_aid": ["comcare", "voucher", "payout", "financial", "cdc", "silver support", "grant", "subsid"],
+    "healthcare": ["doctor", "clinic", "hospital", "dementia", "medical", "medisave", "medishield", "teleconsult", "chas"],
+    "food_security": ["food", "meal", "grocer", "hungry", "rice"],
+}
+
+def guess_intent(query: str):
+    #Cheap keyword guess, only used to start retrieval before the intent agent answers
+    text = query.lower()
+    matches = [intent for intent, keywords in INTENT_KEYWORDS.items() if any(keyword in text for keyword in keywords)]
+    return matches[0] if len(matches) == 1 else None
+
+def english_query(query: str, user_id: Optional[str] = None):
+    source_language = identify_language(query=query, user_id=user_id)
+    if (source_language != "en"):
+        return source_language, translate_query(query=query, source_language_code=source_language, target_language_code="en")
+    return source_language, query
+
+#Query understanding:
+#  pipeline - embedding/LLM intent, language identification and AWS Translate (detect_intent and prepare_query)
+#  single   - one Bedrock call returning intent, language and an English query (understand),
+#             falling back to the pipeline when its answer does not validate
+understanding_mode = os.environ.get("UNDERSTANDING_MODE", "pipeline").lower()
+query_understanding = QueryUnderstanding()
 
 #Search Agent
 
 #Define the state
 class ChatState(TypedDict):
     query: str
+    user_id: Optional[str]
     chat_history: List[Dict[str,str]]
     context: Optional[List[str]]
     response: Optional[str]
+    intent: Optional[str]
+    language: Optional[str]
+    translated_query: Optional[str]
+    likely_intent: Optional[str]
+    prefetched_context: Optional[List[str]]
+    cacheable: Optional[bool]
+    cached_response: Optional[str]
+    token_counts: Optional[Dict[str,Optional[int]]]
 
 #Define the nodes
+#Nodes that run in the same step only return the keys they own, so that
+#LangGraph can merge their updates without conflicts.
+
+#Intent Detection Node
+def detect_intent_node(state: ChatState) -> dict:
+    return {"intent": detect_question_intent(query=state["query"])}
+
+#Language Detection and Translation Node
+def prepare_query_node(state: ChatState) -> dict:
+    source_language, translated_query = english_query(query=state["query"], user_id=state.get("user_id"))
+    update = {"language": source_language, "translated_query": translated_query, "likely_intent": None}
+
+    #Start retrieval as soon as the English query exists if the intent is likely
+    likely_intent = guess_intent(translated_query)
+    if likely_intent:
+        update["likely_intent"] = likely_intent
+        update["prefetched_context"] = document_retrieval(intent=likely_intent, query=translated_query)
+    return update
+
+#Single-call Understanding Node
+def understand_node(state: ChatState) -> dict:
+    query, user_id = state["query"], state.get("user_id")
+    try:
+        with tracing.span("understand"):
+            understanding = query_understanding.understand(query, chat_history=state["chat_history"])
+    except Exception as e:
+        logger.warning(f"Query understanding failed, using the pipeline: {str(e)}")
+        tracing.metric("understanding_fallback", 1)
+        intent = retrieval_executor.submit(tracing.bind(detect_question_intent), query)
+        source_language, translated_query = english_query(query=query, user_id=user_id)
+        return {"intent": intent.result(), "language": source_language, "translated_query": translated_query, "likely_intent": None}
+
+    tracing.metric("understanding_fallback", 0)
+    tracing.set_property("intent", understanding["intent"])
+    tracing.set_property("language", understanding["language"])
+    #Short follow-ups on the pipeline path reuse the language remembered here
+    if user_id:
+        language_identifier.user_languages.set(user_id, understanding["language"])
+    return {"intent": understanding["intent"], "language": understanding["language"],
+            "translated_query": understanding["english_query"], "likely_intent": None}
+
+#Document Retrieval Node (joins intent and translation)
+def retrieve_documents_node(state: ChatState) -> dict:
+    prefetched = bool(state.get("likely_intent")) and state["likely_intent"] == state["intent"]
+    tracing.metric("prefetch_hit", int(prefetched))
+    if prefetched:
+        return {"context": state["prefetched_context"]}
+    return {"context": document_retrieval(intent=state["intent"], query=state["translated_query"])}
+
+#Response Cache Node (joins intent and translation)
+def check_cache_node(state: ChatState) -> dict:
+    if response_cache is None:
+        return {"cacheable": False, "cached_response": None}
+    if depends_on_history(state["translated_query"], state["chat_history"]):
+        response_cache.skip()
+        return {"cacheable": False, "cached_response": None}
+    query_vector = embed_query_cached(state["translated_query"])
+    with tracing.span("cache_lookup"):
+        cached_response = response_cache.lookup(query_vector, intent=state["intent"], language=state["language"])
+    tracing.metric("response_cache_hit", int(cached_response is not None))
+    return {"cacheable": True, "cached_response": cached_response}
+
+def route_after_cache(state: ChatState) -> str:
+    return "answer_from_cache" if state.get("cached_response") else "retrieve_documents"
+
+#Answer from the cache without calling Bedrock
+def answer_from_cache_node(state: ChatState) -> ChatState:
+    state["chat_history"].append({"role": "user", "content": state["query"]})
+    state["chat_history"].append({"role": "bot", "content": state["cached_response"]})
+    state["response"] = state["cached_response"]
+    return state
 
 #Node 1: Add user query to chat history
 def add_user_query_node(state: ChatState) -> ChatState:
@@ -133,97 +395,43 @@ def add_user_query_node(state: ChatState) -> ChatState:
     return state
 
 #Node 2: Generate response
+prompt_builder = PromptBuilder()
 
 def generate_response_node(state: ChatState) -> ChatState:
-    PROMPT_TEMPLATE = """The following is a helpful conversation between a social worker AI and a human. 
-    The AI provides detailed and accurate information based on available resources. If unsure, it transparently states it does not know.
-
-    Always reply in the original user language.
-
-    AI's Role:
-    - You are a social worker specializing in Financial Support, Medical Support, and Food Bank Aid in Singapore.
-    - Your mission is to assist users by providing guidance on government schemes, Care Corner Singapore programs, and relevant community support.
-    - If the user's question is unrelated, politely redirect them to relevant topics.
-
-    Guidelines:
-    1. If you don’t have an answer, say: "I’m sorry, I don’t have that information. Would you like help with financial aid, healthcare support, or food assistance?"
-    2. Ensure responses are **clear, actionable, and concise**.
-    3. Avoid generic responses—refer to **specific** government and non-profit programs when possible.
-    4. Keep the tone **empathetic and supportive**.
-
-    ### Example Conversations:
-
-    #### **English Example**  
-    User: "Can I get financial assistance for my mother’s medical bills?"
-    AI: "Yes! You can check the **MediFund scheme**, which helps low-income individuals with medical costs. You may also qualify for **ComCare Short-to-Medium-Term Assistance (SMTA)**. Would you like help checking your eligibility?"
-
-    User: "What are some food aid programs available?"
-    AI: "There are several food assistance programs! **Meals-on-Wheels** delivers free meals to homebound elderly, and **Willing Hearts** provides daily meals. Would you like details on eligibility or how to apply?"
-
-    ---
-
-    #### **Mandarin (华语) Example**  
-    用户: *我可以申请医疗费用的经济援助吗？*  
-    AI: *可以！您可以查看 **MediFund 计划**，它为低收入人士提供医疗费用援助。此外，您可能符合 **ComCare 短期到中期援助 (SMTA)** 的资格。您需要我帮您检查资格吗？*  
-
-    用户: *新加坡有哪些食品援助计划？*  
-    AI: *有几个食品援助计划！**Meals-on-Wheels** 为行动不便的老年人提供免费膳食，**Willing Hearts** 每天提供餐食。您想了解申请资格吗？*  
-
-    ---
-
-    #### **Malay (Bahasa Melayu) Example**  
-    Pengguna: *Bagaimana saya boleh mendapatkan bantuan kewangan untuk bil perubatan ibu saya?*  
-    AI: *Anda boleh memohon **skim MediFund**, yang membantu individu berpendapatan rendah menampung kos perubatan. Anda juga mungkin layak untuk **Bantuan Jangka Pendek hingga Sederhana ComCare (SMTA)**. Mahu saya bantu menyemak kelayakan anda?*  
-
-    Pengguna: *Apakah program bantuan makanan yang tersedia?*  
-    AI: *Terdapat beberapa program bantuan makanan! **Meals-on-Wheels** menghantar makanan percuma kepada warga emas yang uzur, dan **Willing Hearts** menyediakan makanan harian. Adakah anda ingin tahu tentang kelayakan atau cara memohon?*  
-
-    ---
-
-    #### **Tamil (தமிழ்) Example**  
-    பயனர்: *என் அம்மாவின் மருத்துவ செலவுகளுக்காக நான் நிதி உதவியை பெற முடியுமா?*  
-    AI: *ஆமாம்! **MediFund திட்டம்** குறைந்த வருமானம் உள்ளவர்களுக்கு மருத்துவ செலவுகளை உதவுகிறது. நீங்கள் **ComCare குறுகிய முதல் நடுத்தர கால உதவிக்கு (SMTA)** தகுதியானவராக இருக்கலாம். உங்கள் தகுதியை நான் சரிபார்க்க வேண்டுமா?*  
-
-    பயனர்: *உணவு உதவித் திட்டங்கள் என்னென்ன?*  
-    AI: *பல உணவு உதவித் திட்டங்கள் உள்ளன! **Meals-on-Wheels** கண்காணிக்க முடியாத வயதானவர்களுக்கு இலவச உணவை வழங்குகிறது, மற்றும் **Willing Hearts** தினசரி உணவை வழங்குகிறது. தகுதி பற்றியும் விண்ணப்பிக்க பற்றியும் மேலும் தகவல் வேண்டுமா?*  
-
-    ---
-
-    <example>
-    User: Hi, what do you do?
-    Bot: Hello! I am here to assist with Financial Support, Medical Assistance, and Food Bank Aid in Singapore. How can I help you today?
-    </example>
-
-    Context from knowledge base:
-    <context>{context}</context>
-
-    Conversation history:
-    <messages>{history}</messages>
-
-    User's current question:
-    <question>{question}</question>
-
-    ### **How to Respond**
-    - Think carefully before responding. 
-    - Ensure your response is **helpful, specific, and relevant**.
-    - Wrap your response inside `<response>...</response>` tags.
-    """
-
-    chat_prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-
-    #Format the prompt with the query, context, and chat history
-    messages = chat_prompt.format_messages(
-        question=state["query"],
-        context=state["context"],  # Retrieved documents or context
-        history="\n".join([f"{msg['role']}: {msg['content']}" for msg in state["chat_history"]])
-    )
+    #Only the examples for the reply language, and context/history within the token budget
+    with tracing.span("prompt_build"):
+        messages, token_counts = prompt_builder.build(
+            question=state["query"],
+            context=state["context"],  # Retrieved documents, best first
+            chat_history=state["chat_history"],
+            language=state.get("language") or "en"
+        )
     
-    #Invoke Bedrock Chat
-    response = bedrock_chat.invoke(messages)
+    #Invoke Bedrock Chat, or answer from the documents when no model is available
+    try:
+        with tracing.span("generation"):
+            response = components.model_invoker.invoke_chat("response", messages)
+    except ModelUnavailable as e:
+        logger.warning(f"Response model unavailable, sending a degraded reply: {str(e)}")
+        tracing.metric("degraded_reply", 1)
+        response_text = degraded_reply(state["context"], state.get("language") or "en")
+        state["chat_history"].append({"role": "bot", "content": response_text})
+        state["response"] = response_text
+        state["cacheable"] = False
+        return state
     
     # Extract the response from <response> tags
     response_text = response.content.strip().split("<response>")[1].split("</response>")[0].strip()
     
+    usage = getattr(response, "usage_metadata", None) or {}
+    token_counts["input_tokens"] = usage.get("input_tokens")
+    token_counts["output_tokens"] = usage.get("output_tokens")
+    logger.info(f"Prompt token counts: {token_counts}")
+    for name, count in token_counts.items():
+        if count is not None:
+            tracing.metric(name, count)
+    state["token_counts"] = token_counts
+
     # Add the bot's response to the chat history
     state["chat_history"].append({"role": "bot", "content": response_text})
     
@@ -231,22 +439,118 @@ def generate_response_node(state: ChatState) -> ChatState:
     state["response"] = response_text
     return state
 
+DEGRADED_HEADER = "I can't give you a full answer right now. Here is some information that may help:"
+DEGRADED_NO_CONTEXT = "I'm sorry, I can't answer right now because the service is busy. Please try again in a few minutes."
+DEGRADED_DOCUMENTS = 2
+DEGRADED_DOCUMENT_CHARS = 400
+
+def degraded_reply(context: Optional[List[str]], language: str) -> str:
+    """A reply built from the top retrieved documents, for when generation is unavailable"""
+    documents = [document.strip() for document in (context or [])[:DEGRADED_DOCUMENTS] if document.strip()]
+    if not documents:
+        parts = [DEGRADED_NO_CONTEXT]
+    else:
+        parts = [DEGRADED_HEADER] + [document if len(document) <= DEGRADED_DOCUMENT_CHARS
+                                     else document[:DEGRADED_DOCUMENT_CHARS].rsplit(" ", 1)[0] + "..." for document in documents]
+    #The knowledge bases are in English; Translate is a separate service and usually still up.
+    #The fixed header comes from the cache and the excerpts go in one request
+    try:
+        with tracing.span("translate"):
+            parts = translation_service.translate_batch(parts, source_language="en", target_language=language)
+    except Exception as e:
+        logger.warning(f"Could not translate the degraded reply: {str(e)}")
+    return "\n\n".join(parts[:1] + [f"- {excerpt}" for excerpt in parts[1:]])
+
+#Node 3: Store the response for repeated questions
+def store_response_node(state: ChatState) -> dict:
+    if response_cache is not None and state.get("cacheable"):
+        query_vector = embed_query_cached(state["translated_query"])
+        response_cache.store(query_vector, intent=state["intent"], language=state["language"], response=state["response"])
+    return {}
+
 #Define graph
 def graph():
+    from langgraph.graph import StateGraph, START, END
+
     #Create the graph
     workflow = StateGraph(ChatState)
 
     #Add nodes to the graph
+    if understanding_mode == "single":
+        workflow.add_node("understand", understand_node)
+    else:
+        workflow.add_node("detect_intent", detect_intent_node)
+        workflow.add_node("prepare_query", prepare_query_node)
+    workflow.add_node("check_cache", check_cache_node)
+    workflow.add_node("answer_from_cache", answer_from_cache_node)
+    workflow.add_node("retrieve_documents", retrieve_documents_node)
     workflow.add_node("add_user_query", add_user_query_node)
     workflow.add_node("generate_response", generate_response_node)
+    workflow.add_node("store_response", store_response_node)
 
     #Define edges (order of execution)
+    if understanding_mode == "single":
+        workflow.add_edge(START, "understand")
+        workflow.add_edge("understand", "check_cache")
+    else:
+        #Fan out: intent detection and translation run in parallel
+        workflow.add_edge(START, "detect_intent")
+        workflow.add_edge(START, "prepare_query")
+        #Fan in: the cache lookup waits for both branches
+        workflow.add_edge(["detect_intent", "prepare_query"], "check_cache")
+    workflow.add_conditional_edges("check_cache", route_after_cache, ["answer_from_cache", "retrieve_documents"])
+    workflow.add_edge("answer_from_cache", END)
+    workflow.add_edge("retrieve_documents", "add_user_query")
     workflow.add_edge("add_user_query", "generate_response")
-    workflow.add_edge("generate_response", END)
-
-    #Set entry point
-    workflow.set_entry_point("add_user_query")
+    workflow.add_edge("generate_response", "store_response")
+    workflow.add_edge("store_response", END)
 
     #Compile the graph
     app = workflow.compile()
-    return app
\ No newline at end of file
+    return app
+
+#Compiled once per container, on the first turn, and shared by every request
+components.register("chat_app", graph)
+
+def run_chat(query: str, chat_history: List[Dict[str,str]], user_id: Optional[str] = None) -> ChatState:
+    """Run one conversation turn through the compiled graph without rebuilding it"""
+    state = {
+        "query": query,
+        "user_id": user_id,
+        "chat_history": chat_history,
+        "context": [],
+        "response": ""
+    }
+    return components.chat_app.invoke(state)
+
+def warm_up(embed: bool = False) -> Dict[str, float]:
+    """Do the one-off work of a first turn ahead of time, for scheduled warm-up invocations.
+
+    Returns milliseconds per step; a failing step is logged and skipped. With
+    `embed`, one tiny embedding call opens the Bedrock connection and the
+    intent exemplars are embedded (unless precomputed vectors are configured).
+    """
+    steps = [
+        ("bedrock_clients", lambda: (components.model_invoker, components.bedrock_chat, components.bedrock_embeddings)),
+        ("graph", lambda: components.chat_app),
+        ("knowledge_bases", lambda: [knowledge_base(intent) for intent in knowledge_bases]),
+        ("snapshots", lambda: components.kb_snapshots),
+        ("translate_client", lambda: translation_service.client),
+        ("language_profiles", language_identifier.load),
+        ("prompts", lambda: prompt_builder.build(question="hello", context=[], chat_history=[], language="en")),
+    ]
+    if embed:
+        steps.append(("embedding", lambda: embed_query_cached("hello")))
+    if embed or os.environ.get("INTENT_EXEMPLAR_VECTORS"):
+        steps.append(("intent_exemplars", lambda: components.intent_classifier.exemplar_vectors()))
+
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"Warm-up timings (ms): {timings}")
+    return timings
@@ -0,0 +1,173 @@
+import os
+import re
+from langchain_core.prompts import ChatPromptTemplate
+
+PROMPT_HEADER = """The following is a helpful conversation between a social worker AI and a human. 
+    The AI provides detailed and accurate information based on available resources. If unsure, it transparently states it does not know.
+
+    Always reply in the original user language.
+
+    AI's Role:
+    - You are a social worker specializing in Financial Support, Medical Support, and Food Bank Aid in Singapore.
+    - Your mission is to assist users by providing guidance on government schemes, Care Corner Singapore programs, and relevant community support.
+    - If the user's question is unrelated, politely redirect them to relevant topics.
+
+    Guidelines:
+    1. If you don’t have an answer, say: "I’m sorry, I don’t have that information. Would you like help with financial aid, healthcare support, or food assistance?"
+    2. Ensure responses are **clear, actionable, and concise**.
+    3. Avoid generic responses—refer to **specific** government and non-profit programs when possible.
+    4. Keep the tone **empathetic and supportive**.
+
+    ### Example Conversations:
+
+"""
+
+#Few-shot examples per reply language (AWS Translate codes); only the detected one is sent
+LANGUAGE_EXAMPLES = {
+    "en": """    #### **English Example**  
+    User: "Can I get financial assistance for my mother’s medical bills?"
+    AI: "Yes! You can check the **MediFund scheme**, which helps low-income individuals with medical costs. You may also qualify for **ComCare Short-to-Medium-Term Assistance (SMTA)**. Would you like help checking your eligibility?"
+
+    User: "What are some food aid programs available?"
+    AI: "There are several food assistance programs! **Meals-on-Wheels** delivers free meals to homebound elderly, and **Willing Hearts** provides daily meals. Would you like details on eligibility or how to apply?"
+
+""",
+    "zh": """    #### **Mandarin (华语) Example**  
+    用户: *我可以申请医疗费用的经济援助吗？*  
+    AI: *可以！您可以查看 **MediFund 计划**，它为低收入人士提供医疗费用援助。此外，您可能符合 **ComCare 短期到中期援助 (SMTA)** 的资格。您需要我帮您检查资格吗？*  
+
+    用户: *新加坡有哪些食品援助计划？*  
+    AI: *有几个食品援助计划！**Meals-on-Wheels** 为行动不便的老年人提供免费膳食，**Willing Hearts** 每天提供餐食。您想了解申请资格吗？*  
+
+""",
+    "ms": """    #### **Malay (Bahasa Melayu) Example**  
+    Pengguna: *Bagaimana saya boleh mendapatkan bantuan kewangan untuk bil perubatan ibu saya?*  
+    AI: *Anda boleh memohon **skim MediFund**, yang membantu individu berpendapatan rendah menampung kos perubatan. Anda juga mungkin layak untuk **Bantuan Jangka Pendek hingga Sederhana ComCare (SMTA)**. Mahu saya bantu menyemak kelayakan anda?*  
+
+    Pengguna: *Apakah program bantuan makanan yang tersedia?*  
+    AI: *Terdapat beberapa program bantuan makanan! **Meals-on-Wheels** menghantar makanan percuma kepada warga emas yang uzur, dan **Willing Hearts** menyediakan makanan harian. Adakah anda ingin tahu tentang kelayakan atau cara memohon?*  
+
+""",
+    "ta": """    #### **Tamil (தமிழ்) Example**  
+    பயனர்: *என் அம்மாவின் மருத்துவ செலவுகளுக்காக நான் நிதி உதவியை பெற முடியுமா?*  
+    AI: *ஆமாம்! **MediFund திட்டம்** குறைந்த வருமானம் உள்ளவர்களுக்கு மருத்துவ செலவுகளை உதவுகிறது. நீங்கள் **ComCare குறுகிய முதல் நடுத்தர கால உதவிக்கு (SMTA)** தகுதியானவராக இருக்கலாம். உங்கள் தகுதியை நான் சரிபார்க்க வேண்டுமா?*  
+
+    பயனர்: *உணவு உதவித் திட்டங்கள் என்னென்ன?*  
+    AI: *பல உணவு உதவித் திட்டங்கள் உள்ளன! **Meals-on-Wheels** கண்காணிக்க முடியாத வயதானவர்களுக்கு இலவச உணவை வழங்குகிறது, மற்றும் **Willing Hearts** தினசரி உணவை வழங்குகிறது. தகுதி பற்றியும் விண்ணப்பிக்க பற்றியும் மேலும் தகவல் வேண்டுமா?*  
+
+""",
+}
+
+PROMPT_FOOTER = """    <example>
+    User: Hi, what do you do?
+    Bot: Hello! I am here to assist with Financial Support, Medical Assistance, and Food Bank Aid in Singapore. How can I help you today?
+    </example>
+
+    Context from knowledge base:
+    <context>{context}</context>
+
+    Conversation history:
+    <messages>{history}</messages>
+
+    User's current question:
+    <question>{question}</question>
+
+    ### **How to Respond**
+    - Think carefully before responding. 
+    - Ensure your response is **helpful, specific, and relevant**.
+    - Wrap your response inside `<response>...</response>` tags.
+    """
+
+#CJK, Tamil and other non-ASCII characters cost about a token each, ASCII about a quarter
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+def estimate_tokens(text: str) -> int:
+    non_ascii = len(_NON_ASCII.findall(text))
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + "…"
+
+
+class PromptBuilder:
+    """Response prompts precompiled once per reply language, within a token budget.
+
+    `token_budget` is shared by the knowledge-base context and the
+    conversation history. History gets up to `history_share` of it, newest
+    turns first, and older turns are dropped and noted in one line. Context
+    documents fill the rest in retrieval rank order, and the last one that
+    fits is truncated. Unused history budget goes to the context.
+    """
+
+    def __init__(self, token_budget=None, history_share=0.4, max_message_tokens=300):
+        self.token_budget = int(token_budget or os.environ.get("PROMPT_TOKEN_BUDGET", "2000"))
+        self.history_share = history_share
+        self.max_message_tokens = max_message_tokens
+        self.templates = {
+            language: ChatPromptTemplate.from_template(PROMPT_HEADER + examples + PROMPT_FOOTER)
+            for language, examples in LANGUAGE_EXAMPLES.items()
+        }
+        self.template_tokens = {
+            language: estimate_tokens(PROMPT_HEADER + examples + PROMPT_FOOTER)
+            for language, examples in LANGUAGE_EXAMPLES.items()
+        }
+
+    def fit_history(self, chat_history, budget):
+        lines, used = [], 0
+        for position in range(len(chat_history) - 1, -1, -1):
+            message = chat_history[position]
+            line = f"{message['role']}: {truncate_to_tokens(message['content'], self.max_message_tokens)}"
+            tokens = estimate_tokens(line) + 1
+            if used + tokens > budget:
+                lines.append(f"({position + 1} earlier messages omitted)")
+                break
+            lines.append(line)
+            used += tokens
+        lines.reverse()
+        return "\n".join(lines), used, len(chat_history) - sum(1 for line in lines if not line.startswith("("))
+
+    def fit_context(self, documents, budget):
+        kept, used = [], 0
+        for document in documents:
+            tokens = estimate_tokens(document) + 1
+            if used + tokens > budget:
+                remaining = budget - used - 1
+                if remaining > 50:
+                    kept.append(truncate_to_tokens(document, remaining))
+                    used = budget
+                break
+            kept.append(document)
+            used += tokens
+        return "\n\n".join(kept), used, len(documents) - len(kept)
+
+    def build(self, question: str, context, chat_history, language: str = "en"):
+        """Return (messages, token_counts) for one generation request"""
+        language = language if language in self.templates else "en"
+
+        #The current question is sent separately, not as part of the history
+        if chat_history and chat_history[-1].get("role") == "user" and chat_history[-1].get("content") == question:
+            chat_history = chat_history[:-1]
+
+        history, history_tokens, dropped_messages = self.fit_history(chat_history, int(self.token_budget * self.history_share))
+        context, context_tokens, dropped_documents = self.fit_context(context or [], self.token_budget - history_tokens)
+
+        messages = self.templates[language].format_messages(question=question, context=context, history=history)
+        token_counts = {
+            "prompt_tokens": self.template_tokens[language] + history_tokens + context_tokens + estimate_tokens(question),
+            "history_tokens": history_tokens,
+            "context_tokens": context_tokens,
+            "dropped_messages": dropped_messages,
+            "dropped_documents": dropped_documents,
+        }
+        return messages, token_counts
@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import logging
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import tracing
+from components import components
+from language_id import to_translate_code
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("financial_aid", "healthcare", "food_security", "other")
+
+#What the model must answer with; also used to validate the answer
+UNDERSTANDING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": list(INTENTS)},
+        "language": {"type": "string", "description": "ISO 639-1 code of the language the user wrote in, e.g. en, zh, ms, ta"},
+        "english_query": {"type": "string", "description": "The user's question in English, self-contained, for searching a knowledge base"},
+    },
+    "required": ["intent", "language", "english_query"],
+}
+
+UNDERSTANDING_PROMPT = """You read messages sent to a chatbot that helps elderly users in Singapore access support services.
+For each message, work out:
+
+- intent: one of
+  financial_aid (financial assistance programs, vouchers, payouts),
+  healthcare (healthcare services, dementia care, teleconsultation),
+  food_security (food banks, budget meals, grocery assistance),
+  other (anything else)
+- language: the ISO 639-1 code of the language the message is written in (en, zh, ms, ta, ...)
+- english_query: the question in English, as a standalone search query. If the message is a follow-up
+  to the previous turn (e.g. "how do I apply for it?"), replace references like "it" with what they refer to.
+  Keep names of schemes and places as they are.
+
+Answer with ONLY a JSON object matching this schema, without any other text:
+{schema}"""
+
+_LANGUAGE_CODE = re.compile(r"^[a-z]{2,3}(-[A-Za-z]{2,4})?$")
+
+#Previous-turn text beyond this is not needed to resolve a follow-up
+MAX_HISTORY_CHARS = 500
+
+
+class UnderstandingError(ValueError):
+    """The model's answer was not a valid understanding of the query"""
+
+
+def parse_understanding(text: str, query: str) -> dict:
+    """Validate the model's answer and return {"intent", "language", "english_query"}"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise UnderstandingError(f"No JSON object in {text[:200]!r}")
+    try:
+        answer = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise UnderstandingError(f"Invalid JSON: {str(e)}")
+    if not isinstance(answer, dict):
+        raise UnderstandingError("Answer is not a JSON object")
+
+    intent = str(answer.get("intent") or "").strip().lower().replace(" ", "_").replace("-", "_")
+    if intent not in INTENTS:
+        raise UnderstandingError(f"Unknown intent {answer.get('intent')!r}")
+
+    language = to_translate_code(str(answer.get("language") or "").strip().lower())
+    if not _LANGUAGE_CODE.match(language):
+        raise UnderstandingError(f"Invalid language code {answer.get('language')!r}")
+
+    english_query = answer.get("english_query")
+    if not isinstance(english_query, str) or not english_query.strip():
+        raise UnderstandingError("Missing english_query")
+    #A runaway rewrite is more likely an answer than a query
+    if len(english_query) > 4 * len(query) + 300:
+        raise UnderstandingError(f"english_query of {len(english_query)} characters for a {len(query)} character message")
+
+    return {"intent": intent, "language": language, "english_query": english_query.strip()}
+
+
+class QueryUnderstanding:
+    """Intent, language and an English retrieval query from one Bedrock call.
+
+    Replaces the intent call, language identification and AWS Translate of
+    the pipeline path. The call goes to the "understanding" model tier
+    (UNDERSTANDING_MODEL_IDS) unless a `chat` model is given. With
+    `use_history`, the last turn of the chat history is sent along so
+    follow-up questions are rewritten into standalone ones. Raises
+    UnderstandingError when the answer does not validate.
+    """
+
+    def __init__(self, chat=None, use_history=None):
+        self._chat = chat
+        self.use_history = (use_history if use_history is not None
+                            else os.environ.get("UNDERSTANDING_USE_HISTORY", "true").lower() == "true")
+        self.system_prompt = UNDERSTANDING_PROMPT.format(schema=json.dumps(UNDERSTANDING_SCHEMA))
+
+    def invoke(self, messages):
+        if self._chat is not None:
+            return self._chat.invoke(messages)
+        return components.model_invoker.invoke_chat("understanding", messages)
+
+    def messages(self, query: str, chat_history=None):
+        previous_turn = ""
+        if self.use_history and chat_history:
+            previous_user = next((m["content"] for m in reversed(chat_history) if m.get("role") == "user"), None)
+            previous_bot = next((m["content"] for m in reversed(chat_history) if m.get("role") == "bot"), None)
+            if previous_user:
+                previous_turn += f"Previous message: {previous_user[:MAX_HISTORY_CHARS]}\n"
+            if previous_bot:
+                previous_turn += f"Previous reply: {previous_bot[:MAX_HISTORY_CHARS]}\n"
+        return [SystemMessage(content=self.system_prompt), HumanMessage(content=f"{previous_turn}Message: {query}\nJSON:")]
+
+    def understand(self, query: str, chat_history=None) -> dict:
+        response = self.invoke(self.messages(query, chat_history))
+        usage = getattr(response, "usage_metadata", None) or {}
+        for name in ("input_tokens", "output_tokens"):
+            if usage.get(name) is not None:
+                tracing.metric(f"understanding_{name}", usage[name])
+        return parse_understanding(str(response.content), query)
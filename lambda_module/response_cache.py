@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+#Words that only make sense with the previous turns, e.g. "how do I apply for it?"
+FOLLOW_UP_WORDS = {"it", "its", "that", "this", "those", "these", "them", "they", "he", "she", "him", "her", "there", "same", "above", "again", "more"}
+
+
+def depends_on_history(query: str, chat_history) -> bool:
+    """True when an answer to `query` may depend on earlier turns of the conversation"""
+    previous_turns = [msg for msg in chat_history if msg.get("role") == "bot"]
+    if not previous_turns:
+        return False
+    words = re.findall(r"[a-z']+", query.lower())
+    return len(words) <= 3 or any(word in FOLLOW_UP_WORDS for word in words)
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+class MemoryCacheBackend:
+    """In-process LRU store, one NumPy matrix per (intent, language) partition"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def entries(self, partition):
+        #Returns (ids, vectors, created_at) for one partition, rebuilt only after writes
+        with self._lock:
+            if partition not in self._matrices:
+                ids = [entry_id for entry_id, entry in self._entries.items() if entry["partition"] == partition]
+                vectors = np.stack([self._entries[entry_id]["vector"] for entry_id in ids]) if ids else None
+                created_at = np.array([self._entries[entry_id]["created_at"] for entry_id in ids])
+                self._matrices[partition] = (ids, vectors, created_at)
+            return self._matrices[partition]
+
+    def get(self, entry_id):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(entry_id)
+            return entry["response"]
+
+    def put(self, partition, entry_id, vector, response, created_at):
+        with self._lock:
+            self._entries[entry_id] = {"partition": partition, "vector": vector, "response": response, "created_at": created_at}
+            self._matrices.pop(partition, None)
+
+    def delete(self, entry_ids):
+        with self._lock:
+            for entry_id in entry_ids:
+                entry = self._entries.pop(entry_id, None)
+                if entry is not None:
+                    self._matrices.pop(entry["partition"], None)
+
+    def evict(self, max_entries):
+        with self._lock:
+            while len(self._entries) > max_entries:
+                _, entry = self._entries.popitem(last=False)
+                self._matrices.pop(entry["partition"], None)
+
+
+class SQLiteCacheBackend:
+    """File-backed store standing in for a cache shared between containers"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS response_cache (
+                id TEXT PRIMARY KEY,
+                intent TEXT,
+                language TEXT,
+                vector BLOB,
+                response TEXT,
+                created_at REAL,
+                last_used REAL
+            )""")
+            connection.execute("CREATE INDEX IF NOT EXISTS response_cache_partition ON response_cache (intent, language)")
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=5)
+        return self._local.connection
+
+    def entries(self, partition):
+        rows = self._connection().execute(
+            "SELECT id, vector, created_at FROM response_cache WHERE intent = ? AND language = ?", partition
+        ).fetchall()
+        if not rows:
+            return [], None, np.array([])
+        ids = [row[0] for row in rows]
+        vectors = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        created_at = np.array([row[2] for row in rows])
+        return ids, vectors, created_at
+
+    def get(self, entry_id):
+        with self._connection() as connection:
+            row = connection.execute("SELECT response FROM response_cache WHERE id = ?", (entry_id,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE response_cache SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+            return row[0]
+
+    def put(self, partition, entry_id, vector, response, created_at):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry_id, partition[0], partition[1], vector.tobytes(), response, created_at, created_at)
+            )
+
+    def delete(self, entry_ids):
+        with self._connection() as connection:
+            connection.executemany("DELETE FROM response_cache WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+    def evict(self, max_entries):
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM response_cache WHERE id NOT IN (SELECT id FROM response_cache ORDER BY last_used DESC LIMIT ?)",
+                (max_entries,)
+            )
+
+
+class SemanticCache:
+    """Answers keyed on the English query embedding plus intent and reply language.
+
+    A lookup is a hit when the most similar stored query in the same
+    (intent, language) partition has cosine similarity >= `threshold` and is
+    younger than `ttl` seconds.
+    """
+
+    def __init__(self, backend, threshold=0.95, ttl=86400, max_entries=1000):
+        self.backend = backend
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+
+    def lookup(self, vector, intent: str, language: str):
+        ids, vectors, created_at = self.backend.entries((intent, language))
+        if vectors is None:
+            self.misses += 1
+            return None
+
+        expired = created_at < time.time() - self.ttl
+        if expired.any():
+            self.backend.delete([entry_id for entry_id, is_expired in zip(ids, expired) if is_expired])
+
+        similarities = vectors @ _normalize(vector)
+        similarities[expired] = -1.0
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            response = self.backend.get(ids[best])
+            if response is not None:
+                self.hits += 1
+                return response
+        self.misses += 1
+        return None
+
+    def store(self, vector, intent: str, language: str, response: str):
+        self.backend.put((intent, language), uuid.uuid4().hex, _normalize(vector), response, time.time())
+        self.backend.evict(self.max_entries)
+        self.stores += 1
+
+    def skip(self):
+        self.skipped += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "stores": self.stores,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+def response_cache_from_env():
+    """Build the cache from RESPONSE_CACHE_* settings, None when disabled"""
+    backend_name = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+    if backend_name == "none":
+        return None
+    if backend_name == "sqlite":
+        backend = SQLiteCacheBackend(os.environ.get("RESPONSE_CACHE_PATH", "/tmp/response_cache.db"))
+    else:
+        backend = MemoryCacheBackend()
+    return SemanticCache(
+        backend=backend,
+        threshold=float(os.environ.get("RESPONSE_CACHE_THRESHOLD", "0.95")),
+        ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "86400")),
+        max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    )
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+#The trace of the request being handled; LangGraph copies the context into its
+#node threads, other executors need bind()
+_current = ContextVar("trace", default=None)
+
+
+class _NullSpan:
+    """Span used when the request is not traced; entering and leaving it does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "start")
+
+    def __init__(self, trace, stage):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.add(self.stage, (time.perf_counter() - self.start) * 1000)
+        if exc_type is not None:
+            self.trace.set("failed_stage", self.stage)
+        return False
+
+
+class Trace:
+    """Stage durations, counters and properties of one request.
+
+    A stage or metric recorded more than once (e.g. one retrieval per index
+    for the same intent) keeps every value; EMF accepts arrays of values.
+    Spans may be recorded from several threads.
+    """
+
+    def __init__(self, name, namespace, properties=None):
+        self.name = name
+        self.namespace = namespace
+        self.timestamp = int(time.time() * 1000)
+        self.start = time.perf_counter()
+        self.durations = {}
+        self.metrics = {}
+        self.properties = dict(properties or {})
+        self._lock = threading.Lock()
+
+    def span(self, stage):
+        return _Span(self, stage)
+
+    def add(self, stage, ms):
+        with self._lock:
+            self.durations.setdefault(stage, []).append(round(ms, 2))
+
+    def metric(self, name, value, unit="Count"):
+        with self._lock:
+            self.metrics.setdefault(name, (unit, []))[1].append(value)
+
+    def set(self, key, value):
+        self.properties[key] = value
+
+    def to_emf(self):
+        """The trace as one CloudWatch Embedded Metric Format record"""
+        with self._lock:
+            values = {f"{stage}_ms": ms for stage, ms in self.durations.items()}
+            units = {f"{stage}_ms": "Milliseconds" for stage in self.durations}
+            for name, (unit, recorded) in self.metrics.items():
+                values[name] = recorded
+                units[name] = unit
+        values["total_ms"] = [round((time.perf_counter() - self.start) * 1000, 2)]
+        units["total_ms"] = "Milliseconds"
+
+        record = {
+            "_aws": {
+                "Timestamp": self.timestamp,
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [["Trace"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, unit in units.items()],
+                }],
+            },
+            **self.properties,
+            "Trace": self.name,
+        }
+        record.update({name: value[0] if len(value) == 1 else value for name, value in values.items()})
+        return record
+
+
+def _stdout(line):
+    #Lambda ships stdout to CloudWatch Logs, which extracts the metrics; the
+    #logging module's prefix would make the line unreadable as EMF
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+class Tracer:
+    """Starts sampled traces and writes each one as a single EMF line when it ends.
+
+    With mode "off", or for requests that are not sampled, no trace is
+    started and every span is the shared NULL_SPAN.
+    """
+
+    def __init__(self, mode="emf", sample_rate=1.0, namespace="WhatsAppAIBot", sink=None):
+        self.enabled = mode != "off" and sample_rate > 0
+        self.sample_rate = sample_rate
+        self.namespace = namespace
+        self.sink = sink or _stdout
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.environ.get("TRACING", "emf").lower(),
+            sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "1.0")),
+            namespace=os.environ.get("TRACE_NAMESPACE", "WhatsAppAIBot")
+        )
+
+    @contextmanager
+    def trace(self, name, **properties):
+        """Trace the enclosed request; yields the Trace, or None when it is not sampled"""
+        sampled = self.enabled and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+        trace = Trace(name, self.namespace, properties) if sampled else None
+        token = _current.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            if trace is not None:
+                trace.set("error", type(e).__name__)
+            raise
+        finally:
+            _current.reset(token)
+            if trace is not None:
+                self.sink(json.dumps(trace.to_emf(), ensure_ascii=False, default=str))
+
+
+tracer = Tracer.from_env()
+
+
+def trace(name, **properties):
+    return tracer.trace(name, **properties)
+
+
+def current():
+    return _current.get()
+
+
+def span(stage):
+    """Time the enclosed block as `stage` of the current trace"""
+    trace = _current.get()
+    if trace is None:
+        return NULL_SPAN
+    return _Span(trace, stage)
+
+
+def metric(name, value, unit="Count"):
+    trace = _current.get()
+    if trace is not None:
+        trace.metric(name, value, unit)
+
+
+def set_property(key, value):
+    trace = _current.get()
+    if trace is not None:
+        trace.set(key, value)
+
+
+def bind(function):
+    """Wrap `function` to record into the current trace from another thread"""
+    trace = _current.get()
+    if trace is None:
+        return function
+
+    def bound(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return bound
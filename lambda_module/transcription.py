@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import base64
+import logging
+
+import tracing
+from ttl_cache import TTLCache
+from components import components
+from model_invoker import ModelUnavailable
+
+logger = logging.getLogger(__name__)
+
+#Formats WhatsApp delivers voice notes and audio messages in
+SUPPORTED_AUDIO_TYPES = {"audio/ogg", "audio/mpeg", "audio/mp4", "audio/aac", "audio/amr"}
+
+TRANSCRIBE_PROMPT = ("Please transcribe this audio message exactly as spoken. Maintain the original language "
+                     "whether it's English, Chinese, Tamil, or any other language.")
+
+_AUDIO_PLACEHOLDER = "__AUDIO_BASE64__"
+
+
+class VoiceMessageError(Exception):
+    """A voice message that cannot be transcribed; `reply` is what the user is told"""
+
+    def __init__(self, message, reply):
+        super().__init__(message)
+        self.reply = reply
+
+
+class VoiceTranscriber:
+    """Fetch a WhatsApp voice message and transcribe it with Bedrock.
+
+    Media metadata is checked before anything is downloaded, the download is
+    streamed into one buffer and stopped at `max_bytes`, and transcriptions
+    are cached by media id so redelivered messages are not transcribed
+    twice. Each stage is a span of the current trace.
+    """
+
+    def __init__(self, whatsapp_client=None, bedrock_client=None, model_id=None, max_bytes=None, cache_size=None, cache_ttl=None,
+                 chunk_size=64 * 1024):
+        self._whatsapp_client = whatsapp_client
+        self._bedrock_client = bedrock_client
+        self.model_id = model_id or os.environ.get("TRANSCRIPTION_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+        self.max_bytes = int(max_bytes or os.environ.get("VOICE_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.chunk_size = chunk_size
+        self.cache = TTLCache(
+            maxsize=int(cache_size or os.environ.get("TRANSCRIPTION_CACHE_SIZE", "256")),
+            ttl=float(cache_ttl or os.environ.get("TRANSCRIPTION_CACHE_TTL", "86400"))
+        )
+
+    @property
+    def whatsapp_client(self):
+        return self._whatsapp_client or components.whatsapp_client
+
+    @property
+    def bedrock_client(self):
+        return self._bedrock_client or components.bedrock_runtime
+
+    def transcribe(self, media_id: str) -> str:
+        cached = self.cache.get(media_id)
+        tracing.metric("transcription_cache_hit", int(cached is not None))
+        if cached is not None:
+            logger.info(f"Using cached transcription of {media_id}")
+            return cached
+
+        start = time.perf_counter()
+        with tracing.span("voice_media_info"):
+            media_url, mime_type = self._media_info(media_id)
+        with tracing.span("voice_download"):
+            audio = self._download(media_url)
+        tracing.metric("voice_bytes", len(audio), "Bytes")
+        with tracing.span("transcribe"):
+            text = self._invoke(audio, mime_type)
+
+        logger.info(f"Voice message {media_id}: {len(audio)} bytes in {(time.perf_counter() - start) * 1000:.0f} ms")
+        self.cache.set(media_id, text)
+        return text
+
+    def _media_info(self, media_id):
+        response = self.whatsapp_client.get_media(media_id)
+        if response.status_code != 200:
+            raise VoiceMessageError(f"Error getting media URL: {response.text}",
+                                    "I couldn't process your voice message. Please try again.")
+        info = response.json()
+        #WhatsApp sends e.g. "audio/ogg; codecs=opus"
+        mime_type = info.get("mime_type", "audio/ogg").split(";")[0].strip()
+        if mime_type not in SUPPORTED_AUDIO_TYPES:
+            raise VoiceMessageError(f"Unsupported media type {mime_type}",
+                                    "I can only process voice and audio messages. Please try again or send a text message.")
+        if int(info.get("file_size") or 0) > self.max_bytes:
+            raise VoiceMessageError(f"Voice message of {info['file_size']} bytes is over the limit",
+                                    "Your voice message is too long for me. Please send a shorter one or a text message.")
+        return info["url"], mime_type
+
+    def _download(self, media_url):
+        too_long = VoiceMessageError("Voice message download is over the limit",
+                                     "Your voice message is too long for me. Please send a shorter one or a text message.")
+        response = self.whatsapp_client.download(media_url, stream=True)
+        try:
+            if response.status_code != 200:
+                raise VoiceMessageError(f"Error downloading media: {response.status_code}",
+                                        "I couldn't download your voice message. Please try again.")
+            if int(response.headers.get("Content-Length") or 0) > self.max_bytes:
+                raise too_long
+            audio = bytearray()
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                audio += chunk
+                if len(audio) > self.max_bytes:
+                    raise too_long
+            return audio
+        finally:
+            response.close()
+
+    def request_body(self, audio, mime_type) -> bytes:
+        """The invoke_model body, with the base64 audio spliced in rather than passed through json.dumps"""
+        body = json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 1024,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "audio", "source": {"type": "base64", "media_type": mime_type, "data": _AUDIO_PLACEHOLDER}},
+                        {"type": "text", "text": TRANSCRIBE_PROMPT}
+                    ]
+                }
+            ]
+        }).encode("utf-8")
+        prefix, suffix = body.split(_AUDIO_PLACEHOLDER.encode("utf-8"))
+        return b"".join((prefix, base64.b64encode(audio), suffix))
+
+    def _invoke(self, audio, mime_type):
+        body = self.request_body(audio, mime_type)
+        try:
+            response = components.model_invoker.call(
+                self.model_id, lambda: self.bedrock_client.invoke_model(modelId=self.model_id, body=body, contentType="application/json"))
+        except ModelUnavailable as e:
+            raise VoiceMessageError(f"Transcription model unavailable: {str(e)}",
+                                    "I can't listen to voice messages right now. Please try again later or send a text message.")
+        response_body = json.loads(response["body"].read())
+        return response_body["content"][0]["text"]
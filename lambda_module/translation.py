@@ -0,0 +1,97 @@
+import os
+import logging
+
+import tracing
+from ttl_cache import TTLCache
+from components import components
+
+logger = logging.getLogger(__name__)
+
+#AWS Translate rejects TranslateText requests above 10,000 bytes
+MAX_REQUEST_BYTES = 9000
+
+
+def needs_translation(text: str, source_language: str, target_language: str) -> bool:
+    if source_language == target_language:
+        return False
+    #Numbers, phone numbers, punctuation and emoji read the same in every language
+    return any(ch.isalpha() for ch in text)
+
+
+class TranslationService:
+    """AWS Translate behind one long-lived client and a bounded LRU/TTL cache"""
+
+    def __init__(self, client=None, cache_size=None, ttl=None):
+        self._client = client
+        self.cache = TTLCache(
+            maxsize=int(cache_size or os.environ.get("TRANSLATION_CACHE_SIZE", "2048")),
+            ttl=float(ttl or os.environ.get("TRANSLATION_CACHE_TTL", "86400"))
+        )
+
+    @property
+    def client(self):
+        return self._client or components.translate_runtime
+
+    def _translate_text(self, text: str, source_language: str, target_language: str) -> str:
+        response = self.client.translate_text(Text=text, SourceLanguageCode=source_language, TargetLanguageCode=target_language)
+        return response['TranslatedText']
+
+    def translate(self, text: str, source_language: str, target_language: str = "en") -> str:
+        if not needs_translation(text, source_language, target_language):
+            return text
+        key = (source_language, target_language, text)
+        translated = self.cache.get(key)
+        tracing.metric("translation_cache_hit", int(translated is not None))
+        if translated is None:
+            translated = self._translate_text(text, source_language, target_language)
+            self.cache.set(key, translated)
+        return translated
+
+    def translate_batch(self, texts, source_language: str, target_language: str = "en"):
+        """Translate many texts with as few Translate calls as possible.
+
+        Uncached single-line texts are joined with newlines into requests
+        under MAX_REQUEST_BYTES and split back afterwards; multi-line texts,
+        or a batch whose line count comes back changed, are sent one by one.
+        """
+        results = {}
+        pending = []
+        for text in dict.fromkeys(texts):
+            if not needs_translation(text, source_language, target_language):
+                results[text] = text
+                continue
+            translated = self.cache.get((source_language, target_language, text))
+            if translated is not None:
+                results[text] = translated
+            elif "\n" in text:
+                results[text] = self.translate(text, source_language, target_language)
+            else:
+                pending.append(text)
+
+        for group in self._request_groups(pending):
+            translated_lines = None
+            if len(group) > 1:
+                translated_lines = self._translate_text("\n".join(group), source_language, target_language).split("\n")
+                if len(translated_lines) != len(group):
+                    logger.warning("Batched translation changed the line count, translating one by one")
+                    translated_lines = None
+            if translated_lines is None:
+                translated_lines = [self._translate_text(text, source_language, target_language) for text in group]
+            for text, translated in zip(group, translated_lines):
+                self.cache.set((source_language, target_language, text), translated)
+                results[text] = translated
+
+        return [results[text] for text in texts]
+
+    @staticmethod
+    def _request_groups(texts):
+        group, size = [], 0
+        for text in texts:
+            text_size = len(text.encode("utf-8")) + 1
+            if group and size + text_size > MAX_REQUEST_BYTES:
+                yield group
+                group, size = [], 0
+            group.append(text)
+            size += text_size
+        if group:
+            yield group
@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#On-disk layout of one knowledge base snapshot, all files prefixed with the index name:
+#  <index>.vectors.npy  (n, dims) L2-normalized float32, or int8 with per-row scales
+#  <index>.scales.npy   (n,) float32 dequantization scales, int8 snapshots only
+#  <index>.offsets.npy  (n + 1,) int64 byte offsets of each document in the text blob
+#  <index>.text.bin     UTF-8 document texts, concatenated
+#  <index>.meta.json    index name, dtype, dims and the Elasticsearch version it was taken at
+
+
+def snapshot_paths(directory: str, index_name: str):
+    prefix = os.path.join(directory, index_name)
+    return {
+        "vectors": f"{prefix}.vectors.npy",
+        "scales": f"{prefix}.scales.npy",
+        "offsets": f"{prefix}.offsets.npy",
+        "text": f"{prefix}.text.bin",
+        "meta": f"{prefix}.meta.json",
+    }
+
+
+def index_version(es_client, index_name: str):
+    """Cheap fingerprint of an index: document count and highest sequence number"""
+    doc_count = es_client.count(index=index_name)["count"]
+    hits = es_client.search(index=index_name, size=1, sort=[{"_seq_no": "desc"}], source=False,
+                            seq_no_primary_term=True)["hits"]["hits"]
+    return {"doc_count": doc_count, "max_seq_no": hits[0]["_seq_no"] if hits else -1}
+
+
+def write_snapshot(directory: str, index_name: str, texts, vectors, version, dtype="float32"):
+    paths = snapshot_paths(directory, index_name)
+    os.makedirs(directory, exist_ok=True)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    if dtype == "int8":
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        np.save(paths["scales"], scales.astype(np.float32))
+        vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+    np.save(paths["vectors"], vectors)
+
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(blob) for blob in encoded])
+    np.save(paths["offsets"], offsets)
+    with open(paths["text"], "wb") as f:
+        for blob in encoded:
+            f.write(blob)
+
+    with open(paths["meta"], "w") as f:
+        json.dump({"index": index_name, "dtype": dtype, "dims": int(vectors.shape[1]), "created_at": time.time(), **version}, f)
+    return paths
+
+
+class VectorSnapshot:
+    """Memory-mapped, read-only copy of one knowledge base with a vectorized top-k"""
+
+    def __init__(self, directory: str, index_name: str):
+        paths = snapshot_paths(directory, index_name)
+        with open(paths["meta"]) as f:
+            self.meta = json.load(f)
+        self.index_name = index_name
+        self.vectors = np.load(paths["vectors"], mmap_mode="r")
+        self.scales = np.load(paths["scales"], mmap_mode="r") if self.meta["dtype"] == "int8" else None
+        self.offsets = np.load(paths["offsets"], mmap_mode="r")
+        self.text = np.memmap(paths["text"], dtype=np.uint8, mode="r") if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def document(self, position: int) -> str:
+        return bytes(self.text[self.offsets[position]:self.offsets[position + 1]]).decode("utf-8")
+
+    def search(self, query_vector, k=3):
+        """Return [(text, score)] best first, score = cosine similarity + 1 like the script strategy"""
+        if len(self) == 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors @ query
+        if self.scales is not None:
+            scores = scores * self.scales
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.document(position), float(scores[position]) + 1.0) for position in top]
+
+    def is_stale(self, es_client) -> bool:
+        current = index_version(es_client, self.index_name)
+        return current["doc_count"] != self.meta["doc_count"] or current["max_seq_no"] != self.meta["max_seq_no"]
+
+
+def load_snapshot(directory: str, index_name: str, es_client=None):
+    """Load a snapshot, or None when it is missing, unreadable or (if a client is given) stale"""
+    if not directory or not index_name or not os.path.exists(snapshot_paths(directory, index_name)["meta"]):
+        return None
+    try:
+        snapshot = VectorSnapshot(directory, index_name)
+        if es_client is not None and snapshot.is_stale(es_client):
+            logger.warning(f"Snapshot of {index_name} is stale, using Elasticsearch")
+            return None
+        return snapshot
+    except Exception as e:
+        logger.warning(f"Could not load snapshot of {index_name}: {str(e)}")
+        return None
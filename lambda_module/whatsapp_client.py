@@ -0,0 +1,112 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+#Sending a message is not idempotent: only retry when the request was certainly not processed
+SAFE_RETRY_STATUS_CODES = {429, 503}
+
+
+class WhatsAppClient:
+    """WhatsApp Graph API client over one keep-alive connection pool.
+
+    Every call has connect/read timeouts. Throttling, server errors and
+    connection failures are retried with exponential backoff and full
+    jitter, honouring Retry-After. Message sends are only retried when the
+    request cannot have been delivered.
+    """
+
+    def __init__(self, token=None, phone_number_id=None, base_url=None, api_version=None,
+                 connect_timeout=None, read_timeout=None, max_retries=None, backoff=0.5, max_backoff=4.0,
+                 pool_size=10):
+        self.token = token or os.environ.get('WHATSAPP_TOKEN')
+        self.phone_number_id = phone_number_id or os.environ.get('PHONE_NUMBER_ID')
+        self.base_url = (base_url or os.environ.get('GRAPH_API_URL', 'https://graph.facebook.com')).rstrip('/')
+        self.api_version = api_version or os.environ.get('GRAPH_API_VERSION', 'v17.0')
+        self.timeout = (float(connect_timeout or os.environ.get('GRAPH_API_CONNECT_TIMEOUT', '3.05')),
+                        float(read_timeout or os.environ.get('GRAPH_API_READ_TIMEOUT', '10')))
+        self.max_retries = int(max_retries if max_retries is not None else os.environ.get('GRAPH_API_MAX_RETRIES', '3'))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _headers(self):
+        return {'Authorization': f"Bearer {self.token}"}
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.max_backoff))
+        time.sleep(delay)
+
+    def request(self, method, url, idempotent=True, **kwargs):
+        retry_status_codes = RETRY_STATUS_CODES if idempotent else SAFE_RETRY_STATUS_CODES
+        kwargs.setdefault('timeout', self.timeout)
+        headers = {**self._headers(), **kwargs.pop('headers', {})}
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                #A read timeout on a send may mean the message went out
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if attempt == self.max_retries or not retryable:
+                    raise
+                logger.warning(f"Graph API {method} failed ({type(e).__name__}), retrying")
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code not in retry_status_codes or attempt == self.max_retries:
+                return response
+            logger.warning(f"Graph API {method} returned {response.status_code}, retrying")
+            response.close()
+            self._sleep_before_retry(attempt, response)
+
+    def send_text(self, to_number, message):
+        #Checked here rather than at creation: media downloads and warm-up do not need it
+        if not self.phone_number_id:
+            raise ValueError("PHONE_NUMBER_ID is not set: configure the WhatsApp business phone number id to send messages")
+        url = f"{self.base_url}/{self.api_version}/{self.phone_number_id}/messages"
+        data = {
+            'messaging_product': 'whatsapp',
+            'to': to_number,
+            'type': 'text',
+            'text': {'body': message}
+        }
+        response = self.request('POST', url, idempotent=False, json=data)
+        #An error body is not a reply: the caller must see the send failed to retry it
+        response.raise_for_status()
+        return response.json()
+
+    def get_media(self, media_id):
+        """Media metadata (url, mime_type, file_size) as a response object"""
+        return self.request('GET', f"{self.base_url}/{self.api_version}/{media_id}")
+
+    def download(self, media_url, stream=True):
+        return self.request('GET', media_url, stream=stream)
+
+
+class AsyncWhatsAppClient:
+    """asyncio front for WhatsAppClient; calls run on worker threads and share its connection pool"""
+
+    def __init__(self, client=None, **kwargs):
+        self.client = client or WhatsAppClient(**kwargs)
+
+    async def send_text(self, to_number, message):
+        return await asyncio.to_thread(self.client.send_text, to_number, message)
+
+    async def get_media(self, media_id):
+        return await asyncio.to_thread(self.client.get_media, media_id)
+
+    async def download(self, media_url, stream=True):
+        return await asyncio.to_thread(self.client.download, media_url, stream)
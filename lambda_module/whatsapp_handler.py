@@ -2,12 +2,17 @@ import json
 import os
 import sys
 import logging
-import requests
 import traceback
-import boto3
-import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from multiagent_handler import *
+import tracing
+from components import components
+from model_invoker import lambda_deadline, use_deadline
+from history_store import history_store_from_env
+from message_queue import message_queue_from_env
+from dedup import deduplicator_from_env
+from transcription import VoiceTranscriber, VoiceMessageError
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 lambda_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda_module')
@@ -19,15 +24,25 @@ if lambda_dir not in sys.path:
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-conversation_history = {}
+# Stores and clients are created on the first POST; webhook verification needs none of them
+components.register('history_store', history_store_from_env)
 
-boto3_bedrock = boto3.client('bedrock-runtime', 
-                             region_name=os.environ.get("AWS_DEFAULT_REGION"),
-                            aws_access_key_id=os.environ.get("BEDROCK_AWS_ACCESS_KEY_ID"),
-                            aws_secret_access_key=os.environ.get("BEDROCK_AWS_SECRET_ACCESS_KEY"))
+# WhatsApp redelivers webhooks on timeouts and errors, process each message id once
+components.register('deduplicator', deduplicator_from_env)
+
+# With ASYNC_PROCESSING the webhook only validates and enqueues messages
+async_processing = os.environ.get('ASYNC_PROCESSING', 'false').lower() == 'true'
+components.register('message_queue', message_queue_from_env)
+
+components.register('voice_transcriber', VoiceTranscriber)
 
 
 def handle(event, context):
+    # Scheduled warm-up ping, nothing is sent to WhatsApp
+    if is_warm_up(event):
+        # In async mode the worker answers messages, so only the webhook's own stores are needed here
+        return warm_up(event, pipeline=not async_processing)
+
     # Handle webhook verification
     if event['httpMethod'] == 'GET':
         query_params = event.get('queryStringParameters', {})
@@ -54,37 +69,15 @@ def handle(event, context):
 
     # Handle incoming messages (your existing POST logic)
     if event['httpMethod'] == 'POST':
-        body = json.loads(event['body'])
-        logger.info(f"Received WhatsApp webhook: {json.dumps(body)}")
-        # Extract message data
-        if 'messages' in body['entry'][0]['changes'][0]['value']:
-            message = body['entry'][0]['changes'][0]['value']['messages'][0]
-            phone_number = message['from']
-
-            message_type = message.get('type')
-
-            if message_type == 'text':
-                message_text = message['text']['body'].lower()
-                logger.info(f"Received message from {phone_number}: {message_text}")
-                response_text = get_claude_response(phone_number, message_text)
-                # response_text=''
-                logger.info(f"Sending response to {phone_number}: {response_text}")
-
-            elif message_type == 'audio' or message_type == 'voice':
-                # Handle voice message
-                logger.info(f"Received voice message from {phone_number}")
-                media_id = message['audio']['id']
-                response_text = process_voice_message(phone_number, media_id)
+        with tracing.trace('webhook'):
+            failed = handle_webhook(event, deadline=lambda_deadline(context))
+
+        if failed:
+            return {
+                'statusCode': 500,
+                'body': json.dumps({'status': 'error'})
+            }
 
-            else:
-                logger.info(f"Received unsupported message type: {message_type}")
-                response_text = "I can process text and voice messages. Please send one of those formats."
-            
-            logger.info(f"Sending response to {phone_number}: {response_text}")
-            # Send response back to WhatsApp
-            response = send_whatsapp_message(phone_number, response_text)
-            logger.info(f"WhatsApp API response: {json.dumps(response)}")   
-            
         return {
             'statusCode': 200,
             'body': json.dumps({'status': 'ok'})
@@ -96,41 +89,169 @@ def handle(event, context):
     }
 
 
-def get_claude_response(phone_number, message_text):
-    if phone_number not in conversation_history:
-        conversation_history[phone_number] = []
-    
-    # Add user message to history
-    conversation_history[phone_number].append({"role": "user", "content": message_text})
-    
-    # Limit conversation history to last 10 messages to avoid token limits
-    if len(conversation_history[phone_number]) > 10:
-        conversation_history[phone_number] = conversation_history[phone_number][-10:]
-    
+def handle_webhook(event, deadline=None):
+    """Claim, then enqueue or answer, the messages of one webhook POST; returns the ids that failed"""
+    with tracing.span('webhook_parse'):
+        body = json.loads(event['body'])
+        # Extract message data from every entry and change; status callbacks carry no messages
+        received = extract_messages(body)
+    logger.info(f"Received WhatsApp webhook with {len(received)} messages: {[message.get('id') for message in received]}")
+
+    deduplicator = components.deduplicator
+    messages = []
     try:
-        intent = detect_question_intent(query=message_text)
-        
-        source_language = identify_language(query=message_text)
+        with tracing.span('dedup'):
+            for message in received:
+                if deduplicator.claim(message.get('id')):
+                    messages.append(message)
+                else:
+                    logger.info(f"Skipping duplicate delivery of {message.get('id')} ({deduplicator.suppressed} suppressed so far)")
+        tracing.metric('messages', len(messages))
+        tracing.metric('duplicates', len(received) - len(messages))
 
-        translated_message = message_text
+        if async_processing:
+            # Acknowledge now, whatsapp_worker processes the messages and replies
+            message_queue = components.message_queue
+            failed = []
+            for message in messages:
+                try:
+                    with tracing.span('enqueue'):
+                        message_queue.send({'message': message}, group_id=message['from'], deduplication_id=message.get('id'))
+                    logger.info(f"Queued message from {message['from']}")
+                except Exception as e:
+                    logger.error(f"Error queueing message {message.get('id')}: {str(e)}")
+                    failed.append(message.get('id'))
+        else:
+            failed = process_by_sender([(message.get('id'), message) for message in messages], deadline=deadline)
+    except Exception:
+        # The webhook gets a 500; every claim must be given up or the redelivery is dropped as a duplicate
+        for message in messages:
+            deduplicator.release(message.get('id'))
+        raise
 
-        if (source_language != "en"):
-            translated_message = translate_query(query=message_text,source_language_code=source_language,target_language_code="en")
+    # Let WhatsApp's redelivery retry only the failed messages
+    for message_id in failed:
+        deduplicator.release(message_id)
+    return failed
 
-        similar_docs = document_retrieval(intent=intent, query=translated_message)
 
-        state = {
-            "query": message_text,
-            "chat_history": conversation_history[phone_number],
-            "context": similar_docs,
-            "response": ""
-        }
+def is_warm_up(event):
+    """EventBridge schedule events, or any event with "warmup": true, that are not API Gateway requests"""
+    return 'httpMethod' not in event and (event.get('warmup') is True or event.get('source') == 'aws.events')
+
+
+def warm_up(event, pipeline=True):
+    """Create this container's stores and, with `pipeline`, initialize the chat workflow"""
+    timings = {}
+    start = time.perf_counter()
+    components.deduplicator
+    components.history_store
+    components.whatsapp_client
+    if async_processing:
+        components.message_queue
+    timings['stores'] = round((time.perf_counter() - start) * 1000, 1)
+
+    if pipeline:
+        from multiagent_handler import warm_up as warm_up_pipeline
+        timings.update(warm_up_pipeline(embed=event.get('embed', False) is True))
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'status': 'warm', 'timings_ms': timings})
+    }
+
+
+def extract_messages(body):
+    """All messages across the entries and changes of one webhook payload"""
+    messages = []
+    for entry in body.get('entry', []):
+        for change in entry.get('changes', []):
+            messages.extend(change.get('value', {}).get('messages', []))
+    return messages
+
+
+def process_by_sender(items, concurrency=None, deadline=None):
+    """Process (item_id, message) pairs and return the ids that failed.
+
+    Senders are processed concurrently on a bounded pool and each sender's
+    messages in order. Once one of a sender's messages fails, the rest of
+    that sender's messages are failed too, so a retry cannot reorder them.
+    Model calls stop retrying near `deadline` (see model_invoker).
+    """
+    concurrency = concurrency or int(os.environ.get('SENDER_CONCURRENCY', '4'))
+    by_sender = {}
+    for item_id, message in items:
+        by_sender.setdefault(message['from'], []).append((item_id, message))
+    if not by_sender:
+        return []
 
-        graph_app = graph()
-        chat_response = graph_app.invoke(state)
+    def process_sender(sender_items):
+        failed = []
+        for item_id, message in sender_items:
+            if failed:
+                failed.append(item_id)
+                continue
+            try:
+                with use_deadline(deadline):
+                    process_message(message)
+            except Exception as e:
+                logger.error(f"Error processing message {item_id}: {str(e)}")
+                failed.append(item_id)
+        return failed
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(by_sender))) as executor:
+        return [item_id for failed in executor.map(process_sender, by_sender.values()) for item_id in failed]
+
+
+def process_message(message):
+    """Answer one WhatsApp message and send the reply, as one trace"""
+    with tracing.trace('message', message_type=message.get('type'), message_id=message.get('id')):
+        answer_message(message)
+
+
+def answer_message(message):
+    phone_number = message['from']
+
+    message_type = message.get('type')
+
+    if message_type == 'text':
+        message_text = message['text']['body'].lower()
+        logger.info(f"Received message from {phone_number}: {message_text}")
+        response_text = get_claude_response(phone_number, message_text)
+
+    elif message_type == 'audio' or message_type == 'voice':
+        # Handle voice message
+        logger.info(f"Received voice message from {phone_number}")
+        media_id = message['audio']['id']
+        response_text = process_voice_message(phone_number, media_id)
+
+    else:
+        logger.info(f"Received unsupported message type: {message_type}")
+        response_text = "I can process text and voice messages. Please send one of those formats."
+    
+    logger.info(f"Sending response to {phone_number}: {response_text}")
+    # Send response back to WhatsApp
+    with tracing.span('whatsapp_send'):
+        response = send_whatsapp_message(phone_number, response_text)
+    logger.info(f"WhatsApp API response: {json.dumps(response)}")
+
+
+def get_claude_response(phone_number, message_text):
+    try:
+        # The LangGraph workflow and its libraries load with the first message
+        from multiagent_handler import run_chat
+
+        # One read per turn; trimming and expiry are the store's policy
+        history_store = components.history_store
+        with tracing.span('history_load'):
+            chat_history, version = history_store.load(phone_number)
+        previous_length = len(chat_history)
+
+        chat_response = run_chat(query=message_text, chat_history=chat_history, user_id=phone_number)
 
         assistant_message = chat_response['response']
-        conversation_history[phone_number] = chat_response['chat_history']
+        with tracing.span('history_save'):
+            history_store.save(phone_number, chat_response['chat_history'], version, new_from=previous_length)
 
         return assistant_message
     
@@ -143,90 +264,21 @@ def get_claude_response(phone_number, message_text):
 def process_voice_message(phone_number, media_id):
     """Process voice messages by transcribing and sending to AI"""
     try:
-        # 1. Get the media URL from WhatsApp
-        url = f"https://graph.facebook.com/v17.0/{media_id}"
-        headers = {
-            'Authorization': f"Bearer {os.environ['WHATSAPP_TOKEN']}",
-        }
         logger.info('Received voice message')
-        
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            logger.error(f"Error getting media URL: {response.text}")
-            return "I couldn't process your voice message. Please try again."
-        
-        media_url = response.json().get('url')
-        
-        # 2. Download the audio data
-        response = requests.get(media_url, headers=headers)
-        if response.status_code != 200:
-            logger.error(f"Error downloading media: {response.text}")
-            return "I couldn't download your voice message. Please try again."
-        
-        audio_data = response.content
-        
-        # 3. Use Bedrock with Claude to transcribe the audio
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-        
-        # Call Bedrock with Claude
-        response = boto3_bedrock.invoke_model(
-            modelId='anthropic.claude-3-sonnet-20240229-v1:0',
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1024,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "audio",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "audio/ogg",  # Adjust based on WhatsApp's format
-                                    "data": audio_base64
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": "Please transcribe this audio message exactly as spoken. Maintain the original language whether it's English, Chinese, Tamil, or any other language."
-                            }
-                        ]
-                    }
-                ]
-            }),
-            contentType='application/json'
-        )
-        
-        # Parse the response to get the transcription
-        response_body = json.loads(response['body'].read().decode('utf-8'))
-        transcribed_text = response_body['content'][0]['text']
-        
+        transcribed_text = components.voice_transcriber.transcribe(media_id)
         logger.info(f"Transcribed text: {transcribed_text}")
-        
-        # 4. Process the transcribed text with your AI
+
         return get_claude_response(phone_number, transcribed_text)
-        # return ''
-        
+
+    except VoiceMessageError as e:
+        logger.warning(f"Rejected voice message {media_id}: {str(e)}")
+        return e.reply
+
     except Exception as e:
         logger.error(f"Error processing voice message: {str(e)}")
-        import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         return "I had trouble processing your voice message. Please try again or send a text message."
 
-        
+
 def send_whatsapp_message(to_number, message):
-    
-    url = f"https://graph.facebook.com/v17.0/599525519903076/messages"
-    headers = {
-        'Authorization': f"Bearer {os.environ['WHATSAPP_TOKEN']}",
-        'Content-Type': 'application/json'
-    }
-    data = {
-        'messaging_product': 'whatsapp',
-        'to': to_number,
-        'type': 'text',
-        'text': {'body': message}
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
-    return response.json()
\ No newline at end of file
+    return components.whatsapp_client.send_text(to_number, message)
@@ -0,0 +1,48 @@
+import json
+import os
+import time
+import logging
+
+from whatsapp_handler import process_by_sender, is_warm_up, warm_up
+from message_queue import message_queue_from_env
+from model_invoker import lambda_deadline
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', '4'))
+
+
+def process_batch(items, concurrency=WORKER_CONCURRENCY, deadline=None):
+    """Process queued (item_id, body) pairs and return the ids that failed"""
+    return process_by_sender([(item_id, body['message']) for item_id, body in items], concurrency=concurrency, deadline=deadline)
+
+
+def handle(event, context):
+    """SQS event source entry point, reporting partial batch failures"""
+    if is_warm_up(event):
+        return warm_up(event)
+    items = [(record['messageId'], json.loads(record['body'])) for record in event.get('Records', [])]
+    failed = process_batch(items, deadline=lambda_deadline(context))
+    return {'batchItemFailures': [{'itemIdentifier': item_id} for item_id in failed]}
+
+
+def run_local(queue=None, batch_size=None, concurrency=WORKER_CONCURRENCY, stop_when_empty=False):
+    """Drain a queue outside Lambda, e.g. MESSAGE_QUEUE_BACKEND=sqlite for local runs"""
+    queue = queue or message_queue_from_env()
+    batch_size = batch_size or int(os.environ.get('WORKER_BATCH_SIZE', '10'))
+    while True:
+        items = queue.receive(max_messages=batch_size)
+        if not items:
+            if stop_when_empty:
+                return
+            time.sleep(1)
+            continue
+        failed = set(process_batch(items, concurrency=concurrency))
+        for receipt, _ in items:
+            if receipt not in failed:
+                queue.delete(receipt)
+
+
+if __name__ == '__main__':
+    run_local()
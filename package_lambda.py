@@ -1,15 +1,47 @@
-import subprocess
-import shutil
+"""Build the Lambda artifacts: a dependency layer and a small handler zip.
+
+    python package_lambda.py                     # lambda_layer.zip + lambda_package.zip
+    python package_lambda.py --shake-langchain   # also drop langchain modules the handlers never import
+                                                 # (needs python3.11 for the smoke test, or --unverified-shake)
+    python package_lambda.py --budget-mb 150     # fail when the unzipped total is over 150 MB
+
+Dependencies are installed for the Lambda platform, stripped of tests, docs and
+type stubs, and precompiled to .pyc for the target Python so cold starts do not
+compile them (the deployment filesystem is read-only, so Lambda cannot cache
+bytecode itself). A size report per package is printed at the end.
+"""
+import argparse
+import glob
 import os
+import shutil
+import subprocess
 import sys
+import sysconfig
+from inspect import CO_OPTIMIZED
+from modulefinder import ModuleFinder
 
-def package_lambda():
-    # Create a temporary directory for packaging
-    if os.path.exists('package'):
-        shutil.rmtree('package')
-    os.makedirs('package')
+TARGET_PYTHON = '3.11'
 
-    with open('lambda_module/requirements.txt', 'r') as f:
+#Lambda's limit for a function and all its layers, unzipped
+DEFAULT_BUDGET_MB = 250
+
+#Directories and files that are never imported at runtime
+STRIP_DIRS = {'tests', 'test', '__pycache__'}
+#Only stripped when they are not Python packages (botocore.docs is imported by botocore)
+DOC_DIRS = {'docs', 'doc', 'examples', 'benchmarks'}
+STRIP_SUFFIXES = ('.pyi', '.pyx', '.pxd', '.c', '.h', '.cpp', '.md', '.rst')
+STRIP_FILES = {'py.typed', 'RECORD', 'INSTALLER'}
+
+#Installed with the langchain packages we use, but mostly never imported
+LANGCHAIN_PACKAGES = ['langchain', 'langchain_community', 'langchain_text_splitters', 'langchain_aws']
+
+#Imported after a shake, to catch modules that were only reachable dynamically
+SMOKE_IMPORTS = ['whatsapp_handler', 'whatsapp_worker', 'multiagent_handler', 'langchain_aws', 'langchain_elasticsearch',
+                 'langgraph.graph', 'langdetect.detector_factory', 'boto3']
+
+
+def install_requirements(target, requirements_file='lambda_module/requirements.txt'):
+    with open(requirements_file, 'r') as f:
         requirements = [line.strip() for line in f if line.strip() and not line.startswith('#')]
 
     # Install each package individually (more reliable than --platform for all)
@@ -21,10 +53,11 @@ def package_lambda():
                 'install',
                 req,
                 '--platform', 'manylinux2014_x86_64',
-                '--target', 'package',
+                '--target', target,
                 '--implementation', 'cp',
-                '--python-version', '3.11',
-                '--only-binary=:all:'
+                '--python-version', TARGET_PYTHON,
+                '--only-binary=:all:',
+                '--no-compile'
             ], stderr=subprocess.DEVNULL)
             print(f"✅ Installed {req} with platform flag")
         except subprocess.CalledProcessError:
@@ -34,86 +67,245 @@ def package_lambda():
                     sys.executable, '-m', 'pip',
                     'install',
                     req,
-                    '--target', 'package'
+                    '--target', target,
+                    '--no-compile'
                 ])
                 print(f"✅ Installed {req} normally")
             except subprocess.CalledProcessError:
                 print(f"⚠️ Failed to install {req}")
 
 
-    # Copy lambda handler
-    shutil.copy('lambda_module/whatsapp_handler.py', 'package/whatsapp_handler.py')
-    shutil.copy('lambda_module/multiagent_handler.py', 'package/multiagent_handler.py')
+def strip_tree(directory):
+    """Delete tests, docs, caches and type stubs; returns the bytes removed"""
+    removed = 0
+    for root, dirs, files in os.walk(directory, topdown=True):
+        strip_dirs = [d for d in dirs if d in STRIP_DIRS or
+                      (d in DOC_DIRS and not os.path.exists(os.path.join(root, d, '__init__.py')))]
+        for name in strip_dirs:
+            path = os.path.join(root, name)
+            removed += tree_size(path)
+            shutil.rmtree(path)
+            dirs.remove(name)
+        for name in files:
+            if name.endswith(STRIP_SUFFIXES) or name in STRIP_FILES:
+                path = os.path.join(root, name)
+                removed += os.path.getsize(path)
+                os.remove(path)
+    return removed
+
+
+class _ModuleFinder(ModuleFinder):
+    """ModuleFinder that follows every import of the handler modules, but within
+    dependencies only imports at module level or to the same top-level package;
+    imports inside library functions are mostly optional integrations
+    (langchain_core -> langchain -> langchain_community)."""
+
+    def __init__(self, path, library_dir):
+        super().__init__(path=path)
+        self.library_dir = os.path.abspath(library_dir)
+        self._function_depth = 0
+
+    def library_package(self, module):
+        path = os.path.abspath(module.__file__ or '') if module is not None else ''
+        if not path.startswith(self.library_dir + os.sep):
+            return None
+        return os.path.relpath(path, self.library_dir).split(os.sep)[0].split('.')[0]
+
+    def scan_code(self, co, m):
+        function = bool(co.co_flags & CO_OPTIMIZED)
+        self._function_depth += function
+        try:
+            super().scan_code(co, m)
+        finally:
+            self._function_depth -= function
+
+    def _safe_import_hook(self, name, caller, fromlist, level=-1):
+        if self._function_depth and level == 0:
+            package = self.library_package(caller)
+            if package is not None and name.split('.')[0] != package:
+                return
+        super()._safe_import_hook(name, caller, fromlist, level)
+
+    #modulefinder crashes on namespace packages (no __init__.py); they end up in badmodules instead
+    def find_module(self, name, path, parent=None):
+        try:
+            return super().find_module(name, path, parent)
+        except AttributeError:
+            raise ImportError(name)
+
+
+def module_file(name, search_path):
+    relative = name.replace('.', os.sep)
+    for directory in search_path:
+        for candidate in (f"{relative}.py", os.path.join(relative, '__init__.py')):
+            path = os.path.join(directory, candidate)
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+    return None
+
+
+def reachable_files(handler_dir, layer_dir):
+    """Source files of every module the handler modules can import"""
+    stdlib = [sysconfig.get_paths()['stdlib'], sysconfig.get_paths()['platstdlib']]
+    finder = _ModuleFinder([handler_dir, layer_dir] + stdlib, library_dir=layer_dir)
+    for module in glob.glob(os.path.join(handler_dir, '*.py')):
+        finder.run_script(module)
+    reachable = {os.path.abspath(module.__file__) for module in finder.modules.values() if module.__file__}
+
+    #Modules inside namespace packages were not scanned: scan them until nothing new turns up
+    scanned = set()
+    while True:
+        pending = {module_file(name, [layer_dir]) for name in finder.badmodules} - reachable - scanned - {None}
+        if not pending:
+            return reachable
+        for path in pending:
+            scanned.add(path)
+            reachable.add(path)
+            finder.run_script(path)
+        reachable |= {os.path.abspath(module.__file__) for module in finder.modules.values() if module.__file__}
+
+
+def shake(handler_dir, layer_dir, packages):
+    """Delete the .py files of `packages` that no handler module can reach; returns the bytes removed"""
+    reachable = reachable_files(handler_dir, layer_dir)
+    removed = 0
+    for package in packages:
+        package_dir = os.path.join(layer_dir, package)
+        if not os.path.isdir(package_dir):
+            continue
+        for root, _, files in os.walk(package_dir):
+            for name in files:
+                path = os.path.abspath(os.path.join(root, name))
+                if name.endswith('.py') and path not in reachable:
+                    removed += os.path.getsize(path)
+                    os.remove(path)
+    return removed
+
+
+def target_python():
+    """An interpreter of the Lambda runtime's version, or None"""
+    if f"{sys.version_info.major}.{sys.version_info.minor}" == TARGET_PYTHON:
+        return sys.executable
+    return shutil.which(f"python{TARGET_PYTHON}")
+
+
+def precompile(directory, python):
+    #unchecked-hash: zip timestamps cannot invalidate the bytecode and imports skip the source stat
+    subprocess.check_call([python, '-m', 'compileall', '-q', '-j', '0', '--invalidation-mode', 'unchecked-hash', directory])
+
+
+def smoke_test(handler_dir, layer_dir, python):
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([handler_dir, layer_dir])}
+    subprocess.check_call([python, '-c', '; '.join(f"import {module}" for module in SMOKE_IMPORTS)], env=env)
+
+
+def tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def size_report(directory):
+    """Unzipped bytes per top-level package, largest first"""
+    sizes = {}
+    for name in os.listdir(directory):
+        package = '*.dist-info' if name.endswith('.dist-info') else name.split('.')[0]
+        sizes[package] = sizes.get(package, 0) + tree_size(os.path.join(directory, name))
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+
+def make_zip(name, directory):
+    if os.path.exists(f"{name}.zip"):
+        os.remove(f"{name}.zip")
+    return shutil.make_archive(name, 'zip', directory)
+
+
+def package_lambda(shake_packages=(), budget_mb=DEFAULT_BUDGET_MB, site_packages=None, top=15, unverified_shake=False):
+    # A shaken layer is only shipped once the smoke test has imported it with the runtime's Python
+    python = target_python()
+    if shake_packages and not python and not unverified_shake:
+        print(f"❌ Tree-shaking needs python{TARGET_PYTHON} for the import smoke test; "
+              f"install it, or pass --unverified-shake to ship the layer untested")
+        return False
+
+    # Layer contents go under python/, which Lambda adds to sys.path
+    for directory in ('package', 'layer'):
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+    os.makedirs('package')
+    layer_dir = os.path.join('layer', 'python')
+
+    if site_packages:
+        shutil.copytree(site_packages, layer_dir)
+    else:
+        os.makedirs(layer_dir)
+        install_requirements(layer_dir)
+
+    # Copy lambda handler modules
+    for module in glob.glob('lambda_module/*.py'):
+        shutil.copy(module, os.path.join('package', os.path.basename(module)))
+
+    # Ship knowledge base snapshots for RETRIEVAL_BACKEND=local
+    if os.path.isdir('snapshots'):
+        shutil.copytree('snapshots', 'package/snapshots')
 
     with open('package/__init__.py', 'w') as f:
         pass
-    # Create zip file
-    if os.path.exists('lambda_package.zip'):
-        os.remove('lambda_package.zip')
-    
-    shutil.make_archive('lambda_package', 'zip', 'package')
+
+    print(f"Stripped {strip_tree(layer_dir) / 1e6:.1f} MB of tests, docs and stubs")
+    if shake_packages:
+        print(f"Tree-shaken {shake(os.path.abspath('package'), os.path.abspath(layer_dir), shake_packages) / 1e6:.1f} MB "
+              f"from {', '.join(shake_packages)}")
+
+    if python:
+        precompile(layer_dir, python)
+        precompile('package', python)
+        if shake_packages:
+            smoke_test(os.path.abspath('package'), os.path.abspath(layer_dir), python)
+    else:
+        print(f"⚠️ No python{TARGET_PYTHON} found, skipping bytecode compilation")
+        if shake_packages:
+            print("⚠️ The tree-shaken layer was not smoke tested (--unverified-shake)")
+
+    report = size_report(layer_dir)
+    handler_size = tree_size('package')
+    total = sum(report.values()) + handler_size
+
+    make_zip('lambda_layer', 'layer')
+    make_zip('lambda_package', 'package')
 
     # Clean up
     shutil.rmtree('package')
+    shutil.rmtree('layer')
+
+    print("\nUnzipped size by package:")
+    for package, size in list(report.items())[:top]:
+        print(f"  {package:<32} {size / 1e6:8.1f} MB")
+    print(f"  {'(handler)':<32} {handler_size / 1e6:8.1f} MB")
+    print(f"\nlambda_layer.zip {os.path.getsize('lambda_layer.zip') / 1e6:.1f} MB, "
+          f"lambda_package.zip {os.path.getsize('lambda_package.zip') / 1e6:.1f} MB, "
+          f"{total / 1e6:.1f} MB unzipped (budget {budget_mb} MB)")
+    if total > budget_mb * 1e6:
+        print(f"❌ Unzipped size {total / 1e6:.1f} MB is over the {budget_mb} MB budget")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shake-langchain', action='store_true', help=f"tree-shake {', '.join(LANGCHAIN_PACKAGES)}")
+    parser.add_argument('--shake', action='append', default=[], help='tree-shake this top-level package (repeatable)')
+    parser.add_argument('--unverified-shake', action='store_true',
+                        help=f"tree-shake even without python{TARGET_PYTHON} to smoke test the result")
+    parser.add_argument('--budget-mb', type=float, default=float(os.environ.get('PACKAGE_BUDGET_MB', DEFAULT_BUDGET_MB)))
+    parser.add_argument('--site-packages', help='use these installed dependencies instead of pip installing')
+    parser.add_argument('--top', type=int, default=15, help='packages to list in the size report')
+    args = parser.parse_args()
+
+    shake_packages = args.shake + (LANGCHAIN_PACKAGES if args.shake_langchain else [])
+    if not package_lambda(shake_packages, args.budget_mb, args.site_packages, args.top, args.unverified_shake):
+        sys.exit(1)
+
 
 if __name__ == '__main__':
-    package_lambda()
-
-
-# import subprocess
-# import shutil
-# import os
-# import sys
-
-# def package_lambda():
-#     # Create directories for our handler package and layer
-#     if os.path.exists('package'):
-#         shutil.rmtree('package')
-#     os.makedirs('package')
-    
-#     if os.path.exists('layer'):
-#         shutil.rmtree('layer')
-#     os.makedirs('layer/python')
-    
-#     # Step 1: Install Python dependencies into the layer directory
-#     print("Installing dependencies into layer...")
-#     subprocess.check_call([
-#         sys.executable, '-m', 'pip',
-#         'install',
-#         '-r', 'lambda_module/requirements.txt',
-#         '--target', 'layer/python'
-#     ])
-    
-#     # Step 2: Create the dependency layer ZIP
-#     print("Creating dependency layer ZIP...")
-#     if os.path.exists('lambda_layer.zip'):
-#         os.remove('lambda_layer.zip')
-    
-#     shutil.make_archive('lambda_layer', 'zip', 'layer')
-    
-#     # Step 3: Copy just the handler files (without dependencies) to the package dir
-#     print("Preparing handler package...")
-#     shutil.copy('lambda_module/whatsapp_handler.py', 'package/whatsapp_handler.py')
-#     shutil.copy('lambda_module/multiagent_handler.py', 'package/multiagent_handler.py')
-    
-#     with open('package/__init__.py', 'w') as f:
-#         pass
-    
-#     # Step 4: Create the handler ZIP
-#     print("Creating handler package ZIP...")
-#     if os.path.exists('lambda_package.zip'):
-#         os.remove('lambda_package.zip')
-    
-#     shutil.make_archive('lambda_package', 'zip', 'package')
-    
-#     # Clean up
-#     shutil.rmtree('package')
-#     shutil.rmtree('layer')
-    
-#     print("\nSUCCESS! Created:")
-#     print("- lambda_package.zip (contains your handler code)")
-#     print("- lambda_layer.zip (contains your dependencies)")
-#     print("\nNow update your CDK stack to use the dependency layer.")
-
-# if __name__ == '__main__':
-#     package_lambda()
\ No newline at end of file
+    main()
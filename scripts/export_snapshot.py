@@ -0,0 +1,55 @@
+"""Snapshot Elasticsearch knowledge bases into memory-mappable files.
+
+Usage:
+    python scripts/export_snapshot.py --out snapshots [--dtype int8] [--index finance ...]
+
+Without --index, exports FINANCE_KB_INDEX, FOOD_KB_INDEX and HEALTHCARE_KB_INDEX.
+package_lambda.py ships the output directory with the handler; set
+RETRIEVAL_BACKEND=local to search it instead of Elasticsearch.
+"""
+import argparse
+import os
+import sys
+
+from elasticsearch import helpers
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_module'))
+
+from vector_snapshot import index_version, write_snapshot
+from reindex_knn import es_client
+
+
+def export_index(es, index_name, directory, dtype="float32", text_field="text", vector_field="vector"):
+    #Version first: writes during the scan make the snapshot look stale, never fresh
+    version = index_version(es, index_name)
+    texts, vectors = [], []
+    for hit in helpers.scan(es, index=index_name, query={"query": {"match_all": {}}}, _source=[text_field, vector_field]):
+        source = hit["_source"]
+        if vector_field not in source:
+            continue
+        texts.append(source.get(text_field, ""))
+        vectors.append(source[vector_field])
+    if not vectors:
+        raise ValueError(f"No vectors found in {index_name}")
+    write_snapshot(directory, index_name, texts, vectors, version, dtype=dtype)
+    return len(texts)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="snapshots")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "int8"])
+    parser.add_argument("--index", action="append")
+    args = parser.parse_args()
+
+    indices = args.index or [os.environ.get(name) for name in ("FINANCE_KB_INDEX", "FOOD_KB_INDEX", "HEALTHCARE_KB_INDEX")]
+    es = es_client()
+    for index_name in filter(None, indices):
+        count = export_index(es, index_name, args.out, dtype=args.dtype)
+        print(f"✅ Exported {count} documents from {index_name} to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Cold-start import report for the Lambda handlers.
+
+Imports a module in a fresh interpreter with `python -X importtime` and sums
+the cumulative import time per top-level package:
+
+    python scripts/import_time_report.py                       # whatsapp_handler
+    python scripts/import_time_report.py --module multiagent_handler --top 15
+    python scripts/import_time_report.py --out import_time.json
+
+Pass --event get to also run the webhook verification request, so the report
+shows everything a GET pays for. Numbers vary between runs; compare the
+package list and orders of magnitude rather than single milliseconds.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_module')
+
+GET_EVENT = {'httpMethod': 'GET', 'queryStringParameters': {'hub.mode': 'subscribe', 'hub.verify_token': 'x', 'hub.challenge': '1'}}
+
+
+def import_times(module, event=None, python=sys.executable, env=None):
+    """Return ([(module, self_us, cumulative_us)], loaded modules) for importing `module`"""
+    code = f"import sys, json, {module}\n"
+    if event is not None:
+        code += f"{module}.handle({json.dumps(event)}, None)\n"
+    code += "print(json.dumps(sorted(sys.modules)))\n"
+    env = {**os.environ, **(env or {})}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.abspath(LAMBDA_DIR), env.get('PYTHONPATH')]))
+    result = subprocess.run([python, '-X', 'importtime', '-c', code], capture_output=True, text=True, env=env, check=True)
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+    return timings, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def by_package(timings):
+    """Cumulative microseconds per top-level package, counting only top-level imports"""
+    packages = {}
+    for name, _, cumulative_us in timings:
+        if name.startswith(' '):
+            continue
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + cumulative_us
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def report(module='whatsapp_handler', event=None):
+    timings, loaded = import_times(module, event=event)
+    packages = by_package(timings)
+    return {
+        'module': module,
+        'event': event['httpMethod'] if event else None,
+        'total_ms': sum(packages.values()) / 1000,
+        'packages_ms': {package: us / 1000 for package, us in packages.items()},
+        'loaded_modules': len(loaded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='whatsapp_handler')
+    parser.add_argument('--event', choices=['get'], help='also handle a webhook verification request')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--out', help='write the report as JSON')
+    args = parser.parse_args()
+
+    result = report(args.module, event=GET_EVENT if args.event == 'get' else None)
+    print(f"import {result['module']}: {result['total_ms']:.1f} ms, {result['loaded_modules']} modules loaded")
+    for package, ms in list(result['packages_ms'].items())[:args.top]:
+        print(f"  {package:<32} {ms:8.1f} ms")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+"""Ingest source documents into a knowledge base index.
+
+Usage:
+    python scripts/ingest_kb.py --kb finance docs/finance
+    python scripts/ingest_kb.py --index food_kb_v2 --strategy knn docs/food/*.pdf
+    python scripts/ingest_kb.py --kb healthcare docs/healthcare --workers 16 --max-rate 40 --prune
+
+Documents (PDF, HTML, Markdown, plain text) are read one at a time, split into
+chunks, embedded in batches on a bounded thread pool and written with the
+Elasticsearch bulk API in the layout ElasticsearchStore reads (text, vector,
+metadata). Every Bedrock call goes through the model invoker, which backs off
+when Bedrock throttles; --max-rate also caps embeddings per second.
+
+Progress is checkpointed per document (default .ingest/<index>.json): an
+interrupted run resumes where it stopped, and documents whose content has not
+changed are skipped. Chunk ids are derived from the source path, so a changed
+document overwrites its chunks. Embeddings are kept in a content-addressed
+cache (default .ingest/embeddings.db), so unchanged chunks of a changed
+document, or of a re-index into a new index, are not sent to Bedrock again.
+PDF support needs `pip install pypdf`.
+
+--fake-embeddings uses deterministic local vectors instead of Bedrock, e.g. to
+try a run against a local Elasticsearch container.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+
+from dotenv import load_dotenv
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_module'))
+
+logger = logging.getLogger(__name__)
+
+KB_INDEX_SETTINGS = {"finance": "FINANCE_KB_INDEX", "food": "FOOD_KB_INDEX", "healthcare": "HEALTHCARE_KB_INDEX"}
+
+SUFFIXES = {".pdf": "pdf", ".html": "html", ".htm": "html", ".md": "markdown", ".markdown": "markdown", ".txt": "text"}
+
+
+#Parsing
+
+class _TextExtractor(HTMLParser):
+    SKIP = {"script", "style", "noscript", "template", "svg"}
+    BLOCKS = {"p", "div", "br", "li", "tr", "section", "article", "h1", "h2", "h3", "h4", "h5", "h6", "table", "ul", "ol"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title = None
+        self._skipping = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(self._skipping - 1, 0)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = (self.title or "") + data.strip()
+        elif not self._skipping:
+            self.parts.append(data)
+
+
+def _collapse(text):
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def parse_html(raw):
+    extractor = _TextExtractor()
+    extractor.feed(raw)
+    return _collapse("".join(extractor.parts)), extractor.title
+
+
+def parse_pdf(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ValueError("PDF support needs pypdf: pip install pypdf")
+    reader = PdfReader(path)
+    title = (reader.metadata or {}).get("/Title")
+    return _collapse("\n".join(page.extract_text() or "" for page in reader.pages)), title
+
+
+def parse_document(path):
+    """Return (text, title) of one source file"""
+    kind = SUFFIXES.get(os.path.splitext(path)[1].lower())
+    if kind == "pdf":
+        return parse_pdf(path)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        raw = f.read()
+    if kind == "html":
+        return parse_html(raw)
+    title = None
+    if kind == "markdown":
+        title = next((line.lstrip("#").strip() for line in raw.splitlines() if line.startswith("# ")), None)
+    return raw.strip(), title
+
+
+def find_documents(paths):
+    """(source key, path) of every supported file under `paths`, in a stable order"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in SUFFIXES:
+                        full = os.path.join(root, name)
+                        yield os.path.relpath(full, path).replace(os.sep, "/"), full
+        elif os.path.splitext(path)[1].lower() in SUFFIXES:
+            yield os.path.basename(path), path
+
+
+def chunk_id(source, number):
+    return f"{hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]}-{number}"
+
+
+#Checkpoint
+
+class Checkpoint:
+    """Source key -> {"sha256", "chunks"} of every document fully written, saved as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.documents = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.documents = json.load(f).get("documents", {})
+        self._saved_at = 0.0
+
+    def unchanged(self, source, digest):
+        return self.documents.get(source, {}).get("sha256") == digest
+
+    def mark(self, source, digest, chunks):
+        self.documents[source] = {"sha256": digest, "chunks": chunks}
+        if time.monotonic() - self._saved_at > 1.0:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"documents": self.documents}, f, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+        self._saved_at = time.monotonic()
+
+
+#Embedding and writing
+
+class RateLimiter:
+    """Token bucket allowing `rate` embeddings per second across threads; no limit when rate is 0"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                #A batch larger than the bucket waits for a full bucket and goes into debt
+                if self.tokens >= min(count, self.rate):
+                    self.tokens -= count
+                    return
+                wait_seconds = (min(count, self.rate) - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class ElasticsearchWriter:
+    """Bulk writes chunks into `index`, creating it on the first write"""
+
+    def __init__(self, es, index, strategy="script"):
+        self.es = es
+        self.index = index
+        self.strategy = strategy
+        self._ready = False
+
+    def ensure_index(self, dims):
+        if self._ready:
+            return
+        if not self.es.indices.exists(index=self.index):
+            from multiagent_handler import retrieval_strategy
+            mappings, settings = retrieval_strategy(self.strategy).es_mappings_settings(
+                text_field="text", vector_field="vector", num_dimensions=dims)
+            self.es.indices.create(index=self.index, mappings=mappings, settings=settings or None)
+        self._ready = True
+
+    def write(self, chunks, vectors):
+        """Index the chunks; returns the ids that failed"""
+        from elasticsearch import helpers
+        self.ensure_index(len(vectors[0]))
+        actions = [{"_op_type": "index", "_index": self.index, "_id": chunk["id"], "text": chunk["text"],
+                    "vector": vector, "metadata": chunk["metadata"]} for chunk, vector in zip(chunks, vectors)]
+        _, errors = helpers.bulk(self.es, actions, raise_on_error=False, request_timeout=120)
+        for error in errors[:3]:
+            logger.warning(f"Bulk error: {error}")
+        return {next(iter(error.values())).get("_id") for error in errors}
+
+    def delete(self, ids):
+        from elasticsearch import helpers
+        if not ids or not (self._ready or self.es.indices.exists(index=self.index)):
+            return
+        helpers.bulk(self.es, [{"_op_type": "delete", "_index": self.index, "_id": _id} for _id in ids], raise_on_error=False)
+
+    def refresh(self):
+        if self._ready:
+            self.es.indices.refresh(index=self.index)
+
+
+class Stats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.documents = 0
+        self.skipped = 0
+        self.failed = 0
+        self.chunks = 0
+        self.embeddings = 0
+        self.write_errors = 0
+        self.embedding_errors = 0
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        return {
+            "documents": self.documents, "skipped": self.skipped, "failed": self.failed, "chunks": self.chunks,
+            "embeddings": self.embeddings, "write_errors": self.write_errors,
+            "embedding_errors": self.embedding_errors, "elapsed_s": round(elapsed, 2),
+            "documents_per_s": round(self.documents / elapsed, 2) if elapsed else 0.0,
+            "embeddings_per_s": round(self.embeddings / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+def ingest(paths, writer, embeddings, checkpoint, chunk_size=1000, chunk_overlap=150, batch_size=16, workers=8,
+           max_rate=0.0, prune=False, report_every=10.0, kb=None):
+    """Stream documents through chunking, embedding and bulk writes; returns the Stats report"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    limiter = RateLimiter(max_rate)
+    stats = Stats()
+    #Chunks of a document still to be written, and what to checkpoint once they are
+    outstanding = {}
+    seen = set()
+
+    def embed(batch):
+        limiter.acquire(len(batch))
+        try:
+            return batch, embeddings.embed_documents([chunk["text"] for chunk in batch])
+        except Exception as e:
+            #One bad document (e.g. a chunk too long for the model) must not stop every run at the same batch
+            sources = sorted({chunk["metadata"]["source"] for chunk in batch})
+            logger.warning(f"Embedding {len(batch)} chunks of {', '.join(sources)} failed: {type(e).__name__}: {str(e)}")
+            return batch, None
+
+    def written(batch, vectors):
+        if vectors is None:
+            failed = {chunk["id"] for chunk in batch}
+            stats.embedding_errors += len(batch)
+        else:
+            failed = writer.write(batch, vectors)
+            stats.write_errors += len(failed)
+            stats.embeddings += len(vectors)
+        for chunk in batch:
+            document = outstanding[chunk["metadata"]["source"]]
+            document["remaining"] -= 1
+            document["failed"] += chunk["id"] in failed
+            if document["remaining"] == 0:
+                finish(chunk["metadata"]["source"], document)
+
+    def finish(source, document):
+        del outstanding[source]
+        if document["failed"]:
+            #Not checkpointed, so the next run writes it again
+            stats.failed += 1
+            return
+        previous = checkpoint.documents.get(source, {}).get("chunks", 0)
+        if previous > document["chunks"]:
+            writer.delete([chunk_id(source, number) for number in range(document["chunks"], previous)])
+        checkpoint.mark(source, document["sha256"], document["chunks"])
+        stats.documents += 1
+
+    def chunks():
+        for source, path in find_documents(paths):
+            seen.add(source)
+            try:
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+                if checkpoint.unchanged(source, digest):
+                    stats.skipped += 1
+                    continue
+                text, title = parse_document(path)
+            except Exception as e:
+                logger.warning(f"Skipping {path}: {str(e)}")
+                stats.failed += 1
+                continue
+            pieces = [piece for piece in splitter.split_text(text) if piece.strip()]
+            document = {"sha256": digest, "chunks": len(pieces), "remaining": len(pieces), "failed": 0}
+            if not pieces:
+                outstanding[source] = document
+                finish(source, document)
+                continue
+            outstanding[source] = document
+            stats.chunks += len(pieces)
+            for number, piece in enumerate(pieces):
+                metadata = {"source": source, "title": title or os.path.basename(path), "chunk": number}
+                if kb:
+                    metadata["kb"] = kb
+                yield {"id": chunk_id(source, number), "text": piece, "metadata": metadata}
+
+    def batches():
+        batch = []
+        for chunk in chunks():
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    reported = time.monotonic()
+    pending = set()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in batches():
+                #Bounded in-flight work keeps memory flat however large the corpus
+                while len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        written(*future.result())
+                pending.add(executor.submit(embed, batch))
+                if report_every and time.monotonic() - reported > report_every:
+                    reported = time.monotonic()
+                    print(progress_line(stats.report()), flush=True)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    written(*future.result())
+    finally:
+        #Whatever was fully written is kept, so a rerun resumes from here
+        for future in pending:
+            future.cancel()
+        checkpoint.save()
+
+    if prune:
+        removed = [source for source in checkpoint.documents if source not in seen]
+        for source in removed:
+            writer.delete([chunk_id(source, number) for number in range(checkpoint.documents[source]["chunks"])])
+            del checkpoint.documents[source]
+        checkpoint.save()
+    writer.refresh()
+    report = stats.report()
+    if hasattr(embeddings, "stats"):
+        report["embedding_cache"] = embeddings.stats()
+    return report
+
+
+def progress_line(report):
+    return (f"{report['documents']} documents ({report['skipped']} unchanged, {report['failed']} failed), "
+            f"{report['embeddings']} embeddings in {report['elapsed_s']:.1f}s: "
+            f"{report['documents_per_s']:.1f} docs/s, {report['embeddings_per_s']:.1f} embeddings/s")
+
+
+def cache_line(report):
+    cache = report.get("embedding_cache")
+    if not cache:
+        return None
+    return f"Embedding cache: {cache['hit_rate']:.0%} hit rate, {cache['saved_calls']} Bedrock calls saved"
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="files or directories of source documents")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--kb", choices=list(KB_INDEX_SETTINGS), help="write to the index named by e.g. FINANCE_KB_INDEX")
+    target.add_argument("--index")
+    parser.add_argument("--strategy", choices=["script", "knn", "hybrid"],
+                        help="vector mapping for a new index (default: the knowledge base's *_STRATEGY, or script)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=150)
+    parser.add_argument("--batch-size", type=int, default=16, help="chunks per embedding task")
+    parser.add_argument("--workers", type=int, default=8, help="embedding tasks in parallel")
+    parser.add_argument("--max-rate", type=float, default=0.0, help="embeddings per second, 0 for no limit")
+    parser.add_argument("--checkpoint", help="default .ingest/<index>.json")
+    parser.add_argument("--prune", action="store_true", help="delete chunks of checkpointed documents no longer in the sources")
+    parser.add_argument("--embedding-cache", default=os.path.join(".ingest", "embeddings.db"),
+                        help="SQLite embedding cache, or none")
+    parser.add_argument("--fake-embeddings", type=int, metavar="DIMS", help="local fake vectors instead of Bedrock")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    index = args.index or os.environ.get(KB_INDEX_SETTINGS[args.kb])
+    if not index:
+        parser.error(f"{KB_INDEX_SETTINGS[args.kb]} is not set")
+    strategy = args.strategy
+    if strategy is None:
+        from multiagent_handler import kb_setting
+        strategy = kb_setting(f"{args.kb.upper()}_KB", "STRATEGY", "script") if args.kb else os.environ.get("ES_STRATEGY", "script")
+
+    if args.fake_embeddings:
+        sys.path.insert(0, ROOT)
+        from benchmarks.fakes import FakeEmbeddings
+        from embedding_cache import CachedEmbeddings, SQLiteVectorStore
+        embeddings = FakeEmbeddings(dims=args.fake_embeddings)
+        if args.embedding_cache != "none":
+            embeddings = CachedEmbeddings(embeddings, f"fake-{args.fake_embeddings}", store=SQLiteVectorStore(args.embedding_cache))
+    else:
+        #The Lambda's /tmp cache would not outlive the run
+        os.environ["EMBEDDING_CACHE_BACKEND"] = "none" if args.embedding_cache == "none" else "sqlite"
+        os.environ["EMBEDDING_CACHE_PATH"] = args.embedding_cache
+        from components import components
+        embeddings = components.bedrock_embeddings
+
+    from reindex_knn import es_client
+    writer = ElasticsearchWriter(es_client(), index, strategy=strategy)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(".ingest", f"{index}.json"))
+    try:
+        report = ingest(args.paths, writer, embeddings, checkpoint, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+                        batch_size=args.batch_size, workers=args.workers, max_rate=args.max_rate, prune=args.prune,
+                        report_every=args.report_every, kb=args.kb)
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun the same command to resume from {checkpoint.path}")
+        sys.exit(130)
+    print(f"✅ {progress_line(report)}")
+    if cache_line(report):
+        print(cache_line(report))
+    if report["write_errors"] or report["embedding_errors"]:
+        print(f"❌ {report['embedding_errors']} chunks failed to embed, {report['write_errors']} to index")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
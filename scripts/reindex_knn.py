@@ -0,0 +1,102 @@
+"""Reindex a knowledge base into an HNSW-indexed dense_vector mapping.
+
+Indices created with DenseVectorScriptScoreStrategy store vectors with
+`index: false`, which only supports brute-force script scoring. This copies
+an index into a new one whose vector field is indexed for approximate kNN,
+checks the document counts and optionally moves an alias onto it.
+
+Usage:
+    python scripts/reindex_knn.py --source finance --target finance_knn --alias finance_kb
+
+Then point FINANCE_KB_INDEX at the alias (or target) and set
+FINANCE_KB_STRATEGY=knn (or hybrid).
+"""
+import argparse
+import os
+import sys
+import time
+
+from elasticsearch import Elasticsearch
+
+
+def es_client():
+    return Elasticsearch(os.environ.get("ELASTIC_URL", "http://localhost:9200"),
+                         api_key=os.environ.get("ELASTIC_API_KEY") or None,
+                         request_timeout=60)
+
+
+def knn_mappings(source_mappings, vector_field, similarity, m, ef_construction):
+    properties = dict(source_mappings.get("properties", {}))
+    if vector_field not in properties:
+        raise ValueError(f"Source index has no '{vector_field}' field")
+    properties[vector_field] = {
+        "type": "dense_vector",
+        "dims": properties[vector_field]["dims"],
+        "index": True,
+        "similarity": similarity,
+        "index_options": {"type": "hnsw", "m": m, "ef_construction": ef_construction},
+    }
+    return {"properties": properties}
+
+
+def reindex(es, source, target, vector_field="vector", similarity="cosine", m=16, ef_construction=100, poll_seconds=2):
+    source_mappings = es.indices.get_mapping(index=source)
+    source_mappings = next(iter(source_mappings.body.values()))["mappings"]
+
+    if es.indices.exists(index=target):
+        raise ValueError(f"Target index {target} already exists")
+    es.indices.create(index=target, mappings=knn_mappings(source_mappings, vector_field, similarity, m, ef_construction))
+
+    task = es.reindex(source={"index": source}, dest={"index": target}, wait_for_completion=False)["task"]
+    while True:
+        status = es.tasks.get(task_id=task)
+        progress = status["task"]["status"]
+        print(f"reindexed {progress['created']}/{progress['total']}")
+        if status["completed"]:
+            break
+        time.sleep(poll_seconds)
+
+    es.indices.refresh(index=target)
+    source_count = es.count(index=source)["count"]
+    target_count = es.count(index=target)["count"]
+    if source_count != target_count:
+        raise RuntimeError(f"Document count mismatch: {source}={source_count} {target}={target_count}")
+    return target_count
+
+
+def move_alias(es, alias, target):
+    actions = []
+    if es.indices.exists_alias(name=alias):
+        for index in es.indices.get_alias(name=alias).body:
+            actions.append({"remove": {"index": index, "alias": alias}})
+    actions.append({"add": {"index": target, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True)
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--alias", help="alias to move onto the target once the copy is verified")
+    parser.add_argument("--vector-field", default="vector")
+    parser.add_argument("--similarity", default="cosine", choices=["cosine", "dot_product", "l2_norm"])
+    parser.add_argument("--m", type=int, default=16, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=100)
+    args = parser.parse_args()
+
+    es = es_client()
+    try:
+        count = reindex(es, args.source, args.target, vector_field=args.vector_field,
+                        similarity=args.similarity, m=args.m, ef_construction=args.ef_construction)
+    except (ValueError, RuntimeError) as e:
+        print(f"Reindex failed: {e}")
+        sys.exit(1)
+    print(f"✅ Copied {count} documents from {args.source} to {args.target}")
+
+    if args.alias:
+        move_alias(es, args.alias, args.target)
+        print(f"✅ Alias {args.alias} now points to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
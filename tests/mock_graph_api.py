@@ -0,0 +1,100 @@
+"""Local stand-in for the WhatsApp Graph API, for tests and offline runs.
+
+    with MockGraphAPI() as graph_api:
+        client = WhatsAppClient(base_url=graph_api.url, token="test")
+        ...
+        graph_api.sent_messages  # JSON bodies of POST /<version>/<phone id>/messages
+
+Failures can be injected with `fail_next(count, status)` and latency with
+`latency` (seconds per request).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockGraphAPI:
+    def __init__(self, media=None, latency=0.0):
+        self.media = media or {}
+        self.latency = latency
+        self.sent_messages = []
+        self.requests = []
+        self.client_ports = set()
+        self._failures = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        #Clients that time out hang up mid-response; that is expected here
+        self.server.handle_error = lambda request, client_address: None
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def fail_next(self, count, status=500, headers=None):
+        with self._lock:
+            self._failures.extend([(status, headers or {})] * count)
+
+    def _next_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status, body, content_type="application/json", headers=None):
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _start(self):
+                api.requests.append((self.command, self.path, self.headers.get("Authorization")))
+                api.client_ports.add(self.client_address[1])
+                if api.latency:
+                    time.sleep(api.latency)
+                failure = api._next_failure()
+                if failure:
+                    self._reply(failure[0], {"error": {"message": "injected failure"}}, headers=failure[1])
+                return failure
+
+            def do_GET(self):
+                if self._start():
+                    return
+                parts = self.path.strip("/").split("/")
+                if parts[0] == "media" and parts[1] in api.media:
+                    self._reply(200, api.media[parts[1]]["data"], content_type=api.media[parts[1]]["mime_type"])
+                elif len(parts) == 2 and parts[1] in api.media:
+                    entry = api.media[parts[1]]
+                    self._reply(200, {"id": parts[1], "url": f"{api.url}/media/{parts[1]}",
+                                      "mime_type": entry["mime_type"], "file_size": len(entry["data"])})
+                else:
+                    self._reply(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self._start():
+                    return
+                parts = self.path.strip("/").split("/")
+                if len(parts) == 3 and parts[2] == "messages":
+                    api.sent_messages.append({"phone_number_id": parts[1], **body})
+                    self._reply(200, {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.{len(api.sent_messages)}"}]})
+                else:
+                    self._reply(404, {"error": {"message": "not found"}})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
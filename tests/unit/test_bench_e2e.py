@@ -0,0 +1,26 @@
+import argparse
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'benchmarks'))
+
+from bench_e2e import run
+from components import components
+
+
+@pytest.mark.parametrize("understanding, first_node", [("pipeline", "node.detect_intent"), ("single", "node.understand")])
+def test_webhooks_are_answered_end_to_end(understanding, first_node):
+    args = argparse.Namespace(messages=12, concurrency=4, senders=3, voice_share=0.3, jitter=0.0, warmup=1, seed=0,
+                              no_response_cache=False, log_level="WARNING", understanding=understanding,
+                              latency="chat=0,embed=0,translate=0,es=0,graph=0,transcribe=0")
+    try:
+        result = run(args)
+    finally:
+        components.reset()
+
+    assert result["errors"] == 0
+    assert result["replies_sent"] == 12
+    assert result["stages"]["end_to_end"]["count"] == 12
+    assert first_node in result["stages"]
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from dedup import MessageDeduplicator, SQLiteDedupBackend
+
+
+def test_redelivery_is_suppressed_in_process():
+    deduplicator = MessageDeduplicator()
+
+    assert deduplicator.claim("wamid.1")
+    assert not deduplicator.claim("wamid.1")
+    assert deduplicator.claim("wamid.2")
+    assert deduplicator.suppressed == 1
+
+
+def test_shared_backend_suppresses_across_containers(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    container_a = MessageDeduplicator(backend=SQLiteDedupBackend(path))
+    container_b = MessageDeduplicator(backend=SQLiteDedupBackend(path))
+
+    assert container_a.claim("wamid.1")
+    assert not container_b.claim("wamid.1")
+    assert container_b.suppressed == 1
+
+
+def test_released_message_can_be_claimed_again(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    container_a = MessageDeduplicator(backend=SQLiteDedupBackend(path))
+    container_b = MessageDeduplicator(backend=SQLiteDedupBackend(path))
+
+    assert container_a.claim("wamid.1")
+    container_a.release("wamid.1")
+    assert container_b.claim("wamid.1")
+
+
+def test_expired_claims_are_reclaimed(tmp_path):
+    deduplicator = MessageDeduplicator(backend=SQLiteDedupBackend(str(tmp_path / "dedup.db")), ttl=-1)
+
+    assert deduplicator.claim("wamid.1")
+    deduplicator.seen.clear()
+    assert deduplicator.claim("wamid.1")
+
+
+class FlakyBackend:
+    def __init__(self, failing_ids):
+        self.failing_ids = set(failing_ids)
+        self.claimed = set()
+
+    def claim(self, message_id, expires_at):
+        if message_id in self.failing_ids:
+            raise ConnectionError("DynamoDB unavailable")
+        if message_id in self.claimed:
+            return False
+        self.claimed.add(message_id)
+        return True
+
+    def release(self, message_id):
+        self.claimed.discard(message_id)
+
+
+def test_backend_error_does_not_mark_the_message_seen():
+    backend = FlakyBackend({"wamid.1"})
+    deduplicator = MessageDeduplicator(backend=backend)
+
+    with pytest.raises(ConnectionError):
+        deduplicator.claim("wamid.1")
+    backend.failing_ids.clear()
+    assert deduplicator.claim("wamid.1")
+
+
+def test_webhook_releases_its_claims_when_a_later_claim_fails():
+    import whatsapp_handler
+    from components import components
+
+    backend = FlakyBackend({"wamid.2"})
+    components.set("deduplicator", MessageDeduplicator(backend=backend))
+    messages = [{"id": message_id, "from": "6591234567", "type": "text", "text": {"body": "hi"}}
+                for message_id in ("wamid.1", "wamid.2")]
+    event = {"body": json.dumps({"entry": [{"changes": [{"value": {"messages": messages}}]}]})}
+    try:
+        with pytest.raises(ConnectionError):
+            whatsapp_handler.handle_webhook(event)
+        assert backend.claimed == set()
+        assert "wamid.1" not in components.deduplicator.seen
+    finally:
+        components.reset("deduplicator")
+
+
+def test_webhook_releases_the_claim_when_the_reply_cannot_be_sent(monkeypatch):
+    import whatsapp_handler
+    from components import components
+    from tests.mock_graph_api import MockGraphAPI
+    from whatsapp_client import WhatsAppClient
+
+    monkeypatch.setattr(whatsapp_handler, "async_processing", False)
+    monkeypatch.setattr(whatsapp_handler, "get_claude_response", lambda phone_number, text: "hello")
+    backend = FlakyBackend(())
+    messages = [{"id": "wamid.1", "from": "6591234567", "type": "text", "text": {"body": "hi"}}]
+    event = {"body": json.dumps({"entry": [{"changes": [{"value": {"messages": messages}}]}]})}
+    with MockGraphAPI() as graph_api:
+        components.set("deduplicator", MessageDeduplicator(backend=backend))
+        components.set("whatsapp_client", WhatsAppClient(token="test-token", phone_number_id="12345",
+                                                         base_url=graph_api.url, backoff=0.01))
+        try:
+            graph_api.fail_next(1, status=500)
+            assert whatsapp_handler.handle_webhook(event) == ["wamid.1"]
+            assert backend.claimed == set()
+            #WhatsApp's redelivery is answered, not dropped as a duplicate
+            assert whatsapp_handler.handle_webhook(event) == []
+            assert len(graph_api.sent_messages) == 1
+        finally:
+            components.reset("deduplicator")
+            components.reset("whatsapp_client")
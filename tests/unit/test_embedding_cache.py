@@ -0,0 +1,39 @@
+import tracing
+from embedding_cache import CachedEmbeddings, SQLiteVectorStore
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.texts = []
+
+    def embed_query(self, text):
+        self.texts.append(text)
+        return [float(len(text)), 0.5]
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+
+def test_each_text_is_embedded_once_across_restarts(tmp_path):
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "amazon.titan-embed-text-v2:0", store=SQLiteVectorStore(str(tmp_path / "cache.db")))
+
+    assert cache.embed_documents(["food banks", "ComCare", "food  banks"]) == [[10.0, 0.5], [7.0, 0.5], [10.0, 0.5]]
+    assert cache.embed_query("ComCare ") == [7.0, 0.5]
+    assert inner.texts == ["food banks", "ComCare"]
+
+    #A new container with the same file only embeds what it has not seen
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "amazon.titan-embed-text-v2:0", store=SQLiteVectorStore(str(tmp_path / "cache.db")))
+    with tracing.Tracer(sink=lambda line: None).trace("message") as trace:
+        cache.embed_documents(["food banks", "CHAS clinics"])
+    assert inner.texts == ["CHAS clinics"]
+    assert trace.metrics["embedding_cache_hits"] == ("Count", [1])
+    assert cache.stats() == {"memory_hits": 0, "store_hits": 1, "misses": 1, "hit_rate": 0.5, "saved_calls": 1}
+
+    #Another model never shares vectors
+    other = CachedEmbeddings(CountingEmbeddings(), "cohere.embed-multilingual-v3", store=SQLiteVectorStore(str(tmp_path / "cache.db")))
+    other.embed_query("ComCare")
+    other.embed_documents(["ComCare"])
+    assert other.stats()["misses"] == 2
@@ -0,0 +1,69 @@
+from history_store import HistoryStore, SQLiteHistoryBackend
+
+
+def make_store(tmp_path, **kwargs):
+    return HistoryStore(backend=SQLiteHistoryBackend(str(tmp_path / "history.db")), **kwargs)
+
+
+def turn(store, user_id, query, reply):
+    messages, version = store.load(user_id)
+    loaded = len(messages)
+    messages += [{"role": "user", "content": query}, {"role": "bot", "content": reply}]
+    store.save(user_id, messages, version, new_from=loaded)
+
+
+def test_history_round_trips_through_backend(tmp_path):
+    store = make_store(tmp_path)
+    turn(store, "6591234567", "hi", "hello")
+
+    fresh_store = make_store(tmp_path)
+    messages, version = fresh_store.load("6591234567")
+    assert [msg["content"] for msg in messages] == ["hi", "hello"]
+    assert version == 1
+
+
+def test_history_is_trimmed_on_save(tmp_path):
+    store = make_store(tmp_path, max_messages=4)
+    for i in range(5):
+        turn(store, "6591234567", f"q{i}", f"a{i}")
+
+    messages, _ = make_store(tmp_path).load("6591234567")
+    assert [msg["content"] for msg in messages] == ["q3", "a3", "q4", "a4"]
+
+
+def test_concurrent_writers_are_merged(tmp_path):
+    container_a = make_store(tmp_path)
+    container_b = make_store(tmp_path)
+    turn(container_a, "6591234567", "q0", "a0")
+    container_b.load("6591234567")
+
+    turn(container_a, "6591234567", "q1", "a1")
+    # container_b still holds version 1 in its hot tier
+    turn(container_b, "6591234567", "q2", "a2")
+
+    messages, version = make_store(tmp_path).load("6591234567")
+    assert [msg["content"] for msg in messages] == ["q0", "a0", "q1", "a1", "q2", "a2"]
+    assert version == 3
+
+
+def test_hot_tier_only_store_is_bounded():
+    store = HistoryStore(backend=None, cache_size=2)
+    for user_id in ("a", "b", "c"):
+        turn(store, user_id, "hi", "hello")
+
+    assert store.load("a") == ([], 0)
+    assert len(store.load("c")[0]) == 2
+
+
+def test_concurrent_writers_are_merged_at_the_cap(tmp_path):
+    container_a = make_store(tmp_path, max_messages=4)
+    container_b = make_store(tmp_path, max_messages=4)
+    for i in range(2):
+        turn(container_a, "6591234567", f"q{i}", f"a{i}")
+    container_b.load("6591234567")
+
+    turn(container_a, "6591234567", "q2", "a2")
+    turn(container_b, "6591234567", "q3", "a3")
+
+    messages, _ = make_store(tmp_path).load("6591234567")
+    assert [msg["content"] for msg in messages] == ["q2", "a2", "q3", "a3"]
@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scripts'))
+
+from import_time_report import GET_EVENT, import_times
+
+#Libraries that must not load before the first message is processed
+HEAVY_PACKAGES = ['boto3', 'botocore', 'langchain_aws', 'langchain_core', 'langchain_elasticsearch', 'langgraph',
+                  'langdetect', 'elasticsearch', 'numpy', 'requests']
+
+
+def test_webhook_verification_skips_heavy_imports():
+    _, loaded = import_times('whatsapp_handler', event=GET_EVENT)
+
+    assert [module for module in loaded if module.split('.')[0] in HEAVY_PACKAGES] == []
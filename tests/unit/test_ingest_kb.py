@@ -0,0 +1,111 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from benchmarks.fakes import FakeEmbeddings
+from ingest_kb import Checkpoint, ElasticsearchWriter, chunk_id, ingest, parse_html
+
+
+class MemoryWriter:
+    def __init__(self):
+        self.documents = {}
+
+    def write(self, chunks, vectors):
+        for chunk, vector in zip(chunks, vectors):
+            self.documents[chunk["id"]] = {"text": chunk["text"], "vector": vector, "metadata": chunk["metadata"]}
+        return set()
+
+    def delete(self, ids):
+        for _id in ids:
+            self.documents.pop(_id, None)
+
+    def refresh(self):
+        pass
+
+
+def write_sources(directory):
+    (directory / "comcare.md").write_text("# ComCare\n\n" + "ComCare helps low-income households with monthly cash. " * 40)
+    (directory / "food.html").write_text("<html><head><title>Food banks</title><script>var x;</script></head>"
+                                         "<body><p>Food banks give out groceries.</p><p>Call ahead.</p></body></html>")
+    (directory / "notes.txt").write_text("CHAS clinics offer subsidised care.")
+    (directory / "image.png").write_bytes(b"\x89PNG")
+
+
+def run(directory, writer, checkpoint, **kwargs):
+    return ingest([str(directory)], writer, FakeEmbeddings(dims=16), checkpoint, chunk_size=300, chunk_overlap=30,
+                  batch_size=4, workers=2, report_every=0, kb="finance", **kwargs)
+
+
+def test_documents_are_chunked_embedded_and_resumed(tmp_path):
+    sources = tmp_path / "docs"
+    sources.mkdir()
+    write_sources(sources)
+    writer = MemoryWriter()
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+
+    report = run(sources, writer, checkpoint)
+
+    assert report["documents"] == 3 and report["failed"] == 0
+    assert report["embeddings"] == report["chunks"] == len(writer.documents) > 3
+    food = writer.documents[chunk_id("food.html", 0)]
+    assert food["text"] == "Food banks give out groceries.\nCall ahead."
+    assert food["metadata"] == {"source": "food.html", "title": "Food banks", "chunk": 0, "kb": "finance"}
+    assert len(food["vector"]) == 16
+
+    #Unchanged documents are skipped by the next run, a shorter one loses its extra chunks
+    (sources / "comcare.md").write_text("# ComCare\n\nApply at a Social Service Office.")
+    report = run(sources, writer, Checkpoint(str(tmp_path / "checkpoint.json")))
+    assert report["skipped"] == 2 and report["documents"] == 1
+    assert [key for key in writer.documents if key.startswith(chunk_id("comcare.md", 0)[:16])] == [chunk_id("comcare.md", 0)]
+
+    (sources / "notes.txt").unlink()
+    run(sources, writer, Checkpoint(str(tmp_path / "checkpoint.json")), prune=True)
+    assert chunk_id("notes.txt", 0) not in writer.documents
+
+
+class PoisonedEmbeddings(FakeEmbeddings):
+    def embed_documents(self, texts):
+        if any("POISON" in text for text in texts):
+            raise ValueError("Input is too long for the model")
+        return super().embed_documents(texts)
+
+
+def test_failed_embedding_batch_fails_only_its_documents(tmp_path):
+    sources = tmp_path / "docs"
+    sources.mkdir()
+    write_sources(sources)
+    (sources / "bad.txt").write_text("POISON")
+    writer = MemoryWriter()
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+
+    report = ingest([str(sources)], writer, PoisonedEmbeddings(dims=16), checkpoint, chunk_size=300, chunk_overlap=30,
+                    batch_size=1, workers=2, report_every=0)
+
+    assert report["failed"] == 1 and report["embedding_errors"] == 1 and report["documents"] == 3
+    assert "bad.txt" not in checkpoint.documents and "notes.txt" in checkpoint.documents
+
+
+def test_html_text_skips_scripts():
+    text, title = parse_html("<title>T</title><style>p {}</style><div>One</div><div>Two &amp; three</div>")
+    assert (text, title) == ("One\nTwo & three", "T")
+
+
+@pytest.mark.skipif(not os.environ.get("ELASTIC_TEST_URL"), reason="set ELASTIC_TEST_URL to a local Elasticsearch")
+def test_ingest_into_elasticsearch(tmp_path):
+    from elasticsearch import Elasticsearch
+
+    sources = tmp_path / "docs"
+    sources.mkdir()
+    write_sources(sources)
+    es = Elasticsearch(os.environ["ELASTIC_TEST_URL"])
+    index = f"test-ingest-{uuid.uuid4().hex[:8]}"
+    try:
+        report = run(sources, ElasticsearchWriter(es, index), Checkpoint(str(tmp_path / "checkpoint.json")))
+        assert es.count(index=index)["count"] == report["chunks"]
+    finally:
+        es.options(ignore_status=404).indices.delete(index=index)
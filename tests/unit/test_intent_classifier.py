@@ -0,0 +1,54 @@
+import numpy as np
+from langchain_core.messages import AIMessage
+
+import multiagent_handler
+from benchmarks.fakes import FakeEmbeddings
+from components import components
+from intent_classifier import IntentClassifier
+from model_invoker import ModelInvoker
+
+AMBIGUOUS = "ComCare food bank"
+
+
+class CountingChat:
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return AIMessage(content=self.answer)
+
+
+def test_confident_and_ambiguous_queries(tmp_path):
+    classifier = IntentClassifier(FakeEmbeddings(dims=512), margin=0.05, min_similarity=0.3)
+
+    intent, margin = classifier.classify("Where is the nearest food bank?")
+    assert intent == "food_security" and margin >= 0.05
+    assert classifier.classify(AMBIGUOUS)[0] is None
+    #Too far from every exemplar, even if one intent is slightly ahead
+    assert IntentClassifier(FakeEmbeddings(dims=512), min_similarity=0.99).classify("food bank nearby")[0] is None
+
+    #Precomputed exemplar vectors give the same answers without embedding the exemplars
+    classifier.save(str(tmp_path / "intents.npy"))
+    loaded = IntentClassifier(FakeEmbeddings(dims=512), vectors_path=str(tmp_path / "intents.npy"))
+    assert np.allclose(loaded.exemplar_vectors(), classifier.exemplar_vectors())
+
+
+def test_only_ambiguous_queries_reach_the_llm():
+    chat = CountingChat("financial_aid")
+    invoker = ModelInvoker(tiers={"intent": ["small"]})
+    invoker._chats["small"] = chat
+    embeddings = FakeEmbeddings(dims=512)
+    components.set("bedrock_embeddings", embeddings)
+    components.set("intent_classifier", IntentClassifier(embeddings, margin=0.05, min_similarity=0.3))
+    components.set("model_invoker", invoker)
+    multiagent_handler.embed_query_cached.cache_clear()
+    try:
+        assert multiagent_handler.classify_intent("Where is the nearest food bank?") == "food_security"
+        assert chat.calls == 0
+        assert multiagent_handler.classify_intent(AMBIGUOUS) == "financial_aid"
+        assert chat.calls == 1
+    finally:
+        components.reset()
+        multiagent_handler.embed_query_cached.cache_clear()
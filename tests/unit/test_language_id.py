@@ -0,0 +1,50 @@
+from language_id import LanguageIdentifier, dominant_script
+
+
+def test_scripts_decide_without_a_detector():
+    identifier = LanguageIdentifier()
+
+    assert identifier.identify("我想申请医疗援助") == "zh"
+    assert identifier.identify("உணவு உதவி வேண்டும்") == "ta"
+    assert dominant_script("123 !?") is None
+
+
+def test_latin_text_is_english_or_malay():
+    identifier = LanguageIdentifier()
+
+    assert identifier.identify("How can I apply for financial assistance for my mother?") == "en"
+    assert identifier.identify("Bagaimana saya boleh memohon bantuan kewangan untuk ibu saya?") == "ms"
+
+
+def test_short_messages_reuse_the_users_language():
+    identifier = LanguageIdentifier()
+    identifier.identify("Bagaimana saya boleh memohon bantuan kewangan untuk ibu saya?", user_id="6591234567")
+
+    assert identifier.identify("ok", user_id="6591234567") == "ms"
+    assert identifier.identify("3", user_id="6591234567") == "ms"
+    assert identifier.identify("谢谢", user_id="6591234567") == "zh"
+    #The last identified language is remembered, and other users are unaffected
+    assert identifier.identify("ok", user_id="6591234567") == "zh"
+    assert identifier.identify("ok", user_id="6598765432") == "en"
+
+
+class FixedDetector(LanguageIdentifier):
+    def __init__(self, probability):
+        super().__init__(default_language="en")
+        self.probability = probability
+
+    def detect_latin(self, text):
+        return "ms", self.probability
+
+
+def test_short_message_without_history_needs_a_confident_detector():
+    assert FixedDetector(0.6).identify("terima kasih") == "en"
+    assert FixedDetector(0.95).identify("terima kasih") == "ms"
+    assert FixedDetector(0.95).identify("👍") == "en"
+
+
+def test_remembered_language_expires():
+    identifier = LanguageIdentifier(ttl=-1)
+    identifier.identify("我想申请医疗援助", user_id="6591234567")
+
+    assert identifier.identify("ok", user_id="6591234567") == "en"
@@ -0,0 +1,53 @@
+import time
+
+from message_queue import InMemoryMessageQueue, SQLiteMessageQueue, SQSMessageQueue
+
+
+class FakeSQSClient:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, **params):
+        self.sent.append(params)
+
+
+def test_fifo_queue_groups_messages_by_sender():
+    client = FakeSQSClient()
+    queue = SQSMessageQueue("https://sqs.ap-southeast-1.amazonaws.com/123/messages.fifo", client=client)
+
+    queue.send({"message": {"id": "wamid.1"}}, group_id="6591234567", deduplication_id="wamid.1")
+    queue.send({"message": {"id": "wamid.2"}})
+
+    assert client.sent[0]["MessageGroupId"] == "6591234567"
+    assert client.sent[0]["MessageDeduplicationId"] == "wamid.1"
+    assert client.sent[1]["MessageGroupId"] == "default"
+
+
+def test_standard_queue_sends_no_group():
+    client = FakeSQSClient()
+    SQSMessageQueue("https://sqs.ap-southeast-1.amazonaws.com/123/messages", client=client).send({}, group_id="6591234567")
+
+    assert "MessageGroupId" not in client.sent[0]
+
+
+def test_sqlite_queue_redelivers_messages_that_are_not_deleted(tmp_path):
+    queue = SQLiteMessageQueue(str(tmp_path / "queue.db"), visibility_timeout=0.1)
+    for i in range(3):
+        queue.send({"n": i})
+
+    batch = queue.receive(max_messages=2)
+    assert [body["n"] for _, body in batch] == [0, 1]
+    queue.delete(batch[0][0])
+    assert [body["n"] for _, body in queue.receive()] == [2]
+
+    time.sleep(0.15)
+    assert [body["n"] for _, body in queue.receive()] == [1, 2]
+
+
+def test_in_memory_queue_is_first_in_first_out():
+    queue = InMemoryMessageQueue()
+    for i in range(3):
+        queue.send({"n": i})
+
+    assert [body["n"] for _, body in queue.receive(max_messages=2)] == [0, 1]
+    assert len(queue) == 1
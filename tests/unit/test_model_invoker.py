@@ -0,0 +1,131 @@
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from components import components
+from model_invoker import AdaptiveLimiter, CircuitBreaker, ModelInvoker, ModelUnavailable, use_deadline
+
+
+class BedrockError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeChat:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return AIMessage(content=outcome)
+
+
+def make_invoker(chats, **kwargs):
+    invoker = ModelInvoker(tiers={"response": ["large", "small"]}, base_delay=0.001, **kwargs)
+    invoker._chats.update(chats)
+    return invoker
+
+
+def test_throttled_model_falls_back_to_the_next_tier():
+    large = FakeChat(*[BedrockError("ThrottlingException")] * 3)
+    small = FakeChat("small answer")
+    invoker = make_invoker({"large": large, "small": small})
+
+    assert invoker.invoke_chat("response", []).content == "small answer"
+    assert large.calls == 3
+    assert invoker.limiter("large").limit == 1
+
+
+def test_errors_that_retrying_cannot_fix_are_raised_at_once():
+    large = FakeChat(BedrockError("ValidationException"))
+    invoker = make_invoker({"large": large, "small": FakeChat()})
+
+    with pytest.raises(BedrockError):
+        invoker.invoke_chat("response", [])
+    assert large.calls == 1
+    assert invoker.breaker("large").state == "closed"
+
+
+def test_circuit_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_open_circuit_and_deadline_skip_the_call():
+    large = FakeChat(*[BedrockError("ServiceUnavailableException")] * 2)
+    invoker = make_invoker({"large": large, "small": FakeChat()}, max_attempts=1, failure_threshold=2)
+    invoker.tiers = {"response": ["large"]}
+    for _ in range(2):
+        with pytest.raises(ModelUnavailable):
+            invoker.invoke_chat("response", [])
+    with pytest.raises(ModelUnavailable):
+        invoker.invoke_chat("response", [])
+    assert large.calls == 2
+
+    small = FakeChat()
+    invoker = make_invoker({"small": small}, min_time_left=1.0)
+    invoker.tiers = {"response": ["small"]}
+    with use_deadline(time.monotonic() + 0.5), pytest.raises(ModelUnavailable):
+        invoker.invoke_chat("response", [])
+    assert small.calls == 0
+
+
+def test_trial_call_skipped_for_the_deadline_is_not_lost():
+    large = FakeChat(BedrockError("ServiceUnavailableException"))
+    invoker = make_invoker({"large": large}, max_attempts=1, failure_threshold=1, reset_timeout=0.05, min_time_left=1.0)
+    invoker.tiers = {"response": ["large"]}
+    with pytest.raises(ModelUnavailable):
+        invoker.invoke_chat("response", [])
+
+    time.sleep(0.06)
+    with use_deadline(time.monotonic() + 0.5), pytest.raises(ModelUnavailable):
+        invoker.invoke_chat("response", [])
+    assert invoker.invoke_chat("response", []).content == "ok"
+    assert invoker.breaker("large").state == "closed"
+    assert invoker.limiter("large").in_flight == 0
+
+
+def test_limiter_backs_off_and_recovers():
+    limiter = AdaptiveLimiter(initial=4, maximum=8)
+    assert limiter.acquire(0)
+    limiter.release(throttled=True)
+    assert limiter.limit == 2
+    for _ in range(4):
+        assert limiter.acquire(0)
+        limiter.release()
+    assert limiter.limit > 3
+    assert limiter.acquire(0) and limiter.acquire(0) and limiter.acquire(0)
+    assert not limiter.acquire(0.01)
+
+
+def test_unavailable_generation_answers_from_the_documents():
+    import multiagent_handler
+
+    components.set("model_invoker", make_invoker({"large": FakeChat(*[BedrockError("ThrottlingException")] * 3),
+                                                  "small": FakeChat(*[BedrockError("ThrottlingException")] * 3)}))
+    try:
+        state = multiagent_handler.generate_response_node({
+            "query": "How do I apply for ComCare?", "language": "en", "cacheable": True,
+            "context": ["ComCare gives monthly cash assistance to low-income households."],
+            "chat_history": [{"role": "user", "content": "How do I apply for ComCare?"}]})
+    finally:
+        components.reset("model_invoker")
+
+    assert "ComCare gives monthly cash assistance" in state["response"]
+    assert state["chat_history"][-1] == {"role": "bot", "content": state["response"]}
+    assert state["cacheable"] is False
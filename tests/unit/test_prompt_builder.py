@@ -0,0 +1,51 @@
+from prompt_builder import PromptBuilder, estimate_tokens, truncate_to_tokens
+
+
+def test_context_is_truncated_to_the_budget():
+    builder = PromptBuilder(token_budget=400, history_share=0.25)
+    documents = ["ComCare " * 100, "MediFund " * 100, "Lions Befrienders " * 100]
+    history = [{"role": "user", "content": f"question {i} " * 20} if i % 2 == 0 else
+               {"role": "bot", "content": f"answer {i} " * 20} for i in range(10)]
+
+    messages, counts = builder.build("How do I apply?", documents, history)
+
+    assert counts["history_tokens"] <= 100
+    assert counts["dropped_messages"] > 0
+    assert counts["history_tokens"] + counts["context_tokens"] <= 400
+    assert counts["dropped_documents"] >= 1
+    prompt = messages[0].content
+    assert "earlier messages omitted" in prompt
+    assert "Lions Befrienders" not in prompt
+
+
+def test_small_prompts_are_kept_whole():
+    builder = PromptBuilder(token_budget=2000)
+    history = [{"role": "user", "content": "hi"}, {"role": "bot", "content": "hello"},
+               {"role": "user", "content": "What is CHAS?"}]
+
+    messages, counts = builder.build("What is CHAS?", ["CHAS subsidises clinic visits."], history)
+
+    assert counts["dropped_messages"] == 0 and counts["dropped_documents"] == 0
+    #The question is sent once, not also as the last history line
+    assert messages[0].content.count("What is CHAS?") == 1
+
+
+def test_template_matches_the_reply_language():
+    builder = PromptBuilder()
+
+    chinese = builder.build("有哪些食品援助计划？", [], [], language="zh")[0][0].content
+    tamil = builder.build("உணவு உதவி?", [], [], language="ta")[0][0].content
+    unknown = builder.build("Hola", [], [], language="es")[0][0].content
+
+    assert "Mandarin" in chinese and "English Example" not in chinese
+    assert "Tamil" in tamil and "Mandarin" not in tamil
+    assert "English Example" in unknown
+
+
+def test_truncation_respects_non_ascii_cost():
+    text = "援助" * 100
+    truncated = truncate_to_tokens(text, 20)
+
+    assert estimate_tokens(truncated[:-1]) <= 20
+    assert truncated.endswith("…")
+    assert truncate_to_tokens("short", 20) == "short"
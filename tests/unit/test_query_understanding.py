@@ -0,0 +1,45 @@
+import pytest
+from langchain_core.messages import AIMessage
+
+from query_understanding import QueryUnderstanding, UnderstandingError, parse_understanding
+
+
+class FakeChat:
+    def __init__(self, content):
+        self.content = content
+        self.messages = None
+
+    def invoke(self, messages):
+        self.messages = messages
+        return AIMessage(content=self.content)
+
+
+def test_answer_is_validated_and_normalized():
+    answer = '```json\n{"intent": "Financial Aid", "language": "zh-CN", "english_query": " How do I apply for ComCare? "}\n```'
+
+    assert parse_understanding(answer, "如何申请社区关怀计划？") == {
+        "intent": "financial_aid", "language": "zh", "english_query": "How do I apply for ComCare?"}
+
+
+@pytest.mark.parametrize("answer", [
+    "financial_aid",
+    '{"intent": "weather", "language": "en", "english_query": "Is it raining?"}',
+    '{"intent": "other", "language": "English", "english_query": "Is it raining?"}',
+    '{"intent": "other", "language": "en", "english_query": ""}',
+])
+def test_invalid_answers_are_rejected(answer):
+    with pytest.raises(UnderstandingError):
+        parse_understanding(answer, "Is it raining?")
+
+
+def test_follow_up_is_sent_with_the_last_turn():
+    chat = FakeChat('{"intent": "financial_aid", "language": "ms", "english_query": "How do I apply for ComCare?"}')
+    history = [{"role": "user", "content": "Apa itu ComCare?"}, {"role": "bot", "content": "ComCare membantu keluarga."}]
+
+    understanding = QueryUnderstanding(chat=chat, use_history=True).understand("Bagaimana saya memohon?", chat_history=history)
+
+    assert understanding["english_query"] == "How do I apply for ComCare?"
+    prompt = chat.messages[-1].content
+    assert "Previous message: Apa itu ComCare?" in prompt
+    assert "Previous reply: ComCare membantu keluarga." in prompt
+    assert prompt.endswith("Message: Bagaimana saya memohon?\nJSON:")
@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+import pytest
+
+from response_cache import MemoryCacheBackend, SemanticCache, SQLiteCacheBackend, depends_on_history
+
+HISTORY = [{"role": "user", "content": "What is ComCare?"}, {"role": "bot", "content": "ComCare is ..."}]
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteCacheBackend(str(tmp_path / "cache.db"))
+    return MemoryCacheBackend()
+
+
+def test_similar_query_hits_and_dissimilar_misses(backend):
+    cache = SemanticCache(backend, threshold=0.95)
+    cache.store(vector(1, 0, 0), "financial_aid", "en", "Apply for ComCare at an SSO.")
+
+    assert cache.lookup(vector(0.99, 0.05, 0), "financial_aid", "en") == "Apply for ComCare at an SSO."
+    assert cache.lookup(vector(0.7, 0.7, 0), "financial_aid", "en") is None
+    #Same query, other partition
+    assert cache.lookup(vector(1, 0, 0), "financial_aid", "zh") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "skipped": 0, "stores": 1, "hit_rate": 1 / 3}
+
+
+def test_expired_entries_miss_and_are_deleted(backend):
+    cache = SemanticCache(backend, ttl=0.05)
+    cache.store(vector(1, 0), "healthcare", "en", "CHAS clinics")
+
+    time.sleep(0.06)
+    assert cache.lookup(vector(1, 0), "healthcare", "en") is None
+    assert backend.entries(("healthcare", "en"))[0] == []
+
+
+def test_least_recently_used_entry_is_evicted(backend):
+    cache = SemanticCache(backend, max_entries=2)
+    cache.store(vector(1, 0, 0), "food_security", "en", "food banks")
+    time.sleep(0.01)
+    cache.store(vector(0, 1, 0), "food_security", "en", "meals")
+    time.sleep(0.01)
+    assert cache.lookup(vector(1, 0, 0), "food_security", "en") == "food banks"
+    time.sleep(0.01)
+    cache.store(vector(0, 0, 1), "food_security", "en", "vouchers")
+
+    assert cache.lookup(vector(0, 1, 0), "food_security", "en") is None
+    assert cache.lookup(vector(1, 0, 0), "food_security", "en") == "food banks"
+    assert cache.lookup(vector(0, 0, 1), "food_security", "en") == "vouchers"
+
+
+def test_sqlite_entries_are_shared_between_containers(tmp_path):
+    SemanticCache(SQLiteCacheBackend(str(tmp_path / "cache.db"))).store(vector(1, 0), "other", "en", "Hello!")
+
+    assert SemanticCache(SQLiteCacheBackend(str(tmp_path / "cache.db"))).lookup(vector(1, 0), "other", "en") == "Hello!"
+
+
+@pytest.mark.parametrize("query, history, expected", [
+    ("How do I apply for it?", HISTORY, True),
+    ("more", HISTORY, True),
+    ("How do I apply for the CHAS card at a polyclinic?", HISTORY, False),
+    ("How do I apply for it?", [], False),
+    ("How do I apply for it?", [{"role": "user", "content": "hi"}], False),
+])
+def test_depends_on_history(query, history, expected):
+    assert depends_on_history(query, history) is expected
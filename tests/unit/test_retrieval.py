@@ -0,0 +1,52 @@
+import time
+
+import multiagent_handler
+from components import components
+
+
+class FakeSnapshot:
+    def __init__(self, results, delay=0.0):
+        self.results = results
+        self.delay = delay
+
+    def search(self, query_vector, k=3):
+        time.sleep(self.delay)
+        return self.results[:k]
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+def search_all(snapshots, timeout=1.0):
+    components.set("bedrock_embeddings", FakeEmbeddings())
+    components.set("kb_snapshots", snapshots)
+    try:
+        return multiagent_handler.multi_index_retrieval("help with bills", k=3, timeout=timeout)
+    finally:
+        components.reset()
+
+
+def test_indices_are_fused_by_rank_not_raw_score():
+    documents = search_all({
+        #Script-style scores around 1.8 would beat every kNN-style score below 1 if merged raw
+        "financial_aid": FakeSnapshot([("ComCare", 1.80), ("Silver Support", 1.79), ("CDC vouchers", 1.78)]),
+        "food_security": FakeSnapshot([("Food banks", 0.95), ("ComCare", 0.90)]),
+        "healthcare": FakeSnapshot([("CHAS", 0.5)]),
+    })
+
+    assert documents[0] == "ComCare"
+    assert set(documents[1:]) == {"Food banks", "CHAS"}
+
+
+def test_slow_index_is_left_out():
+    start = time.monotonic()
+    documents = search_all({
+        "financial_aid": FakeSnapshot([("ComCare", 1.8)]),
+        "food_security": FakeSnapshot([("Food banks", 0.9)], delay=1.0),
+        "healthcare": FakeSnapshot([("CHAS", 0.5)]),
+    }, timeout=0.2)
+
+    assert set(documents) == {"ComCare", "CHAS"}
+    assert time.monotonic() - start < 0.8
@@ -0,0 +1,46 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+
+def test_trace_is_emitted_once_as_emf():
+    lines = []
+    tracer = tracing.Tracer(namespace="Test", sink=lines.append)
+
+    def search(index):
+        with tracing.span(f"retrieval.{index}"):
+            pass
+
+    with tracer.trace("message", message_type="text"):
+        with tracing.span("intent"):
+            pass
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(tracing.bind(search), ["finance", "food"]))
+        tracing.metric("input_tokens", 120)
+        tracing.metric("response_cache_hit", 0)
+
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    directive = record["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "Test"
+    assert directive["Dimensions"] == [["Trace"]]
+    units = {metric["Name"]: metric["Unit"] for metric in directive["Metrics"]}
+    assert units["intent_ms"] == "Milliseconds"
+    assert units["input_tokens"] == "Count"
+    assert {"retrieval.finance_ms", "retrieval.food_ms", "total_ms"} <= set(units)
+    assert record["Trace"] == "message"
+    assert record["message_type"] == "text"
+    assert record["input_tokens"] == 120
+
+
+def test_unsampled_and_disabled_traces_record_nothing():
+    lines = []
+    for tracer in (tracing.Tracer(mode="off", sink=lines.append), tracing.Tracer(sample_rate=0, sink=lines.append)):
+        with tracer.trace("message") as trace:
+            assert trace is None
+            assert tracing.span("intent") is tracing.NULL_SPAN
+            tracing.metric("input_tokens", 1)
+
+    assert lines == []
+    assert tracing.current() is None
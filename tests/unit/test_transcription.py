@@ -0,0 +1,62 @@
+import io
+import base64
+import json
+
+import pytest
+
+import tracing
+from tests.mock_graph_api import MockGraphAPI
+from transcription import VoiceMessageError, VoiceTranscriber
+from whatsapp_client import WhatsAppClient
+
+
+class FakeBedrock:
+    def __init__(self):
+        self.calls = []
+
+    def invoke_model(self, modelId, body, contentType):
+        self.calls.append((modelId, json.loads(body)))
+        return {"body": io.BytesIO(json.dumps({"content": [{"text": "how do I apply for comcare"}]}).encode())}
+
+
+def make_transcriber(graph_api, bedrock, **kwargs):
+    client = WhatsAppClient(token="test-token", phone_number_id="12345", base_url=graph_api.url, backoff=0.01)
+    return VoiceTranscriber(client, bedrock, model_id="test-model", **kwargs)
+
+
+def test_transcription_is_cached_by_media_id():
+    bedrock = FakeBedrock()
+    with MockGraphAPI(media={"m1": {"data": b"OggS" * 1000, "mime_type": "audio/ogg; codecs=opus"}}) as graph_api:
+        transcriber = make_transcriber(graph_api, bedrock)
+        with tracing.Tracer(sink=lambda line: None).trace("message") as trace:
+            assert transcriber.transcribe("m1") == "how do I apply for comcare"
+            assert transcriber.transcribe("m1") == "how do I apply for comcare"
+
+    assert {"voice_media_info", "voice_download", "transcribe"} <= set(trace.durations)
+    assert trace.metrics["transcription_cache_hit"] == ("Count", [0, 1])
+    assert len(bedrock.calls) == 1
+    model_id, body = bedrock.calls[0]
+    source = body["messages"][0]["content"][0]["source"]
+    assert model_id == "test-model"
+    assert source["media_type"] == "audio/ogg"
+    assert base64.b64decode(source["data"]) == b"OggS" * 1000
+    assert len(graph_api.requests) == 2
+
+
+def test_oversize_media_is_rejected_before_download():
+    bedrock = FakeBedrock()
+    with MockGraphAPI(media={"m1": {"data": b"x" * 2048, "mime_type": "audio/ogg"}}) as graph_api:
+        with pytest.raises(VoiceMessageError):
+            make_transcriber(graph_api, bedrock, max_bytes=1024).transcribe("m1")
+
+    assert len(graph_api.requests) == 1
+    assert bedrock.calls == []
+
+
+def test_unsupported_media_type_is_rejected():
+    bedrock = FakeBedrock()
+    with MockGraphAPI(media={"m1": {"data": b"\x89PNG", "mime_type": "image/png"}}) as graph_api:
+        with pytest.raises(VoiceMessageError):
+            make_transcriber(graph_api, bedrock).transcribe("m1")
+
+    assert bedrock.calls == []
@@ -0,0 +1,64 @@
+from translation import TranslationService
+
+
+class FakeTranslate:
+    def __init__(self, merge_lines=False):
+        self.requests = []
+        self.merge_lines = merge_lines
+
+    def translate_text(self, Text, SourceLanguageCode, TargetLanguageCode):
+        self.requests.append(Text)
+        translated = "\n".join(f"[{TargetLanguageCode}] {line}" for line in Text.split("\n"))
+        if self.merge_lines:
+            translated = translated.replace("\n", " ")
+        return {"TranslatedText": translated}
+
+
+def test_batch_is_one_request_and_cached():
+    client = FakeTranslate()
+    service = TranslationService(client=client)
+
+    texts = ["Apply at an SSO.", "1800-222-0000", "Apply at an SSO.", "Bring your NRIC."]
+    assert service.translate_batch(texts, "en", "zh") == [
+        "[zh] Apply at an SSO.", "1800-222-0000", "[zh] Apply at an SSO.", "[zh] Bring your NRIC."]
+    assert client.requests == ["Apply at an SSO.\nBring your NRIC."]
+
+    assert service.translate("Bring your NRIC.", "en", "zh") == "[zh] Bring your NRIC."
+    assert service.translate_batch(["Apply at an SSO.", "Bring your NRIC."], "en", "zh")[1] == "[zh] Bring your NRIC."
+    assert len(client.requests) == 1
+
+
+def test_multi_line_texts_and_changed_line_counts_go_one_by_one():
+    client = FakeTranslate(merge_lines=True)
+    service = TranslationService(client=client)
+
+    translated = service.translate_batch(["First line\nsecond line", "One", "Two"], "en", "ms")
+
+    assert translated == ["[ms] First line [ms] second line", "[ms] One", "[ms] Two"]
+    assert client.requests == ["First line\nsecond line", "One\nTwo", "One", "Two"]
+
+
+def test_large_batches_are_split_under_the_request_limit():
+    client = FakeTranslate()
+    texts = [f"document {i} " + "x" * 2000 for i in range(10)]
+
+    TranslationService(client=client).translate_batch(texts, "en", "ta")
+
+    assert len(client.requests) > 1
+    assert all(len(request.encode("utf-8")) <= 9000 for request in client.requests)
+    assert sum(request.count("\n") + 1 for request in client.requests) == 10
+
+
+def test_degraded_reply_is_translated_as_a_batch():
+    import multiagent_handler
+
+    client = FakeTranslate()
+    original = multiagent_handler.translation_service
+    multiagent_handler.translation_service = TranslationService(client=client)
+    try:
+        reply = multiagent_handler.degraded_reply(["ComCare gives monthly cash.", "Apply at an SSO."], "zh")
+    finally:
+        multiagent_handler.translation_service = original
+
+    assert reply == f"[zh] {multiagent_handler.DEGRADED_HEADER}\n\n- [zh] ComCare gives monthly cash.\n\n- [zh] Apply at an SSO."
+    assert len(client.requests) == 1
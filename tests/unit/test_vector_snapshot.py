@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from vector_snapshot import VectorSnapshot, load_snapshot, write_snapshot
+
+TEXTS = ["ComCare gives monthly cash.", "", "援助计划 for seniors", "Meals-on-Wheels delivers food."]
+VERSION = {"doc_count": 4, "max_seq_no": 7}
+
+
+class FakeES:
+    def __init__(self, doc_count, max_seq_no):
+        self.doc_count, self.max_seq_no = doc_count, max_seq_no
+
+    def count(self, index):
+        return {"count": self.doc_count}
+
+    def search(self, **kwargs):
+        return {"hits": {"hits": [{"_seq_no": self.max_seq_no}]}}
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_snapshot_round_trip(tmp_path, dtype):
+    vectors = np.random.default_rng(0).normal(size=(4, 32)).astype(np.float32)
+    write_snapshot(str(tmp_path), "finance_kb", TEXTS, vectors, VERSION, dtype=dtype)
+
+    snapshot = VectorSnapshot(str(tmp_path), "finance_kb")
+    assert isinstance(snapshot.vectors, np.memmap) and snapshot.vectors.dtype == np.dtype(dtype)
+    #Offsets keep empty and multi-byte documents apart
+    assert [snapshot.document(position) for position in range(len(snapshot))] == TEXTS
+
+    for position, vector in enumerate(vectors):
+        (text, score), = snapshot.search(vector * 3.0, k=1)
+        assert text == TEXTS[position]
+        assert score == pytest.approx(2.0, abs=0.01 if dtype == "int8" else 1e-5)
+
+
+def test_int8_scores_track_float32(tmp_path):
+    vectors = np.random.default_rng(1).normal(size=(50, 64)).astype(np.float32)
+    texts = [f"document {i}" for i in range(50)]
+    write_snapshot(str(tmp_path / "f32"), "kb", texts, vectors, VERSION)
+    write_snapshot(str(tmp_path / "i8"), "kb", texts, vectors, VERSION, dtype="int8")
+    query = np.random.default_rng(2).normal(size=64)
+
+    exact = dict(VectorSnapshot(str(tmp_path / "f32"), "kb").search(query, k=5))
+    quantized = dict(VectorSnapshot(str(tmp_path / "i8"), "kb").search(query, k=5))
+    for text in set(exact) & set(quantized):
+        assert quantized[text] == pytest.approx(exact[text], abs=0.02)
+    assert len(set(exact) & set(quantized)) >= 4
+
+
+def test_stale_or_missing_snapshots_are_not_loaded(tmp_path):
+    write_snapshot(str(tmp_path), "food_kb", TEXTS, np.eye(4, dtype=np.float32), VERSION)
+
+    assert load_snapshot(str(tmp_path), "food_kb", es_client=FakeES(4, 7)) is not None
+    assert load_snapshot(str(tmp_path), "food_kb", es_client=FakeES(5, 8)) is None
+    assert load_snapshot(str(tmp_path), "healthcare_kb") is None
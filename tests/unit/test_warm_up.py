@@ -0,0 +1,22 @@
+import json
+
+import whatsapp_handler
+from components import components
+
+
+def test_warm_up_events_are_recognized():
+    assert whatsapp_handler.is_warm_up({'source': 'aws.events', 'detail-type': 'Scheduled Event'})
+    assert whatsapp_handler.is_warm_up({'warmup': True})
+    assert not whatsapp_handler.is_warm_up({'httpMethod': 'POST', 'warmup': True, 'body': '{}'})
+    assert not whatsapp_handler.is_warm_up({'Records': []})
+
+
+def test_warm_up_creates_stores_without_messaging():
+    try:
+        response = whatsapp_handler.warm_up({'warmup': True}, pipeline=False)
+
+        assert response['statusCode'] == 200
+        assert 'stores' in json.loads(response['body'])['timings_ms']
+        assert {'deduplicator', 'history_store', 'whatsapp_client'} <= set(components.loaded())
+    finally:
+        components.reset()
@@ -1,15 +1,107 @@
+import zipfile
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
+
+from whatsapp_ai_bot.whatsapp_ai_stack import WhatsAppAIStack
+
+TABLE_WRITE_ACTION = "dynamodb:PutItem"
+
+
+@pytest.fixture
+def synth(tmp_path):
+    assets = {}
+    for name in ("lambda_package.zip", "lambda_layer.zip"):
+        assets[name] = str(tmp_path / name)
+        with zipfile.ZipFile(assets[name], "w") as archive:
+            archive.writestr("placeholder.py", "")
+
+    def synth(**kwargs):
+        stack = WhatsAppAIStack(core.App(), "whatsapp-ai-bot",
+                                package_asset=assets["lambda_package.zip"],
+                                layer_asset=assets["lambda_layer.zip"], **kwargs)
+        return assertions.Template.from_stack(stack)
+    return synth
+
+
+def logical_id(template, resource_type, predicate):
+    matches = [resource_id for resource_id, resource in template.find_resources(resource_type).items()
+               if predicate(resource["Properties"])]
+    assert len(matches) == 1
+    return matches[0]
+
+
+def function_role(template, handler):
+    function_id = logical_id(template, "AWS::Lambda::Function", lambda properties: properties.get("Handler") == handler)
+    return template.find_resources("AWS::Lambda::Function")[function_id]["Properties"]["Role"]["Fn::GetAtt"][0]
+
+
+def roles_granted(template, resource_id, action):
+    """Roles with an IAM policy statement allowing `action` on the resource"""
+    roles = set()
+    for policy in template.find_resources("AWS::IAM::Policy").values():
+        properties = policy["Properties"]
+        for statement in properties["PolicyDocument"]["Statement"]:
+            actions = statement["Action"] if isinstance(statement["Action"], list) else [statement["Action"]]
+            resources = statement["Resource"] if isinstance(statement["Resource"], list) else [statement["Resource"]]
+            if action in actions and any(resource_id in str(resource) for resource in resources):
+                roles.update(role["Ref"] for role in properties["Roles"])
+    return roles
+
+
+def test_async_stack_queues_messages_for_a_worker(synth):
+    template = synth(async_processing=True, worker_batch_size=5, worker_max_concurrency=10)
+
+    dlq_id = logical_id(template, "AWS::SQS::Queue", lambda properties: "RedrivePolicy" not in properties)
+    queue_id = logical_id(template, "AWS::SQS::Queue", lambda properties: "RedrivePolicy" in properties)
+    template.has_resource_properties("AWS::SQS::Queue", {"FifoQueue": True, "VisibilityTimeout": 360, "RedrivePolicy": {
+        "deadLetterTargetArn": {"Fn::GetAtt": [dlq_id, "Arn"]}, "maxReceiveCount": 3}})
+    template.has_resource_properties("AWS::SQS::Queue", {"FifoQueue": True, "MessageRetentionPeriod": 14 * 24 * 3600})
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "whatsapp_handler.handle",
+        "Environment": {"Variables": assertions.Match.object_like({"ASYNC_PROCESSING": "true", "MESSAGE_QUEUE_BACKEND": "sqs"})}})
+    template.has_resource_properties("AWS::Lambda::Function", {"Handler": "whatsapp_worker.handle"})
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "EventSourceArn": {"Fn::GetAtt": [queue_id, "Arn"]},
+        "FunctionName": {"Ref": logical_id(template, "AWS::Lambda::Function",
+                                           lambda properties: properties.get("Handler") == "whatsapp_worker.handle")},
+        "BatchSize": 5,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+        "ScalingConfig": {"MaximumConcurrency": 10}})
+
+    handler_role = function_role(template, "whatsapp_handler.handle")
+    worker_role = function_role(template, "whatsapp_worker.handle")
+    assert roles_granted(template, queue_id, "sqs:SendMessage") == {handler_role}
+    assert worker_role in roles_granted(template, queue_id, "sqs:ReceiveMessage")
+
+
+def test_history_and_dedup_tables_are_granted_to_their_users(synth):
+    template = synth(async_processing=True)
+
+    history_id = logical_id(template, "AWS::DynamoDB::Table",
+                            lambda properties: properties["KeySchema"][0]["AttributeName"] == "phone_number")
+    dedup_id = logical_id(template, "AWS::DynamoDB::Table",
+                          lambda properties: properties["KeySchema"][0]["AttributeName"] == "message_id")
+    tables = template.find_resources("AWS::DynamoDB::Table")
+    for table_id in (history_id, dedup_id):
+        assert tables[table_id]["Properties"]["BillingMode"] == "PAY_PER_REQUEST"
+        assert tables[table_id]["Properties"]["TimeToLiveSpecification"] == {"AttributeName": "expires_at", "Enabled": True}
+
+    handler_role = function_role(template, "whatsapp_handler.handle")
+    worker_role = function_role(template, "whatsapp_worker.handle")
+    assert roles_granted(template, history_id, TABLE_WRITE_ACTION) == {handler_role, worker_role}
+    assert roles_granted(template, dedup_id, TABLE_WRITE_ACTION) == {handler_role}
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "whatsapp_handler.handle",
+        "Environment": {"Variables": assertions.Match.object_like({
+            "HISTORY_TABLE": {"Ref": history_id}, "DEDUP_TABLE": {"Ref": dedup_id}})}})
 
-from whatsapp_ai_bot.whatsapp_ai_stack import WhatsappAiBotStack
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in whatsapp_ai_bot/whatsapp_ai_bot_stack.py
-def test_sqs_queue_created():
-    app = core.App()
-    stack = WhatsappAiBotStack(app, "whatsapp-ai-bot")
-    template = assertions.Template.from_stack(stack)
+def test_sync_stack_has_no_queue_or_worker(synth):
+    template = synth(async_processing=False)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+    template.resource_count_is("AWS::SQS::Queue", 0)
+    template.resource_count_is("AWS::Lambda::EventSourceMapping", 0)
+    template.resource_count_is("AWS::Lambda::Function", 1)
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+import requests
+
+from tests.mock_graph_api import MockGraphAPI
+from whatsapp_client import AsyncWhatsAppClient, WhatsAppClient
+
+
+def make_client(graph_api, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return WhatsAppClient(token="test-token", phone_number_id="12345", base_url=graph_api.url, **kwargs)
+
+
+def test_send_text_uses_configured_phone_number_id():
+    with MockGraphAPI() as graph_api:
+        response = make_client(graph_api).send_text("6591234567", "hello")
+
+    assert response["messages"][0]["id"] == "wamid.1"
+    assert graph_api.sent_messages[0]["phone_number_id"] == "12345"
+    assert graph_api.sent_messages[0]["text"] == {"body": "hello"}
+    assert graph_api.requests[0][2] == "Bearer test-token"
+
+
+def test_connections_are_reused():
+    with MockGraphAPI() as graph_api:
+        client = make_client(graph_api)
+        for i in range(5):
+            client.send_text("6591234567", f"message {i}")
+
+    assert len(graph_api.sent_messages) == 5
+    assert len(graph_api.client_ports) == 1
+
+
+def test_media_lookup_retries_server_errors():
+    with MockGraphAPI(media={"m1": {"data": b"OggS", "mime_type": "audio/ogg"}}) as graph_api:
+        graph_api.fail_next(2, status=502)
+        client = make_client(graph_api)
+        response = client.get_media("m1")
+        audio = client.download(response.json()["url"], stream=False).content
+
+    assert response.status_code == 200
+    assert audio == b"OggS"
+    assert len(graph_api.requests) == 4
+
+
+def test_send_is_not_retried_on_ambiguous_errors():
+    with MockGraphAPI() as graph_api:
+        graph_api.fail_next(1, status=500)
+        with pytest.raises(requests.HTTPError):
+            make_client(graph_api).send_text("6591234567", "hello")
+
+    assert graph_api.sent_messages == []
+    assert len(graph_api.requests) == 1
+
+
+def test_send_is_retried_when_throttled():
+    with MockGraphAPI() as graph_api:
+        graph_api.fail_next(1, status=429, headers={"Retry-After": "0"})
+        make_client(graph_api).send_text("6591234567", "hello")
+
+    assert len(graph_api.sent_messages) == 1
+
+
+def test_read_timeout():
+    with MockGraphAPI(latency=0.5) as graph_api:
+        with pytest.raises(requests.Timeout):
+            make_client(graph_api, read_timeout=0.1, max_retries=1).get_media("m1")
+
+
+def test_async_client():
+    async def send_all(client):
+        return await asyncio.gather(*(client.send_text("6591234567", f"message {i}") for i in range(3)))
+
+    with MockGraphAPI() as graph_api:
+        responses = asyncio.run(send_all(AsyncWhatsAppClient(make_client(graph_api))))
+
+    assert len(responses) == 3
+    assert len(graph_api.sent_messages) == 3
+
+
+def test_send_without_phone_number_id_is_refused(monkeypatch):
+    monkeypatch.delenv("PHONE_NUMBER_ID", raising=False)
+    with MockGraphAPI() as graph_api:
+        client = WhatsAppClient(token="test-token", base_url=graph_api.url)
+        with pytest.raises(ValueError, match="PHONE_NUMBER_ID"):
+            client.send_text("6591234567", "hello")
+
+    assert graph_api.sent_messages == []
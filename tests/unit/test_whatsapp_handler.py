@@ -0,0 +1,57 @@
+import threading
+import time
+
+import whatsapp_handler
+
+
+def message(message_id, sender, text="hi"):
+    return message_id, {"id": message_id, "from": sender, "type": "text", "text": {"body": text}}
+
+
+def test_each_sender_is_processed_in_order(monkeypatch):
+    processed = []
+    lock = threading.Lock()
+
+    def process_message(msg):
+        #The first message of a sender is the slowest, so a reordering would show
+        time.sleep(0.05 if msg["id"].endswith("1") else 0)
+        with lock:
+            processed.append(msg["id"])
+    monkeypatch.setattr(whatsapp_handler, "process_message", process_message)
+
+    items = [message("a1", "65111"), message("b1", "65222"), message("a2", "65111"),
+             message("a3", "65111"), message("b2", "65222")]
+    assert whatsapp_handler.process_by_sender(items, concurrency=2) == []
+
+    assert [message_id for message_id in processed if message_id.startswith("a")] == ["a1", "a2", "a3"]
+    assert [message_id for message_id in processed if message_id.startswith("b")] == ["b1", "b2"]
+
+
+def test_failure_fails_the_senders_later_messages_only(monkeypatch):
+    processed = []
+
+    def process_message(msg):
+        if msg["text"]["body"] == "fail":
+            raise RuntimeError("send failed")
+        processed.append(msg["id"])
+    monkeypatch.setattr(whatsapp_handler, "process_message", process_message)
+
+    items = [message("a1", "65111"), message("a2", "65111", "fail"), message("b1", "65222"),
+             message("a3", "65111"), message("b2", "65222")]
+    failed = whatsapp_handler.process_by_sender(items, concurrency=2)
+
+    assert failed == ["a2", "a3"]
+    assert sorted(processed) == ["a1", "b1", "b2"]
+
+
+def test_senders_are_processed_concurrently(monkeypatch):
+    running = []
+    both_started = threading.Barrier(2, timeout=2)
+
+    def process_message(msg):
+        running.append(msg["from"])
+        both_started.wait()
+    monkeypatch.setattr(whatsapp_handler, "process_message", process_message)
+
+    assert whatsapp_handler.process_by_sender([message("a1", "65111"), message("b1", "65222")], concurrency=2) == []
+    assert sorted(running) == ["65111", "65222"]
@@ -0,0 +1,41 @@
+import json
+
+import whatsapp_handler
+import whatsapp_worker
+from message_queue import InMemoryMessageQueue
+
+
+def record(message_id, sender, text):
+    message = {"id": message_id, "from": sender, "type": "text", "text": {"body": text}}
+    return {"messageId": f"sqs-{message_id}", "body": json.dumps({"message": message})}
+
+
+def test_failed_messages_are_reported_as_batch_item_failures(monkeypatch):
+    processed = []
+
+    def process_message(message):
+        if message["text"]["body"] == "fail":
+            raise RuntimeError("Bedrock unavailable")
+        processed.append(message["id"])
+    monkeypatch.setattr(whatsapp_handler, "process_message", process_message)
+
+    event = {"Records": [record("a1", "6511111111", "hi"), record("b1", "6522222222", "fail"),
+                         record("a2", "6511111111", "thanks"), record("b2", "6522222222", "hello?")]}
+    response = whatsapp_worker.handle(event, None)
+
+    #b2 waits for b1, so a redelivery keeps the sender's order
+    assert response == {"batchItemFailures": [{"itemIdentifier": "sqs-b1"}, {"itemIdentifier": "sqs-b2"}]}
+    assert processed == ["a1", "a2"]
+
+
+def test_local_worker_deletes_only_processed_messages(monkeypatch):
+    monkeypatch.setattr(whatsapp_handler, "process_message", lambda message: None)
+    queue = InMemoryMessageQueue()
+    deleted = []
+    monkeypatch.setattr(queue, "delete", deleted.append)
+    for i in range(3):
+        queue.send({"message": {"id": f"m{i}", "from": "6511111111", "type": "text", "text": {"body": "hi"}}})
+
+    whatsapp_worker.run_local(queue=queue, batch_size=2, stop_when_empty=True)
+
+    assert len(deleted) == 3 and len(queue) == 0
@@ -5,18 +5,37 @@ from aws_cdk import (
     aws_secretsmanager as secretsmanager,
     aws_opensearchservice as opensearch,
     aws_iam as iam,
+    aws_dynamodb as dynamodb,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as lambda_event_sources,
+    aws_events as events,
+    aws_events_targets as targets,
     Duration,
+    RemovalPolicy,
     CfnOutput,
     SecretValue,
 )
 from constructs import Construct
+import os
 import json
 import subprocess
 from aws_cdk import Duration
 
 class WhatsAppAIStack(Stack):
-    def __init__(self, scope: Construct, id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, id: str,
+                 async_processing: bool = True,
+                 worker_batch_size: int = 5,
+                 worker_max_concurrency: int = 10,
+                 warm_up_interval_minutes: int = 0,
+                 warm_up_embed: bool = False,
+                 package_asset: str = 'lambda_package.zip',
+                 layer_asset: str = 'lambda_layer.zip',
+                 **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
+
+        # Absolute, since the jsii kernel resolves relative assets against its own working directory
+        package_asset = os.path.abspath(package_asset)
+        layer_asset = os.path.abspath(layer_asset)
         
         # Create Secret for WhatsApp credentials
         whatsapp_secret = secretsmanager.Secret(
@@ -28,28 +47,110 @@ class WhatsAppAIStack(Stack):
             }))
         )
 
-        # dependencies_layer = _lambda.LayerVersion(
-        #     self, 'DependenciesLayer',
-        #     code=_lambda.Code.from_asset('lambda_layer.zip'),
-        #     compatible_runtimes=[_lambda.Runtime.PYTHON_3_11],
-        #     description='Layer containing dependencies for WhatsApp AI Lambda'
-        # )
+        # Conversation history, shared by all concurrent Lambda instances
+        history_table = dynamodb.Table(
+            self, 'ConversationHistory',
+            partition_key=dynamodb.Attribute(name='phone_number', type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute='expires_at',
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # WhatsApp message ids already processed, to drop redelivered webhooks
+        dedup_table = dynamodb.Table(
+            self, 'ProcessedMessages',
+            partition_key=dynamodb.Attribute(name='message_id', type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute='expires_at',
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # Dependencies built by package_lambda.py, shared by the handler and the worker
+        dependencies_layer = _lambda.LayerVersion(
+            self, 'DependenciesLayer',
+            code=_lambda.Code.from_asset(layer_asset),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_11],
+            description='Layer containing dependencies for WhatsApp AI Lambda'
+        )
+
+        environment = {
+            'WHATSAPP_TOKEN': whatsapp_secret.secret_value_from_json('whatsapp_token').unsafe_unwrap(),
+            'PHONE_NUMBER_ID': whatsapp_secret.secret_value_from_json('phone_number_id').unsafe_unwrap(),
+            'VERIFY_TOKEN': whatsapp_secret.secret_value_from_json('verify_token').unsafe_unwrap(),
+            'HISTORY_BACKEND': 'dynamodb',
+            'HISTORY_TABLE': history_table.table_name,
+            'DEDUP_BACKEND': 'dynamodb',
+            'DEDUP_TABLE': dedup_table.table_name,
+        }
+
+        # Incoming messages, one FIFO message group per sender so replies stay in order
+        if async_processing:
+            message_dlq = sqs.Queue(
+                self, 'MessageDeadLetterQueue',
+                fifo=True,
+                retention_period=Duration.days(14)
+            )
+            message_queue = sqs.Queue(
+                self, 'MessageQueue',
+                fifo=True,
+                visibility_timeout=Duration.seconds(360),
+                dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=message_dlq)
+            )
+            environment.update({
+                'ASYNC_PROCESSING': 'true',
+                'MESSAGE_QUEUE_BACKEND': 'sqs',
+                'MESSAGE_QUEUE_URL': message_queue.queue_url,
+            })
 
         # Lambda function
         whatsapp_handler = _lambda.Function(
             self, 'WhatsAppHandler',
             runtime=_lambda.Runtime.PYTHON_3_11,
-            code=_lambda.Code.from_asset('lambda_package.zip'),
+            code=_lambda.Code.from_asset(package_asset),
             handler='whatsapp_handler.handle',
-            # layers=[dependencies_layer],
+            layers=[dependencies_layer],
             timeout=Duration.seconds(60),
-            environment={
-                'WHATSAPP_TOKEN': whatsapp_secret.secret_value_from_json('whatsapp_token').unsafe_unwrap(),
-                'PHONE_NUMBER_ID': whatsapp_secret.secret_value_from_json('phone_number_id').unsafe_unwrap(),
-                'VERIFY_TOKEN': whatsapp_secret.secret_value_from_json('verify_token').unsafe_unwrap(),
-            }
+            environment=environment
         )
 
+        history_table.grant_read_write_data(whatsapp_handler)
+        dedup_table.grant_read_write_data(whatsapp_handler)
+
+        processing_functions = [whatsapp_handler]
+
+        # Worker that drains the queue, generates and sends the replies
+        if async_processing:
+            whatsapp_worker = _lambda.Function(
+                self, 'WhatsAppWorker',
+                runtime=_lambda.Runtime.PYTHON_3_11,
+                code=_lambda.Code.from_asset(package_asset),
+                handler='whatsapp_worker.handle',
+                layers=[dependencies_layer],
+                timeout=Duration.seconds(60),
+                environment={**environment, 'WORKER_CONCURRENCY': str(worker_batch_size)}
+            )
+            whatsapp_worker.add_event_source(lambda_event_sources.SqsEventSource(
+                message_queue,
+                batch_size=worker_batch_size,
+                max_concurrency=worker_max_concurrency,
+                report_batch_item_failures=True
+            ))
+            message_queue.grant_send_messages(whatsapp_handler)
+            history_table.grant_read_write_data(whatsapp_worker)
+            processing_functions.append(whatsapp_worker)
+
+        # Scheduled warm-up ping for the webhook and, in async mode, the worker
+        if warm_up_interval_minutes:
+            warm_up_rule = events.Rule(
+                self, 'WarmUpSchedule',
+                schedule=events.Schedule.rate(Duration.minutes(warm_up_interval_minutes))
+            )
+            for function in processing_functions:
+                warm_up_rule.add_target(targets.LambdaFunction(
+                    function,
+                    event=events.RuleTargetInput.from_object({'warmup': True, 'embed': warm_up_embed})
+                ))
+
         # whatsapp_handler = _lambda.DockerImageFunction(
         #     self, 'WhatsAppHandler',
         #     code=_lambda.DockerImageCode.from_image_asset('docker-lambda'),
@@ -61,14 +162,15 @@ class WhatsAppAIStack(Stack):
         #     }
         # )
 
-        whatsapp_handler.add_to_role_policy(iam.PolicyStatement(
-            actions=[
-                "bedrock:ListFoundationModels",
-                "bedrock:GetFoundationModel",
-                "bedrock-runtime:InvokeModel"
-            ],
-            resources=["*"]
-        ))
+        for function in processing_functions:
+            function.add_to_role_policy(iam.PolicyStatement(
+                actions=[
+                    "bedrock:ListFoundationModels",
+                    "bedrock:GetFoundationModel",
+                    "bedrock-runtime:InvokeModel"
+                ],
+                resources=["*"]
+            ))
 
 
         # API Gateway